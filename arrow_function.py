@@ -0,0 +1,209 @@
+import nuc_function
+
+# The Parquet output is optional, pyarrow is solely required when it is requested
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Names of the integer columns holding the sup_count values of the UMI and SUMI fields, prefixed by umi_ or sumi_
+SUP_COLS = ("reference", "true_variant", "ffpe", "unknown", "deletion", "var_paired_pos", "var_paired_neg",
+            "ref_paired_pos", "ref_paired_neg", "var_single_pos", "var_single_neg", "ref_single_pos",
+            "ref_single_neg")
+# Names of the consensus columns of the UMI-family table, for the mate (cons_ind 0) and singleton (cons_ind 1) consensus
+FAM_COLS = (("mate_pos_nuc", "mate_neg_nuc", "mate_cat"), ("single_pos_nuc", "single_neg_nuc", "single_cat"))
+# Default no. rows of a row group, a row group is written once as many rows have been added
+ROW_GROUP = 65536
+
+
+def var_schema():
+    """ The var_schema function returns the schema of the per-variant table, with a row for every alternative allele
+    of every annotated sample of a variant-record. The contig, sample and mutation-type columns are
+    dictionary-encoded, and the UMI and SUMI support are integer columns.
+
+    Returns:
+        :return: Returns the pyarrow schema of the per-variant table
+    """
+    dict_type = pa.dictionary(pa.int32(), pa.string())
+    col_lst = [("contig", dict_type), ("pos", pa.int64()), ("ref", pa.string()), ("alt", pa.string()),
+               ("mut_type", dict_type), ("sample", dict_type), ("ffpe", pa.bool_())]
+    for sup_nm in ("umi", "sumi"):
+        col_lst += [(sup_nm + "_" + col_nm, pa.int32()) for col_nm in SUP_COLS]
+    return pa.schema(col_lst)
+
+
+def fam_schema():
+    """ The fam_schema function returns the schema of the per-UMI-family table, with a row for every UMI-family of every
+    alternative allele of every annotated sample of a variant-record. The consensus nucleotides and variant types are
+    dictionary-encoded from their codes in the FamTable, with nulls for strands without a consensus nucleotide and
+    UMIs without a variant type.
+
+    Returns:
+        :return: Returns the pyarrow schema of the per-UMI-family table
+    """
+    dict_type = pa.dictionary(pa.int32(), pa.string())
+    code_type = pa.dictionary(pa.int8(), pa.string())
+    col_lst = [("contig", dict_type), ("pos", pa.int64()), ("alt", pa.string()), ("sample", dict_type),
+               ("umi", pa.string())]
+    for cons_cols in FAM_COLS:
+        col_lst += [(col_nm, code_type) for col_nm in cons_cols]
+    return pa.schema(col_lst)
+
+
+def code_array(code_lst, code_dict):
+    """ The code_array function converts a list of FamTable codes into a dictionary-encoded array, without decoding
+    every code into its string. Codes outside of the dictionary, such as NUC_NONE, NUC_EMPTY and CAT_NONE, are nulls.
+
+    Args:
+        :param code_lst: List of integer codes
+        :param code_dict: Tuple of the strings of the codes, such as NUC_LST or CAT_LST
+
+    Returns:
+        :return: Returns a pyarrow DictionaryArray
+    """
+    n_codes = len(code_dict)
+    code_arr = pa.array([code if code < n_codes else None for code in code_lst], pa.int8())
+    return pa.DictionaryArray.from_arrays(code_arr, pa.array(code_dict, pa.string()))
+
+
+class ArrowWriter:
+    """ The ArrowWriter class writes the FUSAC output as columnar Parquet-files while the output VCF-file is written:
+    a per-variant table with the UMI and SUMI support as integer columns, and optionally a per-UMI-family table with
+    the consensus nucleotides and variant type of every UMI-family classified by var_extract. Rows are collected per
+    column and written as a row group once row_group rows have been added, so that the tables are never held in memory
+    as a whole.
+
+    Example row of the per-variant table, for a sample with one FFPE artefact at a C>T variant-record:
+        contig="chr1", pos=649, ref="C", alt="T", mut_type="C>T", sample="Tumour", ffpe=True, umi_reference=0,
+        umi_true_variant=0, umi_ffpe=1, ..., sumi_ref_single_neg=0
+    """
+    __slots__ = ("samp_names", "row_group", "var_wrt", "fam_wrt", "var_cols", "fam_cols")
+
+    def __init__(self, out_prefix, samp_names, fam_out=False, row_group=ROW_GROUP):
+        if pa is None:
+            raise ImportError("The Parquet output requires pyarrow")
+        self.samp_names = samp_names
+        self.row_group = row_group
+        self.var_wrt = pq.ParquetWriter(out_prefix + "_variants.parquet", var_schema())
+        self.var_cols = {col_nm: [] for col_nm in var_schema().names}
+        self.fam_wrt = None
+        self.fam_cols = None
+        if fam_out:
+            self.fam_wrt = pq.ParquetWriter(out_prefix + "_families.parquet", fam_schema())
+            self.fam_cols = {col_nm: [] for col_nm in fam_schema().names}
+
+    def add(self, record, samp_anns):
+        """ The add method adds the rows of an annotated variant-record to the tables, writing a row group of a table
+        once it holds row_group rows.
+
+        Args:
+            :param record: Annotated variant-record
+            :param samp_anns: List of the rec_annotate output of every BAM-file, in the order of samp_names
+        """
+        rec_chr = str(record.chrom)
+        for sample, rec_ann in zip(self.samp_names, samp_anns):
+            if rec_ann is None:
+                continue
+            for alt_ind, alt_allele in enumerate(record.alts):
+                self.var_add(rec_chr, record.pos, record.ref, alt_allele, sample, rec_ann, alt_ind)
+                if self.fam_cols is not None and "Fam" in rec_ann:
+                    self.fam_add(rec_chr, record.pos, alt_allele, sample, rec_ann["Fam"][alt_ind])
+        if len(self.var_cols["pos"]) >= self.row_group:
+            self.var_flush()
+        if self.fam_cols is not None and len(self.fam_cols["pos"]) >= self.row_group:
+            self.fam_flush()
+
+    def var_add(self, rec_chr, rec_pos, ref_allele, alt_allele, sample, rec_ann, alt_ind):
+        """ The var_add method adds the row of an alternative allele of a sample to the per-variant table.
+
+        Args:
+            :param rec_chr: The contig of the variant-record
+            :param rec_pos: The 1-based position of the variant-record
+            :param ref_allele: The reference allele of the variant-record
+            :param alt_allele: The alternative allele of the row
+            :param sample: The sample of the row, or None for the single BAM-file mode
+            :param rec_ann: The rec_annotate output of the sample
+            :param alt_ind: Index of the alternative allele
+        """
+        var_cols = self.var_cols
+        var_cols["contig"].append(rec_chr)
+        var_cols["pos"].append(rec_pos)
+        var_cols["ref"].append(ref_allele)
+        var_cols["alt"].append(alt_allele)
+        var_cols["mut_type"].append(ref_allele + ">" + alt_allele)
+        var_cols["sample"].append(sample)
+        umi_sup = rec_ann["UMI_Sup"][alt_ind]
+        var_cols["ffpe"].append(umi_sup[nuc_function.CAT_FFPE] > 0)
+        for sup_nm, sup_val in (("umi_", umi_sup), ("sumi_", rec_ann["SUMI_Sup"][alt_ind])):
+            for col_nm, sup in zip(SUP_COLS, sup_val):
+                var_cols[sup_nm + col_nm].append(sup)
+
+    def fam_add(self, rec_chr, rec_pos, alt_allele, sample, fam_tbl):
+        """ The fam_add method adds a row for every UMI-family of the FamTable of an alternative allele of a sample to
+        the per-UMI-family table.
+
+        Args:
+            :param rec_chr: The contig of the variant-record
+            :param rec_pos: The 1-based position of the variant-record
+            :param alt_allele: The alternative allele of the rows
+            :param sample: The sample of the rows, or None for the single BAM-file mode
+            :param fam_tbl: The FamTable of the alternative allele
+        """
+        fam_cols = self.fam_cols
+        n_umi = len(fam_tbl)
+        fam_cols["contig"].extend([rec_chr] * n_umi)
+        fam_cols["pos"].extend([rec_pos] * n_umi)
+        fam_cols["alt"].extend([alt_allele] * n_umi)
+        fam_cols["sample"].extend([sample] * n_umi)
+        fam_cols["umi"].extend(fam_tbl.umi_ids)
+        for cons_ind, cons_cols in enumerate(FAM_COLS):
+            fam_cols[cons_cols[0]].extend(fam_tbl.pos_nuc[cons_ind])
+            fam_cols[cons_cols[1]].extend(fam_tbl.neg_nuc[cons_ind])
+            fam_cols[cons_cols[2]].extend(fam_tbl.cat[cons_ind])
+
+    def var_flush(self):
+        """ The var_flush method writes the rows added to the per-variant table as a row group.
+        """
+        if not self.var_cols["pos"]:
+            return
+        var_sch = self.var_wrt.schema
+        col_arrs = []
+        for col_fld in var_sch:
+            col_lst = self.var_cols[col_fld.name]
+            if pa.types.is_dictionary(col_fld.type):
+                col_arrs.append(pa.array(col_lst, pa.string()).dictionary_encode())
+            else:
+                col_arrs.append(pa.array(col_lst, col_fld.type))
+            col_lst.clear()
+        self.var_wrt.write_table(pa.Table.from_arrays(col_arrs, schema=var_sch))
+
+    def fam_flush(self):
+        """ The fam_flush method writes the rows added to the per-UMI-family table as a row group.
+        """
+        if not self.fam_cols["pos"]:
+            return
+        fam_sch = self.fam_wrt.schema
+        col_arrs = []
+        for col_fld in fam_sch:
+            col_lst = self.fam_cols[col_fld.name]
+            if col_fld.name in FAM_COLS[0][:2] or col_fld.name in FAM_COLS[1][:2]:
+                col_arrs.append(code_array(col_lst, nuc_function.NUC_LST))
+            elif col_fld.name in (FAM_COLS[0][2], FAM_COLS[1][2]):
+                col_arrs.append(code_array(col_lst, nuc_function.CAT_LST))
+            elif pa.types.is_dictionary(col_fld.type):
+                col_arrs.append(pa.array(col_lst, pa.string()).dictionary_encode())
+            else:
+                col_arrs.append(pa.array(col_lst, col_fld.type))
+            col_lst.clear()
+        self.fam_wrt.write_table(pa.Table.from_arrays(col_arrs, schema=fam_sch))
+
+    def close(self):
+        """ The close method writes the remaining rows of the tables and closes the Parquet-files.
+        """
+        self.var_flush()
+        self.var_wrt.close()
+        if self.fam_wrt is not None:
+            self.fam_flush()
+            self.fam_wrt.close()
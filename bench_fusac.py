@@ -0,0 +1,543 @@
+# !/usr/bin/env python3
+
+
+# Import modules
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import random
+import argparse
+import tempfile
+import timeit
+import tracemalloc
+import functools
+import pysam
+import build_function as buf
+import pos_function as pf
+import sweep_function as swf
+import clust_function as clf
+import cache_function as caf
+import nuc_function as nf
+import synth_function as sf
+
+# Benchmarks of the suite, timed on every variant locus of the synthetic data of a profile
+SUITE_BENCHES = ("nuc_check", "pos_hits", "var_extract", "fusac_main")
+
+
+def bam_maker(bam_path, depth, fam_size, rec_pos, ref_nuc, var_nuc, read_len=100, seed=1, umi_err=0.0,
+              del_len=0):
+    """ The bam_maker function writes an indexed synthetic BAM-file with a single deep-coverage locus. Every molecule
+    is sequenced on both strands, with fam_size read-pairs per strand, and carries a random UMI-tag in the query-name.
+    A tenth of the molecules carry the variant nucleotide on both strands, and another tenth on the positive strand
+    only. Every read-pair has a umi_err chance of a substitution in its UMI-tag, splitting its molecule into several
+    UMI-families unless they are merged by UMI clustering. With a del_len above 0, the variant molecules instead carry a
+    deletion of the del_len nucleotides following the locus.
+
+    Args:
+        :param bam_path: Path of the BAM-file to write
+        :param depth: No. read-pairs covering the locus
+        :param fam_size: No. read-pairs per strand of a molecule
+        :param rec_pos: 0-based position of the locus
+        :param ref_nuc: The reference nucleotide at the locus
+        :param var_nuc: The variant nucleotide at the locus
+        :param read_len: Length of the reads
+        :param seed: Seed for the random number generator
+        :param umi_err: Chance of a read-pair carrying a substitution in its UMI-tag
+        :param del_len: Length of the deletion carried by the variant molecules, 0 for the variant nucleotide
+
+    Returns:
+        :return: Returns the reference allele of the deletion, the reference nucleotide if del_len is 0
+    """
+    rnd = random.Random(seed)
+    ref_len = rec_pos + 2 * read_len + del_len
+    ref_seq = [rnd.choice("ACGT") for _ in range(ref_len)]
+    ref_seq[rec_pos] = ref_nuc
+    bam_head = {"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": ref_len}]}
+    read_lst = []
+    for mol in range(max(1, depth // (2 * fam_size))):
+        umi_l = "".join(rnd.choice("ACGT") for _ in range(8))
+        umi_r = "".join(rnd.choice("ACGT") for _ in range(8))
+        start = rec_pos - rnd.randint(1, read_len - 1)
+        mol_type = rnd.random()
+        for strand in ("Pos_Str", "Neg_Str"):
+            seq = list(ref_seq[start:start + read_len])
+            cig_str = "{}M".format(read_len)
+            if mol_type < 0.1 or (mol_type < 0.2 and strand == "Pos_Str"):
+                if del_len > 0:
+                    anc_len = rec_pos + 1 - start
+                    seq = ref_seq[start:rec_pos + 1] + ref_seq[rec_pos + 1 + del_len:start + read_len + del_len]
+                    cig_str = "{}M{}D{}M".format(anc_len, del_len, read_len - anc_len)
+                else:
+                    seq[rec_pos - start] = var_nuc
+            seq = "".join(seq)
+            for fam in range(fam_size):
+                umi_tag = list(umi_l + umi_r)
+                if rnd.random() < umi_err:
+                    err_ind = rnd.randrange(len(umi_tag))
+                    umi_tag[err_ind] = rnd.choice("ACGT".replace(umi_tag[err_ind], ""))
+                umi_tag = "".join(umi_tag)
+                if strand == "Pos_Str":
+                    qr_nm = "mol{}:p{}_{}+{}".format(mol, fam, umi_tag[:8], umi_tag[8:])
+                    flags = (99, 147)
+                else:
+                    qr_nm = "mol{}:n{}_{}+{}".format(mol, fam, umi_tag[8:], umi_tag[:8])
+                    flags = (83, 163)
+                for flag in flags:
+                    read = pysam.AlignedSegment()
+                    read.query_name = qr_nm
+                    read.flag = flag
+                    read.reference_id = 0
+                    read.reference_start = start
+                    read.next_reference_id = 0
+                    read.next_reference_start = start
+                    read.mapping_quality = 60
+                    read.cigarstring = cig_str
+                    read.query_sequence = seq
+                    read.query_qualities = pysam.qualitystring_to_array("I" * read_len)
+                    read_lst.append(read)
+    read_lst.sort(key=lambda r: r.reference_start)
+    with pysam.AlignmentFile(bam_path, "wb", header=bam_head) as bam_file:
+        for read in read_lst:
+            bam_file.write(read)
+    pysam.index(bam_path)
+    return "".join(ref_seq[rec_pos:rec_pos + del_len + 1])
+
+
+def bench_var_extract(bam_path, rec_pos, ref_nuc, var_nuc, repeat):
+    """ The bench_var_extract function times var_extract on every read overlapping the locus of a synthetic BAM-file.
+
+    Args:
+        :param bam_path: Path to the synthetic BAM-file
+        :param rec_pos: 0-based position of the locus
+        :param ref_nuc: The reference nucleotide at the locus
+        :param var_nuc: The variant nucleotide at the locus
+        :param repeat: No. times to repeat the timing
+
+    Returns:
+        :return: Returns the best time in seconds for a single var_extract call, and the no. reads at the locus
+    """
+    with pysam.AlignmentFile(bam_path, "r") as bam_file:
+        bam_lst = list(bam_file.fetch("chr1", rec_pos, rec_pos + 1))
+    bench_time = min(timeit.repeat(lambda: buf.var_extract(bam_lst, rec_pos, var_nuc, ref_nuc, "standard", pf.qrn_ext,
+                                                           pf.cha_splt, "_", "+"), number=1, repeat=repeat))
+    return bench_time, len(bam_lst)
+
+
+def bench_clust(bam_path, rec_pos, ref_nuc, var_nuc, method, repeat):
+    """ The bench_clust function times var_extract on every read overlapping the locus of a synthetic BAM-file, with
+    the UMI-families merged by the chosen UMI clustering method.
+
+    Args:
+        :param bam_path: Path to the synthetic BAM-file
+        :param rec_pos: 0-based position of the locus
+        :param ref_nuc: The reference nucleotide at the locus
+        :param var_nuc: The variant nucleotide at the locus
+        :param method: Method used by umi_clust, either "hamming" or "directional", or "none" for no clustering
+        :param repeat: No. times to repeat the timing
+
+    Returns:
+        :return: Returns the best time in seconds for a single var_extract call, and the no. UMI-families at the locus
+    """
+    clu_fun = None
+    if method in clf.CLUST_LST:
+        clu_fun = functools.partial(clf.umi_clust, max_dist=1, method=method)
+    with pysam.AlignmentFile(bam_path, "r") as bam_file:
+        bam_lst = list(bam_file.fetch("chr1", rec_pos, rec_pos + 1))
+    bench_time = min(timeit.repeat(lambda: buf.var_extract(bam_lst, rec_pos, var_nuc, ref_nuc, "standard", pf.qrn_ext,
+                                                           pf.cha_splt, "_", "+", clu_fun=clu_fun),
+                                   number=1, repeat=repeat))
+    n_fams = len(buf.var_extract(bam_lst, rec_pos, var_nuc, ref_nuc, "standard", pf.qrn_ext, pf.cha_splt, "_", "+",
+                                 clu_fun=clu_fun))
+    return bench_time, n_fams
+
+
+def bench_backend(bam_path, rec_pos, ref_nuc, var_nuc, backend, repeat):
+    """ The bench_backend function times sweep_annotate for the locus of a synthetic BAM-file, using the chosen
+    backend for extracting the read nucleotides.
+
+    Args:
+        :param bam_path: Path to the synthetic BAM-file
+        :param rec_pos: 0-based position of the locus
+        :param ref_nuc: The reference nucleotide at the locus
+        :param var_nuc: The variant nucleotide at the locus
+        :param backend: Backend used by sweep_annotate, either "fetch" or "pileup"
+        :param repeat: No. times to repeat the timing
+
+    Returns:
+        :return: Returns the best time in seconds for annotating the locus
+    """
+    rec_tpls = [("chr1", rec_pos + 1, ref_nuc, (var_nuc,))]
+    with pysam.AlignmentFile(bam_path, "r") as bam_file:
+        return min(timeit.repeat(lambda: swf.sweep_annotate(rec_tpls, bam_file, "standard", pf.qrn_ext, pf.cha_splt,
+                                                            "_", "+", backend), number=1, repeat=repeat))
+
+
+def bench_cache(bam_path, rec_pos, ref_nuc, var_nuc, n_recs, cache_size, repeat):
+    """ The bench_cache function times the annotation of n_recs consecutive variant-records around the locus of a
+    synthetic BAM-file, calling sweep_annotate once for every record as a consumer thread does, with or without a
+    ReadCache shared by the calls.
+
+    Args:
+        :param bam_path: Path to the synthetic BAM-file
+        :param rec_pos: 0-based position of the locus
+        :param ref_nuc: The reference nucleotide at the locus
+        :param var_nuc: The variant nucleotide at the locus
+        :param n_recs: No. variant-records, at consecutive positions starting at the locus
+        :param cache_size: Max. no. reads held by the ReadCache, 0 for no cache
+        :param repeat: No. times to repeat the timing
+
+    Returns:
+        :return: Returns the best time in seconds for annotating every record, and the hit rate of the last ReadCache
+    """
+    rec_tpls = [("chr1", rec_pos + rec_ind + 1, ref_nuc, (var_nuc,)) for rec_ind in range(n_recs)]
+    cache_lst = []
+
+    def cache_run():
+        read_cache = caf.ReadCache(cache_size) if cache_size > 0 else None
+        cache_lst.append(read_cache)
+        for rec_tpl in rec_tpls:
+            swf.sweep_annotate([rec_tpl], bam_file, "standard", pf.qrn_ext, pf.cha_splt, "_", "+",
+                               read_cache=read_cache)
+    with pysam.AlignmentFile(bam_path, "r") as bam_file:
+        bench_time = min(timeit.repeat(cache_run, number=1, repeat=repeat))
+    if cache_lst[-1] is None:
+        return bench_time, 0
+    return bench_time, cache_lst[-1].hits / (cache_lst[-1].hits + cache_lst[-1].misses)
+
+
+def bench_indel(bam_path, rec_pos, ref_allele, alt_allele, repeat):
+    """ The bench_indel function times read_annotate for a variant-record at the locus of a synthetic BAM-file, such as
+    the deletion of a BAM-file written by bam_maker with a del_len above 0.
+
+    Args:
+        :param bam_path: Path to the synthetic BAM-file
+        :param rec_pos: 0-based position of the locus
+        :param ref_allele: The reference allele of the variant-record, as returned by bam_maker
+        :param alt_allele: The alternative allele of the variant-record
+        :param repeat: No. times to repeat the timing
+
+    Returns:
+        :return: Returns the best time in seconds for annotating the record, and the UMI field of the annotation
+    """
+    rec_tpl = ("chr1", rec_pos + 1, ref_allele, (alt_allele,))
+    with pysam.AlignmentFile(bam_path, "r") as bam_file:
+        bam_lst = list(bam_file.fetch("chr1", rec_pos, rec_pos + 1))
+    bench_time = min(timeit.repeat(lambda: buf.read_annotate(rec_tpl, bam_lst, None, "standard", pf.qrn_ext,
+                                                             pf.cha_splt, "_", "+"), number=1, repeat=repeat))
+    return bench_time, buf.read_annotate(rec_tpl, bam_lst, None, "standard", pf.qrn_ext, pf.cha_splt, "_", "+")["UMI"]
+
+
+def bench_memory(bam_path, rec_pos, ref_nuc, var_nuc):
+    """ The bench_memory function measures the peak memory allocated while annotating the locus of a synthetic
+    BAM-file from its reads, excluding the memory held by the reads themselves.
+
+    Args:
+        :param bam_path: Path to the synthetic BAM-file
+        :param rec_pos: 0-based position of the locus
+        :param ref_nuc: The reference nucleotide at the locus
+        :param var_nuc: The variant nucleotide at the locus
+
+    Returns:
+        :return: Returns the peak no. bytes allocated by read_annotate
+    """
+    with pysam.AlignmentFile(bam_path, "r") as bam_file:
+        bam_lst = list(bam_file.fetch("chr1", rec_pos, rec_pos + 1))
+    tracemalloc.start()
+    try:
+        buf.read_annotate(("chr1", rec_pos + 1, ref_nuc, (var_nuc,)), bam_lst, None, "standard", pf.qrn_ext,
+                          pf.cha_splt, "_", "+")
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def site_reads(bam_path, vcf_path):
+    """ The site_reads function fetches the reads overlapping every variant-record of a synthetic VCF-file.
+
+    Args:
+        :param bam_path: Path to the synthetic BAM-file
+        :param vcf_path: Path to the synthetic VCF-file
+
+    Returns:
+        :return: Returns a list with a tuple of the 0-based position, the reference and variant nucleotide and the list
+        of reads of every variant-record
+    """
+    site_lst = []
+    with pysam.AlignmentFile(bam_path, "r") as bam_file, pysam.VariantFile(vcf_path, "r") as vcf_file:
+        for record in vcf_file:
+            bam_lst = list(bam_file.fetch(record.chrom, record.start, record.start + 1))
+            site_lst.append((record.start, record.ref, record.alts[0], bam_lst))
+    return site_lst
+
+
+def bench_nuc_check(site_lst, repeat):
+    """ The bench_nuc_check function times nuc_check on every read of every variant locus.
+
+    Args:
+        :param site_lst: List of the variant loci and their reads, as generated by site_reads
+        :param repeat: No. times to repeat the timing
+
+    Returns:
+        :return: Returns the best time in seconds for checking every read, and the no. nuc_check calls
+    """
+    def nuc_run():
+        for rec_pos, _, _, bam_lst in site_lst:
+            for read in bam_lst:
+                nf.nuc_check(read, rec_pos)
+    bench_time = min(timeit.repeat(nuc_run, number=1, repeat=repeat))
+    return bench_time, sum(len(site[3]) for site in site_lst)
+
+
+def bench_pos_hits(site_lst, repeat):
+    """ The bench_pos_hits function times pos_hits on every strand of every UMI-family of every variant locus. The
+    reads are grouped into UMI-families beforehand, as by var_extract, so that solely the consensus is timed.
+
+    Args:
+        :param site_lst: List of the variant loci and their reads, as generated by site_reads
+        :param repeat: No. times to repeat the timing
+
+    Returns:
+        :return: Returns the best time in seconds for every consensus, and the no. pos_hits calls
+    """
+    str_lst = []
+    for rec_pos, _, _, bam_lst in site_lst:
+        umi_dict = {}
+        for read in bam_lst:
+            qr_nm, strand, umi_id = pf.umi_parse(read, pf.qrn_ext, pf.cha_splt, "_", "+")
+            umi_fam = umi_dict.setdefault(umi_id, {"Pos_Str": {}, "Neg_Str": {}})
+            umi_fam[strand].setdefault(qr_nm, []).append(read)
+        str_lst += [(rec_pos, str_dict) for umi_fam in umi_dict.values() for str_dict in umi_fam.values() if str_dict]
+
+    def hits_run():
+        for rec_pos, str_dict in str_lst:
+            pf.pos_hits(str_dict, rec_pos)
+    bench_time = min(timeit.repeat(hits_run, number=1, repeat=repeat))
+    return bench_time, len(str_lst)
+
+
+def bench_sites(site_lst, repeat):
+    """ The bench_sites function times var_extract on the reads of every variant locus.
+
+    Args:
+        :param site_lst: List of the variant loci and their reads, as generated by site_reads
+        :param repeat: No. times to repeat the timing
+
+    Returns:
+        :return: Returns the best time in seconds for every locus, and the no. var_extract calls
+    """
+    def site_run():
+        for rec_pos, ref_nuc, var_nuc, bam_lst in site_lst:
+            buf.var_extract(bam_lst, rec_pos, var_nuc, ref_nuc, "standard", pf.qrn_ext, pf.cha_splt, "_", "+")
+    bench_time = min(timeit.repeat(site_run, number=1, repeat=repeat))
+    return bench_time, len(site_lst)
+
+
+def bench_main(bam_path, vcf_path, out_dir, repeat, fus_args=()):
+    """ The bench_main function times a whole FUSAC run on a synthetic BAM- and VCF-file, as a separate process so that
+    the run includes the start-up and the output of the program.
+
+    Args:
+        :param bam_path: Path to the synthetic BAM-file
+        :param vcf_path: Path to the synthetic VCF-file
+        :param out_dir: Directory of the output of the run
+        :param repeat: No. times to repeat the timing
+        :param fus_args: Further arguments of the run, such as ["-t", "4", "-m", "process"]
+
+    Returns:
+        :return: Returns the best time in seconds for the run
+    """
+    fus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fusac.py")
+    fus_cmd = [sys.executable, fus_path, "-b", os.path.abspath(bam_path), "-v", os.path.abspath(vcf_path),
+               "-o", "fusac_output.vcf"] + list(fus_args)
+    run_times = []
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        subprocess.run(fus_cmd, cwd=out_dir, stdout=subprocess.DEVNULL, check=True)
+        run_times.append(time.perf_counter() - t_start)
+    return min(run_times)
+
+
+def bench_meta():
+    """ The bench_meta function describes the code and environment of a benchmark run, so that saved results are only
+    compared knowingly between different commits or machines.
+
+    Returns:
+        :return: Returns a dict with the git commit of FUSAC, the date, and the Python, pysam and platform versions
+    """
+    try:
+        git_commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        git_commit = None
+    return {"commit": git_commit, "date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+            "pysam": pysam.__version__, "platform": platform.platform()}
+
+
+def bench_suite(prof_lst, out_dir, scale=1.0, repeat=3, seed=1, fus_args=()):
+    """ The bench_suite function generates the synthetic data of every profile with syn_maker, and times nuc_check,
+    pos_hits and var_extract on every variant locus as well as a whole FUSAC run on the data.
+
+    Args:
+        :param prof_lst: Names of the profiles, see synth_function.SYN_PROFILES
+        :param out_dir: Directory of the synthetic data and the FUSAC output
+        :param scale: Factor scaling the no. variant loci and the depth of every profile
+        :param repeat: No. times to repeat each timing
+        :param seed: Seed of the synthetic data
+        :param fus_args: Further arguments of the FUSAC runs
+
+    Returns:
+        :return: Returns a dict with the bench_meta output and the time and no. calls of every benchmark of every
+        profile
+        Example dict:
+        {"meta": {"commit": "e0e0699", ...}, "scale": 1.0, "profiles": {"panel": {"n_reads": 240792, "n_recs": 120,
+         "benches": {"nuc_check": {"time": 0.21, "calls": 240792}, ...}}}}
+    """
+    bench_res = {"meta": bench_meta(), "scale": scale, "seed": seed, "fusac_args": list(fus_args), "profiles": {}}
+    for prof_nm in prof_lst:
+        syn_res = sf.syn_maker(os.path.join(out_dir, prof_nm), prof_nm, seed, scale)
+        site_lst = site_reads(syn_res["bam"], syn_res["vcf"])
+        prof_res = {"n_reads": syn_res["n_reads"], "n_recs": syn_res["n_recs"], "molecules": syn_res["molecules"],
+                    "benches": {}}
+        for bench_nm, bench_fun in (("nuc_check", bench_nuc_check), ("pos_hits", bench_pos_hits),
+                                    ("var_extract", bench_sites)):
+            bench_time, n_calls = bench_fun(site_lst, repeat)
+            prof_res["benches"][bench_nm] = {"time": round(bench_time, 6), "calls": n_calls}
+        del site_lst
+        bench_time = bench_main(syn_res["bam"], syn_res["vcf"], out_dir, repeat, fus_args)
+        prof_res["benches"]["fusac_main"] = {"time": round(bench_time, 6), "calls": 1}
+        bench_res["profiles"][prof_nm] = prof_res
+    return bench_res
+
+
+def bench_compare(new_res, old_res, max_slow=0.1):
+    """ The bench_compare function compares the benchmarks of two suite runs, reporting the ratio of the new to the
+    old time of every benchmark that both runs timed on the same synthetic data.
+
+    Args:
+        :param new_res: The bench_suite output of the new run
+        :param old_res: The bench_suite output of the old run
+        :param max_slow: Fraction by which a benchmark may be slower before it is reported as a regression
+
+    Returns:
+        :return: Returns a list with a tuple of the profile, benchmark, old and new time, ratio, and whether it is a
+        regression, for every compared benchmark
+        Example list:
+        [("panel", "nuc_check", 0.21, 0.19, 0.905, False)]
+    """
+    cmp_lst = []
+    if (new_res["scale"], new_res["seed"]) != (old_res["scale"], old_res["seed"]):
+        return cmp_lst
+    for prof_nm, prof_res in new_res["profiles"].items():
+        old_prof = old_res["profiles"].get(prof_nm)
+        if old_prof is None:
+            continue
+        for bench_nm, bench_val in prof_res["benches"].items():
+            old_val = old_prof["benches"].get(bench_nm)
+            if old_val is None or old_val["calls"] != bench_val["calls"] or old_val["time"] <= 0:
+                continue
+            bench_ratio = bench_val["time"] / old_val["time"]
+            cmp_lst.append((prof_nm, bench_nm, old_val["time"], bench_val["time"], round(bench_ratio, 3),
+                            bench_ratio > 1 + max_slow))
+    return cmp_lst
+
+
+def suite_main(args):
+    """ The suite_main function runs the benchmark suite of the suite argument, writes its results to a JSON-file and
+    optionally compares them to the results of an earlier run.
+
+    Args:
+        :param args: Dict of the parsed arguments of main
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench_res = bench_suite(args["suite"], tmp_dir, float(args["scale"]), int(args["repeat"]))
+    for prof_nm, prof_res in bench_res["profiles"].items():
+        print(prof_nm + ": " + str(prof_res["n_reads"]) + " reads, " + str(prof_res["n_recs"]) + " variant-records")
+        for bench_nm, bench_val in prof_res["benches"].items():
+            print("    " + bench_nm + ": " + str(round(bench_val["time"] * 1000, 2)) + " ms (" +
+                  str(bench_val["calls"]) + " calls)")
+    with open(args["output"], "w") as out_file:
+        json.dump(bench_res, out_file, indent=2)
+    print("Wrote the results: " + args["output"])
+    if args["compare"] != "none":
+        with open(args["compare"]) as cmp_file:
+            old_res = json.load(cmp_file)
+        cmp_lst = bench_compare(bench_res, old_res, float(args["maxSlowdown"]))
+        if not cmp_lst:
+            print("WARNING: No benchmarks of " + args["compare"] + " were run on the same synthetic data")
+        print("Compared to " + args["compare"] + " (commit " + str(old_res["meta"]["commit"]) + "):")
+        for prof_nm, bench_nm, old_time, new_time, bench_ratio, is_slow in cmp_lst:
+            print("    " + prof_nm + " " + bench_nm + ": " + str(round(old_time * 1000, 2)) + " -> " +
+                  str(round(new_time * 1000, 2)) + " ms (x" + str(bench_ratio) + ")" +
+                  (" REGRESSION" if is_slow else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FUSAC benchmarks on synthetic deep-coverage data')
+    parser.add_argument('-d', '--depth', help='No. read-pairs covering the locus', required=False, default=5000)
+    parser.add_argument('-fs', '--familySize', help='No. read-pairs per strand of a molecule', required=False,
+                        default=3)
+    parser.add_argument('-ue', '--umiError', help='Chance of a read-pair carrying a substitution in its UMI-tag',
+                        required=False, default=0.0)
+    parser.add_argument('-nr', '--nRecords', help='No. consecutive variant-records annotated by the cache benchmark',
+                        required=False, default=20)
+    parser.add_argument('-dl', '--delLength', help='Length of the deletion annotated by the indel benchmark',
+                        required=False, default=30)
+    parser.add_argument('-r', '--repeat', help='No. times to repeat each timing', required=False, default=5)
+    parser.add_argument('-s', '--suite', nargs='+', help='Runs the benchmark suite on the synthetic data of the given '
+                                                         'profiles instead of the single-locus benchmarks. '
+                                                         'Alternative: panel, exome, amplicon',
+                        required=False, default=None)
+    parser.add_argument('-sc', '--scale', help='Factor scaling the no. variant-records and the depth of the suite '
+                                               'profiles', required=False, default=1.0)
+    parser.add_argument('-o', '--output', help='JSON-file of the suite results', required=False,
+                        default="fusac_bench.json")
+    parser.add_argument('-cmp', '--compare', help='JSON-file of an earlier suite run to compare the results to',
+                        required=False, default="none")
+    parser.add_argument('-ms', '--maxSlowdown', help='Fraction by which a suite benchmark may be slower than in the '
+                                                     'compared run before it is reported as a regression',
+                        required=False, default=0.1)
+    args = vars(parser.parse_args())
+    if args["suite"] is not None:
+        for prof_nm in args["suite"]:
+            if prof_nm not in sf.SYN_PROFILES:
+                parser.error("the suite profile must be one of " + ", ".join(sf.SYN_PROFILES))
+        suite_main(args)
+        return
+
+    rec_pos = 150
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bam_path = os.path.join(tmp_dir, "bench.bam")
+        bam_maker(bam_path, int(args["depth"]), int(args["familySize"]), rec_pos, "C", "T",
+                  umi_err=float(args["umiError"]))
+        bench_time, n_reads = bench_var_extract(bam_path, rec_pos, "C", "T", int(args["repeat"]))
+        print("var_extract: " + str(n_reads) + " reads, " + str(round(bench_time * 1000, 2)) + " ms")
+        for method in ("none",) + clf.CLUST_LST:
+            bench_time, n_fams = bench_clust(bam_path, rec_pos, "C", "T", method, int(args["repeat"]))
+            print("var_extract (" + method + " clustering): " + str(n_fams) + " UMI-families, " +
+                  str(round(bench_time * 1000, 2)) + " ms")
+        for backend in ("fetch", "pileup"):
+            bench_time = bench_backend(bam_path, rec_pos, "C", "T", backend, int(args["repeat"]))
+            print("sweep_annotate (" + backend + "): " + str(round(bench_time * 1000, 2)) + " ms")
+        for cache_size in (0, 50000):
+            bench_time, hit_rate = bench_cache(bam_path, rec_pos, "C", "T", int(args["nRecords"]), cache_size,
+                                               int(args["repeat"]))
+            print("sweep_annotate per record (cache size " + str(cache_size) + "): " +
+                  str(round(bench_time * 1000, 2)) + " ms, " + str(round(100 * hit_rate, 1)) + "% hit rate")
+        bench_peak = bench_memory(bam_path, rec_pos, "C", "T")
+        print("read_annotate peak memory: " + str(round(bench_peak / 1e6, 1)) + " MB")
+        bench_time = bench_indel(bam_path, rec_pos, "C", "T", int(args["repeat"]))[0]
+        print("read_annotate (SNV): " + str(round(bench_time * 1000, 2)) + " ms")
+        del_path = os.path.join(tmp_dir, "bench_del.bam")
+        ref_allele = bam_maker(del_path, int(args["depth"]), int(args["familySize"]), rec_pos, "C", "T",
+                               del_len=int(args["delLength"]))
+        bench_time, umi_str = bench_indel(del_path, rec_pos, ref_allele, ref_allele[0], int(args["repeat"]))
+        print("read_annotate (" + str(int(args["delLength"])) + " bp deletion): " + str(round(bench_time * 1000, 2)) +
+              " ms, UMI " + umi_str)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,30 @@
 import pos_function
 import nuc_function
 import count_function
-import pandas as pd
-import os
-import shutil
-
-
-def vcf_extract(record, bam_file, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha):
+import fam_function
+import stat_function
+
+# Suffixes and descriptions of the typed integer FORMAT fields, one field for every value of sup_count, prefixed by
+# UMI_ for the mate and SUMI_ for the singleton consensus
+FMT_FIELDS = (("REF", "reference"), ("ALT", "true variant"), ("FFPE", "FFPE-artefact"), ("N", "unknown (N)"),
+              ("DEL", "deletion"), ("ALT_PP", "variant call on the positive strand of paired"),
+              ("ALT_PN", "variant call on the negative strand of paired"),
+              ("REF_PP", "reference call on the positive strand of paired"),
+              ("REF_PN", "reference call on the negative strand of paired"),
+              ("ALT_SP", "variant call on the positive strand of single-strand"),
+              ("ALT_SN", "variant call on the negative strand of single-strand"),
+              ("REF_SP", "reference call on the positive strand of single-strand"),
+              ("REF_SN", "reference call on the negative strand of single-strand"))
+UMI_FMTS = tuple("UMI_" + fmt_suf for fmt_suf, _ in FMT_FIELDS)
+SUMI_FMTS = tuple("SUMI_" + fmt_suf for fmt_suf, _ in FMT_FIELDS)
+# Output modes of the FORMAT fields: the semicolon-packed UMI and SUMI strings, the typed integer fields, or both
+FMT_MODES = ("packed", "typed", "both")
+
+
+def vcf_extract(record, bam_file, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, clu_fun=None):
     """ Uses the supplemented variant-record to extract all reads in the BAM-file overlapping with its position. This
     newly generated list is used for the pos_checker function to return molecular data. The output from pos_checker is
-    then subsequently used in the inf-builder function. Finally, the output from inf_builder is added to the
+    then subsequently counted by the sup_count function. Finally, the output from sup_count is added to the
     input_record.
 
     Args:
@@ -20,67 +35,338 @@ def vcf_extract(record, bam_file, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha
         :param spl_fun: Function used for splitting the UMI-tag in a read
         :param q_spl_cha: Character used for splittign the UMI-tag from the query-name
         :param u_spl_cha: The character used for splitting the UMI-tag
+        :param clu_fun: Optional function merging the UMI-families of the position, see clust_function.umi_clust
 
     Returns:
-        :return: Returns a copy of the variant-record modified by the inf_builder output. More specifically, adds a
+        :return: Returns a copy of the variant-record modified by the sup_count output. More specifically, adds a
         a list containing the support for each variant-type, as well as the support for the reference
         and variant call for str1 and str2 to the "samples" field. Furthermore, if any record has support for containing
         an FFPE-artefact, the "filter" tag will be modified to say "FFPE"
     """
-    bam_lst = []
-    n_ref = record.ref
-    n_ref = ''.join(n_ref)
-    list(n_ref)
-    n_alt = record.alts
-    n_alt = ''.join(n_alt)
-    list(n_alt)
-    # Checks so that the length of the list is not greater then 1 (temporary solution for handling SNVs only)
-    if len(n_ref) > 1 or len(n_alt) > 1:
+    rec_ann = rec_annotate(rec_tuple(record), bam_file, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, clu_fun)
+    if rec_ann is None:
         return
-    # Copies the record information
-    n_cop = record.copy()
-    n_pos = record.pos
-    rec_chr = str(record.chrom)
+    return rec_apply(record, rec_ann)
+
+
+def rec_tuple(record):
+    """ The rec_tuple function reduces a variant-record to the fields needed to annotate it. Unlike the pysam
+    VariantRecord the returned tuple can be pickled, and may thus be sent to a worker process.
+
+    Args:
+        :param record: Variant-record of interest
+
+    Returns:
+        :return: Returns a tuple containing the chromosome, the 1-based position, the reference and the alternative
+        alleles of the variant-record
+        Example tuple:
+        ("chr1", 4367323, "G", ("A",))
+    """
+    return str(record.chrom), record.pos, record.ref, record.alts
+
+
+def rec_annotate(rec_tpl, bam_file, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, clu_fun=None, fam_out=False,
+                 read_flt=None):
+    """ The rec_annotate function extracts all reads in the BAM-file overlapping with the position of a variant-record
+    tuple, and generates the molecular data to be added to the variant-record. Returns the data as a picklable dict,
+    from which rec_apply rebuilds the annotated variant-record.
+
+    Args:
+        :param rec_tpl: Variant-record tuple generated by rec_tuple
+        :param bam_file: BAM-file filehandle
+        :param ffpe_n: Parameter to determine if all mismatches should be classified as ffpe, or solely C:G>T:A
+        :param ext_fun: Function for extracting the UMI-tag from a read
+        :param spl_fun: Function used for splitting the UMI-tag in a read
+        :param q_spl_cha: Character used for splittign the UMI-tag from the query-name
+        :param u_spl_cha: The character used for splitting the UMI-tag
+        :param clu_fun: Optional function merging the UMI-families of the position, see clust_function.umi_clust
+        :param fam_out: Whether to add the FamTable of every alternative allele to the output, see read_annotate
+        :param read_flt: Optional ReadFilter dropping reads before they are grouped into UMI-families
+
+    Returns:
+        :return: Returns a dict containing the UMI and SUMI strings as well as whether or not the record has support
+        for an FFPE-artefact. Returns None if the record cannot be classified, see rec_allele
+        Example dict:
+        rec_ann = {"UMI": "0;0;1;0;0;1;0;1;0;0;0;0;0", "SUMI": "0;0;0;0;0;0;0;0;0;0;0;0;0", "FFPE": True}
+    """
+    if not rec_allele(rec_tpl):
+        return
+    rec_chr = rec_tpl[0]
+    n_pos = rec_tpl[1]
     # The position that is returned to Python is 0 - based, NOT 1 - based as in the VCF file.
     n_pos = (n_pos - 1)
 
-    # Use the record position to fetch all reads matching it, then append to the list
-    for read in bam_file.fetch(rec_chr, n_pos, n_pos+1):
-        bam_lst.append(read)
-
-    # Calls the pos_checker function to obtain ffpe_data
-    mate_data, singleton_data = var_extract(bam_lst, n_pos, n_alt, n_ref, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha)
-
-    mate_inf = inf_builder(mate_data, n_alt, n_ref)
-    singleton_inf = inf_builder(singleton_data, n_alt, n_ref)
-
-    for sample in n_cop.samples:
-        n_cop.samples[sample]['UMI'] = "{Reference};{True_Variant};{FFPE_Artefact};{Unknown};{Deletion};" \
-                                       "{Ref_Paired};{Var_Paired};{Ref_Single};{Var_Single}"\
-            .format(Reference=mate_inf[0][0], True_Variant=mate_inf[0][1], FFPE_Artefact=mate_inf[0][2],
-                    Unknown=mate_inf[0][3], Deletion=mate_inf[0][4], Ref_Paired=mate_inf[1], Var_Paired=mate_inf[2],
-                    Ref_Single=mate_inf[3], Var_Single=mate_inf[4])
-
-        n_cop.samples[sample]['SUMI'] = "{Reference};{True_Variant};{FFPE_Artefact};{Unknown};{Deletion};" \
-                                        "{Ref_Paired};{Var_Paired};{Ref_Single};{Var_Single}" \
-            .format(Reference=singleton_inf[0][0], True_Variant=singleton_inf[0][1],
-                    FFPE_Artefact=singleton_inf[0][2], Unknown=singleton_inf[0][3], Deletion=singleton_inf[0][4],
-                    Ref_Paired=singleton_inf[1], Var_Paired=singleton_inf[2], Ref_Single=singleton_inf[3],
-                    Var_Single=singleton_inf[4])
-
-        # Checks if any record in the returned dict indicates an FFPE, if so updates the n_fil parameter
-    for umi_key in mate_data:
-        if mate_data[umi_key]["Mate_Hits"]:
-            if mate_data[umi_key]["Mate_Hits"]["FFPE_Hits"]:
-                n_cop.filter.add("FFPE")
-                break
+    # Use the record position to fetch all reads matching it
+    bam_lst = list(bam_file.fetch(rec_chr, n_pos, n_pos+1))
+    return read_annotate(rec_tpl, bam_lst, None, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, None, clu_fun,
+                         fam_out, read_flt)
+
+
+def rec_snv(rec_tpl):
+    """ The rec_snv function checks whether a variant-record tuple represents a SNV, which is classified from the
+    nucleotide of every read at its position. Multi-allelic records are SNVs if every allele is a single nucleotide.
+
+    Args:
+        :param rec_tpl: Variant-record tuple generated by rec_tuple
+
+    Returns:
+        :return: Returns True if both the reference and every alternative allele are a single nucleotide
+    """
+    # Checks so that no allele is longer than 1, longer alleles are handled by allele_call
+    return len(rec_tpl[2]) <= 1 and all(len(alt_allele) <= 1 for alt_allele in rec_tpl[3])
+
+
+def rec_allele(rec_tpl):
+    """ The rec_allele function checks whether a variant-record tuple can be classified by FUSAC. SNVs are classified
+    from the nucleotide of every read, whereas indels and MNVs consisting of nucleotides are classified from the
+    allele_call call of every read. Multi-allelic records are classified for every alternative allele, multi-base
+    records with more than MAX_ALTS alternative alleles or with symbolic alleles are not classified.
+
+    Args:
+        :param rec_tpl: Variant-record tuple generated by rec_tuple
+
+    Returns:
+        :return: Returns True if the record is a SNV, or a multi-base variant with at most MAX_ALTS alternative alleles
+    """
+    ref_allele = rec_tpl[2]
+    alt_alleles = rec_tpl[3]
+    if not alt_alleles:
+        return False
+    if rec_snv(rec_tpl):
+        return True
+    if not ref_allele or len(alt_alleles) > nuc_function.MAX_ALTS:
+        return False
+    for alt_allele in alt_alleles:
+        if not alt_allele or alt_allele == ref_allele or not nuc_function.ALLELE_NUC.issuperset(alt_allele):
+            return False
+    return nuc_function.ALLELE_NUC.issuperset(ref_allele)
+
+
+def read_annotate(rec_tpl, bam_lst, umi_lst, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, nuc_lst=None,
+                  clu_fun=None, fam_out=False, read_flt=None):
+    """ The read_annotate function generates the molecular data to be added to a variant-record, from the list of
+    reads overlapping its position. Returns the data as a picklable dict, see rec_annotate. The reads of a
+    multi-allelic record are grouped into UMI-families and collapsed into consensus nucleotides once, after which the
+    UMI-families are classified for every alternative allele by FamTable.reclass. With a ReadFilter the filtered reads
+    are dropped first, before any UMI-tag or allele of the reads is parsed.
+
+    Args:
+        :param rec_tpl: Variant-record tuple generated by rec_tuple
+        :param bam_lst: List of reads overlapping the variant-record position
+        :param umi_lst: List of pre-parsed umi_parse output for the reads in bam_lst, or None to parse the reads
+        :param ffpe_n: Parameter to determine if all mismatches should be classified as ffpe, or solely C:G>T:A
+        :param ext_fun: Function for extracting the UMI-tag from a read
+        :param spl_fun: Function used for splitting the UMI-tag in a read
+        :param q_spl_cha: Character used for splittign the UMI-tag from the query-name
+        :param u_spl_cha: The character used for splitting the UMI-tag
+        :param nuc_lst: List of the nucleotides of the reads in bam_lst at the position, or None to use nuc_check
+        :param clu_fun: Optional function merging the UMI-families of the position, see clust_function.umi_clust
+        :param fam_out: Whether to add the FamTable of every alternative allele to the output, see arrow_function
+        :param read_flt: Optional ReadFilter dropping reads before they are grouped into UMI-families
+
+    Returns:
+        :return: Returns a dict containing the UMI and SUMI strings as well as whether or not the record has support
+        for an FFPE-artefact, and the sup_count tuples of the strings for every alternative allele (UMI_Sup and
+        SUMI_Sup), as well as the no. reads dropped by every filter of read_flt (Drop). Multi-allelic records are
+        given a tuple with the UMI and SUMI string of every alternative allele, and are flagged as FFPE if any
+        alternative allele has support for an FFPE-artefact
+        Example dict for the multi-allelic variant-record C>T,A, with the SUMI fields left out:
+        rec_ann = {"UMI": ("0;0;1;0;0;1;0;1;0;0;0;0;0", "0;0;0;0;0;1;0;0;0;0;0;0;0"), "FFPE": True,
+        "UMI_Sup": ((0, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0), (0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0))}
+    """
+    n_pos = rec_tpl[1] - 1
+    n_ref = rec_tpl[2]
+    alt_lst = list(rec_tpl[3])
+    drop_cnt = None
+    if read_flt is not None:
+        bam_lst, umi_lst, nuc_lst, drop_cnt = read_flt.apply(n_pos, bam_lst, umi_lst, nuc_lst)
+
+    # Multi-base records are classified from the allele of every read, with the allele symbols taking the place of the
+    # reference and variant nucleotides
+    if not rec_snv(rec_tpl):
+        nuc_lst = [nuc_function.allele_call(read, n_pos, n_ref, rec_tpl[3]) for read in bam_lst]
+        n_ref = nuc_function.REF_SYM
+        alt_lst = list(nuc_function.ALT_SYMS[:len(alt_lst)])
+
+    # Calls the var_extract function to obtain the table of classified UMI-families for the first alternative allele
+    fam_tbl = var_extract(bam_lst, n_pos, alt_lst[0], n_ref, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, umi_lst,
+                          nuc_lst, clu_fun)
+
+    umi_sups = []
+    sumi_sups = []
+    fam_tbls = []
+    rec_ann = {"FFPE": False}
+    if drop_cnt is not None:
+        rec_ann["Drop"] = drop_cnt
+    for alt_ind, n_alt in enumerate(alt_lst):
+        # The UMI-families of the remaining alternative alleles are reclassified from the consensus nucleotides
+        if alt_ind > 0:
+            fam_tbl = fam_tbl.reclass(n_alt, n_ref, ffpe_n)
+        fam_tbls.append(fam_tbl)
+        # Counts the support of the mate and the singleton consensus in a single pass over the table
+        fam_cnt = count_function.fam_count(fam_tbl)
+        umi_sups.append(sup_count(fam_cnt, n_alt, n_ref, 0))
+        sumi_sups.append(sup_count(fam_cnt, n_alt, n_ref, 1))
+        # Checks if any UMI in the mate consensus indicates an FFPE, if so updates the FFPE flag
+        if umi_sups[-1][nuc_function.CAT_FFPE] > 0:
+            rec_ann["FFPE"] = True
+
+    # Records with a single alternative allele keep their UMI and SUMI strings as they were before multi-allelic
+    # records were classified
+    umi_strs = tuple(";".join(map(str, umi_sup)) for umi_sup in umi_sups)
+    sumi_strs = tuple(";".join(map(str, sumi_sup)) for sumi_sup in sumi_sups)
+    if len(alt_lst) == 1:
+        rec_ann["UMI"] = umi_strs[0]
+        rec_ann["SUMI"] = sumi_strs[0]
+    else:
+        rec_ann["UMI"] = umi_strs
+        rec_ann["SUMI"] = sumi_strs
+    rec_ann["UMI_Sup"] = tuple(umi_sups)
+    rec_ann["SUMI_Sup"] = tuple(sumi_sups)
+    if fam_out:
+        rec_ann["Fam"] = tuple(fam_tbls)
+    return rec_ann
+
+
+def sup_count(fam_cnt, var_nuc, ref_nuc, cons_ind):
+    """ The sup_count function returns the values of the UMI or SUMI field of a variant-record as a flat tuple of
+    integers: the support for each variant-type, followed by the support for the variant and then the reference call on
+    the positive and negative strand, for the paired UMIs and then the single UMIs. The support is looked up directly in
+    the fam_count output, without generating any dicts or strings. The UMI and SUMI strings are joined from the tuple.
+
+    Args:
+        :param fam_cnt: Tuple of the category and nucleotide support generated by fam_count
+        :param var_nuc: Variant nucleotide (or allele symbol) for the variant-record variant-call
+        :param ref_nuc: Nucleotide (or allele symbol) in the reference genome for the variant-record variant position
+        :param cons_ind: 0 for the mate consensus, 1 for the singleton consensus
+
+    Returns:
+        :return: Returns a tuple of 13 integers, in the order of the UMI and SUMI fields
+        Example tuple for one FFPE artefact:
+        (0, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0)
+    """
+    nuc_sup = fam_cnt[1][cons_ind]
+    sup_lst = count_function.mol_count(fam_cnt, cons_ind)
+    var_code = nuc_function.NUC_CODES.get(var_nuc)
+    ref_code = nuc_function.NUC_CODES.get(ref_nuc)
+    # Indexed by [strand][group][nuc_code], with group 0 for the paired and 1 for the single UMIs
+    for grp_ind in (0, 1):
+        for n_code in (var_code, ref_code):
+            for str_ind in (0, 1):
+                sup_lst.append(0 if n_code is None else int(nuc_sup[str_ind][grp_ind][n_code]))
+    return tuple(sup_lst)
+
+
+def fmt_header(vcf_head, fmt_mode="packed", flt_out=False):
+    """ The fmt_header function adds the FORMAT fields of the FUSAC output to the header of the output VCF-file: the
+    semicolon-packed UMI and SUMI strings, and/or a typed integer field for every value of the strings (see
+    FMT_FIELDS), depending on fmt_mode. Every field holds a value for every alternative allele (Number=A). When reads
+    are filtered, the RDROP field holds the no. reads dropped by every filter of the ReadFilter.
+
+    Args:
+        :param vcf_head: Header of the output VCF-file
+        :param fmt_mode: Output mode of the FORMAT fields, one of FMT_MODES
+        :param flt_out: Whether to add the RDROP field, for runs with a ReadFilter
+    """
+    if fmt_mode != "typed":
+        vcf_head.formats.add("UMI", "A", "String", "Paired mate information for variant then reference "
+                                                   "Paired ref;Paired var;Single ref: Single var")
+        vcf_head.formats.add("SUMI", "A", "String", "Singleton information for variant then reference "
+                                                    "Paired ref;Paired var;Single ref: Single var")
+    if fmt_mode != "packed":
+        for fmt_nms, cons_nm in ((UMI_FMTS, "mate"), (SUMI_FMTS, "singleton")):
+            for fmt_nm, (_, fmt_desc) in zip(fmt_nms, FMT_FIELDS):
+                vcf_head.formats.add(fmt_nm, "A", "Integer", "No. UMIs supporting the " + fmt_desc + " call, "
+                                     "from the " + cons_nm + " consensus")
+    if flt_out:
+        vcf_head.formats.add("RDROP", 3, "Integer", "No. reads dropped by the SAM flag, MAPQ and base quality filters")
+
+
+def fmt_apply(samp_rec, rec_ann, n_alts, fmt_mode="packed"):
+    """ The fmt_apply function adds the rec_annotate output of a BAM-file to a sample of a variant-record, as the
+    FORMAT fields of fmt_mode. A sample without annotation is given missing values for every alternative allele, the
+    typed fields are left unset as pysam writes them as missing values.
+
+    Args:
+        :param samp_rec: Sample of the variant-record, from VariantRecord.samples
+        :param rec_ann: Dict generated by rec_annotate for the BAM-file of the sample, or None
+        :param n_alts: No. alternative alleles of the variant-record
+        :param fmt_mode: Output mode of the FORMAT fields, one of FMT_MODES
+    """
+    if fmt_mode != "typed":
+        if rec_ann is None:
+            samp_rec['UMI'] = (".",) * n_alts
+            samp_rec['SUMI'] = (".",) * n_alts
+        else:
+            samp_rec['UMI'] = rec_ann["UMI"]
+            samp_rec['SUMI'] = rec_ann["SUMI"]
+    if rec_ann is not None and "Drop" in rec_ann:
+        samp_rec['RDROP'] = rec_ann["Drop"]
+    if fmt_mode != "packed" and rec_ann is not None:
+        # The sup_count tuples of the alternative alleles are transposed into a tuple of every field
+        for fmt_nms, sup_key in ((UMI_FMTS, "UMI_Sup"), (SUMI_FMTS, "SUMI_Sup")):
+            for fmt_nm, fmt_val in zip(fmt_nms, zip(*rec_ann[sup_key])):
+                samp_rec[fmt_nm] = fmt_val
+
+
+def rec_apply(record, rec_ann, fmt_mode="packed"):
+    """ The rec_apply function rebuilds an annotated variant-record from the dict generated by rec_annotate, through
+    copying the record and adding the UMI and SUMI fields of fmt_mode to every sample (see fmt_apply), as well as the
+    FFPE filter if required. The fields hold a value for every alternative allele (Number=A).
+
+    Args:
+        :param record: Variant-record of interest
+        :param rec_ann: Dict generated by rec_annotate for the variant-record
+        :param fmt_mode: Output mode of the FORMAT fields, one of FMT_MODES
+
+    Returns:
+        :return: Returns a copy of the variant-record modified by the rec_annotate output
+    """
+    # Copies the record information
+    n_cop = record.copy()
+    n_alts = len(n_cop.alts)
+    for samp_rec in n_cop.samples.values():
+        fmt_apply(samp_rec, rec_ann, n_alts, fmt_mode)
+    if rec_ann["FFPE"]:
+        n_cop.filter.add("FFPE")
+    return n_cop
+
+
+def samp_apply(record, samp_lst, samp_anns, fmt_mode="packed"):
+    """ The samp_apply function rebuilds an annotated variant-record from the rec_annotate output of several BAM-files,
+    each mapped to a sample of the variant-record. Every sample is given the UMI and SUMI strings of its own BAM-file,
+    samples without a BAM-file are given missing values, and the FFPE filter is added if any sample has support for an
+    FFPE-artefact.
+
+    Args:
+        :param record: Variant-record of interest
+        :param samp_lst: List of the samples of the variant-record, one for every BAM-file
+        :param samp_anns: List of the rec_annotate output of every BAM-file, in the order of samp_lst
+        :param fmt_mode: Output mode of the FORMAT fields, one of FMT_MODES
+
+    Returns:
+        :return: Returns a copy of the variant-record modified by the rec_annotate output of every sample, or None if
+        the variant-record was not annotated (see rec_allele)
+    """
+    if all(rec_ann is None for rec_ann in samp_anns):
+        return
+    samp_dict = dict(zip(samp_lst, samp_anns))
+    n_cop = record.copy()
+    n_alts = len(n_cop.alts)
+    for sample, samp_rec in n_cop.samples.items():
+        # Samples without a BAM-file are given a missing value for every alternative allele
+        rec_ann = samp_dict.get(sample)
+        fmt_apply(samp_rec, rec_ann, n_alts, fmt_mode)
+        if rec_ann is not None and rec_ann["FFPE"] and "FFPE" not in n_cop.filter:
+            n_cop.filter.add("FFPE")
     return n_cop
 
 
-def var_extract(bam_lst, rec_pos, var_nuc, ref_nuc, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha):
+def var_extract(bam_lst, rec_pos, var_nuc, ref_nuc, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, umi_lst=None,
+                nuc_lst=None, clu_fun=None):
     """ Function with the purpose of creating a dict based on the directionality and umi-tags of the supplemented
-    reads in the bam_lst. Then using said dict to call the pos_hits and ffpe_finder functions to return a dict with
-    data regarding positional data and variant types for the variant-record position and the reads aligning to it.
+    reads in the bam_lst. Then using said dict to call the pos_hits and ffpe_code functions to return a FamTable with
+    the consensus nucleotides and variant type of every UMI for the variant-record position.
 
     Args:
         :param bam_lst: Input list of BAM-reads aligning to the variant call
@@ -92,34 +378,44 @@ def var_extract(bam_lst, rec_pos, var_nuc, ref_nuc, ffpe_n, ext_fun, spl_fun, q_
         :param spl_fun: Function used for splitting the UMI-tag in a read
         :param q_spl_cha: Character used for splittign the UMI-tag from the query-name
         :param u_spl_cha: Character used for splitting the UMI-tag
+        :param umi_lst: Optional list of pre-parsed umi_parse output for the reads in bam_lst, as generated by the
+        pos_sweep engine. A KeyError in the list is raised as if the read had been parsed here
+        :param nuc_lst: Optional list of the nucleotides of the reads in bam_lst at the variant position, as generated
+        by the pileup_sweep engine, used instead of calling nuc_check on the reads
+        :param clu_fun: Optional function merging the UMI-families whose UMI-tags differ by sequencing errors, such as
+        clust_function.umi_clust, called with the dict of UMI-families before they are classified
 
     Returns:
-        :return: Returns a dict for mapped and unmapped reads. Each of these dicts containing a single-hits and a
-        mate-hits dict. The mate-hits dict in turn contains data regarding if the variant is a variant, no variant,
-        FFPE-artfefact deletion or N-call. Whereas the single-hits dict contains positional data for reads with no mate.
-        Example dict:
-        mate_res[umi_key] = {"Single_Hits": Pos
-        _Str_Hits: {}, Neg_Str_Hits:{C,T}, "Mate_Hits": True_Variant_Hits": {},
-        "FFPE_Hits": {"Pos_str": C, "Neg_Str": T}, "N_Hits": {}, "Del_Hits": {}, "Reference_Support": 0,
-        "True_Variant_Support": 0, "FFPE_Support": 1, "N_Support": 0, "Del_Support": 0}}
+        :return: Returns a FamTable with a row for every UMI, containing the code of the mate and singleton consensus
+        nucleotide of each strand, as well as the code of the variant type of the UMI. The nested dicts previously
+        returned for the mate and singleton consensus are rebuilt by FamTable.fam_dict
+        Example table for a single FFPE-artefact UMI:
+        fam_tbl.umi_ids = ["AAATTT_CCCGGG"], fam_tbl.pos_nuc[0] = array("b", [3]),
+        fam_tbl.neg_nuc[0] = array("b", [1]), fam_tbl.cat[0] = array("b", [2])
 
     Raises:
         :raises KeyError: If a umi is not found within the umi_dict, adds said umi_id to the umi_dict as well as two
         empty dicts for the positive and negative strand for the umi
         :raises KeyError: Raises a key-error if the requested read/dict_key does not exist
     """
-    mate_dict = {}
-    singleton_dict = {}
-    mate_n_dict = {}
-    singleton_n_dict = {}
     umi_dict = {}
-    mate_res = {}
-    singleton_res = {}
+    fam_tbl = fam_function.FamTable()
+    if nuc_lst is None:
+        nuc_fun = nuc_function.nuc_check
+    else:
+        nuc_dict = {id(read): nuc for read, nuc in zip(bam_lst, nuc_lst)}
+
+        def nuc_fun(read, read_pos):
+            # Looks up the nucleotide resolved for the read by the pileup, rather than resolving it from the read
+            return nuc_dict[id(read)]
     try:
-        for read in bam_lst:
-            umi = ext_fun(read, q_spl_cha)
-            splt_umi = spl_fun(umi, u_spl_cha)
-            umi_res = pos_function.umi_maker(read, splt_umi)
+        for read_ind, read in enumerate(bam_lst):
+            if umi_lst is None:
+                umi_res = pos_function.umi_parse(read, ext_fun, spl_fun, q_spl_cha, u_spl_cha)
+            else:
+                umi_res = umi_lst[read_ind]
+                if isinstance(umi_res, KeyError):
+                    raise umi_res
             qr_nm = umi_res[0]
             strand = umi_res[1]
             umi_id = umi_res[2]
@@ -130,98 +426,27 @@ def var_extract(bam_lst, rec_pos, var_nuc, ref_nuc, ffpe_n, ext_fun, spl_fun, q_
                 if umi_id not in umi_dict:
                     umi_dict[umi_id] = {"Pos_Str": dict(), "Neg_Str": dict()}
                 umi_dict[umi_id][strand][qr_nm] = [read]
-        umi_dict = {k: v for k, v in umi_dict.items() if v}
 
-        pos_str_mate_hits = {}
-        neg_str_mate_hits = {}
-        pos_str_singleton_hits = {}
-        neg_str_singleton_hits = {}
+        if clu_fun is not None:
+            umi_dict = clu_fun(umi_dict)
+
         # Iterates through every UMI-key in the dict
-        for umi_key in umi_dict.keys():
-            # Retrieves the forward and reverse molecule hits from said UMI-key
-            pos_str_lst = umi_dict[umi_key]["Pos_Str"]
-            neg_str_lst = umi_dict[umi_key]["Neg_Str"]
-            # If any of the keys have an empty list entry, separately calculates the pos_hits and stores it
-            if pos_str_lst:
-                if neg_str_lst:
-                    mate_dict["Pos_Str_Hits"] = pos_function.pos_hits(pos_str_lst, rec_pos)[0]
-                    mate_dict["Neg_Str_Hits"] = pos_function.pos_hits(neg_str_lst, rec_pos)[0]
-                    singleton_dict["Pos_Str_Hits"] = pos_function.pos_hits(pos_str_lst, rec_pos)[1]
-                    singleton_dict["Neg_Str_Hits"] = pos_function.pos_hits(neg_str_lst, rec_pos)[1]
-                    mate_n_dict = nuc_function.ffpe_finder(mate_dict, var_nuc, ref_nuc, ffpe_n)
-                    singleton_n_dict = nuc_function.ffpe_finder(singleton_dict, var_nuc, ref_nuc, ffpe_n)
-                else:
-                    pos_str_mate_hits = pos_function.pos_hits(pos_str_lst, rec_pos)[0]
-                    pos_str_singleton_hits = pos_function.pos_hits(pos_str_lst, rec_pos)[1]
-            elif neg_str_lst:
-                if not pos_str_lst:
-                    neg_str_mate_hits = pos_function.pos_hits(neg_str_lst, rec_pos)[0]
-                    neg_str_singleton_hits = pos_function.pos_hits(neg_str_lst, rec_pos)[1]
-            mate_s_dict = {"Pos_Str_Single": pos_str_mate_hits, "Neg_Str_Single": neg_str_mate_hits}
-            singleton_s_dict = {"Pos_Str_Single": pos_str_singleton_hits, "Neg_Str_Single": neg_str_singleton_hits}
-            mate_res[umi_key] = {"Single_Hits": mate_s_dict, "Mate_Hits": mate_n_dict}
-            singleton_res[umi_key] = {"Single_Hits": singleton_s_dict, "Mate_Hits": singleton_n_dict}
+        for umi_key, umi_fam in umi_dict.items():
+            # Calls pos_hits once for each strand of the UMI-family, obtaining both its mate and singleton consensus
+            fam_cons = pos_function.fam_hits(umi_fam, rec_pos, nuc_fun)
+            # Classifies the UMI-key from the mate (cons_ind 0) and singleton (cons_ind 1) consensus of each strand
+            fam_tbl.add(umi_key, fam_cons["Pos_Str"], fam_cons["Neg_Str"], var_nuc, ref_nuc, ffpe_n)
     except KeyError as e:
         print("ERROR: The requested key " + str(e) + " does not exist")
-    return [mate_res, singleton_res]
-
-
-def inf_builder(inp_dict, ref_nuc, var_nuc):
-    """ The inf_builder function uses the output from var\_extract to generate a list containing strings representing
-    the data found for each record, more specifically support for each variant-type, as well as the support for the
-    reference and variant call for string 1 and string 2.
-    The inp_dict is meant to be the output from the var_extract function,and is divided into two dicts named
-    Single Hits and Mate Hits. The Single-dict contains the molecular support for the reference genome nucleotide and
-    the variant nucleotide based on all reads without a mate. The Mate-Hits dicts instead contains data regarding the
-     variant-classification, the support for each variant type,and the molecular support for the reference genome
-    nucleotide and the variant nucleotide based on reads with a mate.
-    Returns a list containing the support for each variant-type, as well as the support for the reference and variant
-    call for string1 and string 2
-
-    Args:
-        :param inp_dict: Input dict dict for mapped and unmapped reads. Each of these dicts containing a single-hits
-        and a mate-hits dict. The mate-hits dict in turn contains data regarding if the variant is a mutation,
-        no mutation, FFPE-artfefact deletion or N-call. Whereas the single-hits dict contains positional data for reads
-        with no mate.
-        Example dict for a FFPE-artefact:
-        inp_dict = umi_key: {"Single_Hits": Pos_Str_Hits: {}, Neg_Str_Hits:{C,T}, "Mate_Hits": True_Variant_Hits": {},
-        "FFPE_Hits": {"Pos_Str": C, "Neg_Str": T}, "N_Hits": {}, "Del_Hits": {}, "Reference_Support": 0,
-        "True_Variant_Support": 0, "FFPE_Support": 1, "N_Support": 0, "Del_Support": 0}}
-        :param ref_nuc: Nucletoide in the reference genome for the variant-record variant position
-        :param var_nuc: Variant nucleotide for the variant-record variant-call
-
-    Returns:
-        :return: Returns a list containing the support for each variant-type, as well as the support for the reference
-        and variant call for str1 and str2
-        Example output dict for one FFPE artefact:
-            [0;0;1;0;0;1;0;1;0;0;0;0;0]
-    """
-    # Calls the sup_count function to obtain the support for each nucleotide called
-    ref_sup = count_function.nuc_count(inp_dict, ref_nuc)
-    alt_sup = count_function.nuc_count(inp_dict, var_nuc)
-    type_sup = count_function.mol_count(inp_dict)
-    ref_p = None
-    ref_s = None
-    var_p = None
-    var_s = None
-
-    for var in var_nuc:
-        var_p = str(alt_sup["Paired"]["Pos_Str"][var]) + ";" + str(alt_sup["Paired"]["Neg_Str"][var])
-        var_s = str(alt_sup["Pos_Str_Single"][var]) + ";" + str(alt_sup["Neg_Str_Single"][var])
-
-    for ref in ref_nuc:
-        ref_p = str(ref_sup["Paired"]["Pos_Str"][ref]) + ";" + str(ref_sup["Paired"]["Neg_Str"][ref])
-        ref_s = str(ref_sup["Pos_Str_Single"][ref]) + ";" + str(ref_sup["Neg_Str_Single"][ref])
-
-    return [type_sup, ref_p, var_p, ref_s, var_s]
+    return fam_tbl
 
 
 def csv_maker(vcf_file, ffpe_n, per_exl):
-    """ The csv_maker function generates an output CSV-file based on the FUSAC output containing data for each
-    variant-record. More specifically regarding the molecular support for the reference genome nucleotide,
-    the variant-call nucleotide,the number of FFPE-calls, the overall frequency of FFPE-artefacts for each
-    variant-record, and the type of mismatch for the variant-record. Through extracting this info and calling the
-    csv_record_maker function, it populates a series of list that are then written to the new csv.
+    """ The csv_maker function generates the statistics CSV-files from a closed FUSAC output VCF-file, containing data
+    for each variant-record regarding the molecular support for the reference genome nucleotide, the variant-call
+    nucleotide, the number of FFPE-calls, the overall frequency of FFPE-artefacts for each variant-record, and the type
+    of mismatch for the variant-record. FUSAC itself writes the CSV-files while writing the output VCF-file through a
+    StatWriter, csv_maker regenerates them from an earlier output.
 
     Args:
         :param vcf_file: The output VCF file generated by FUSAC
@@ -232,107 +457,9 @@ def csv_maker(vcf_file, ffpe_n, per_exl):
     Returns:
         :return: Generates a .csv file with statistics to be used with the fusac_visualize.r function
     """
-    var_lst = []
-    ref_lst = []
-    ffpe_lst = []
-    perc_lst = []
-    pos_lst = []
-    change_lst = []
-
-    f_var_lst = []
-    f_ref_lst = []
-    f_ffpe_lst = []
-    f_perc_lst = []
-    f_pos_lst = []
-    f_change_lst = []
-
-    for record in vcf_file.fetch():
-        try:
-            r_f = record.filter
-            if ffpe_n == "all":
-                csv_record_maker(pos_lst, change_lst, var_lst, ffpe_lst, ref_lst, perc_lst, record, per_exl)
-                for f_val in r_f:
-                    if f_val == "FFPE":
-                        csv_record_maker(f_pos_lst, f_change_lst, f_var_lst, f_ffpe_lst, f_ref_lst, f_perc_lst, record, per_exl)
-            else:
-                for f_val in r_f:
-                    if f_val == "FFPE":
-                        if str(record.ref) == 'G' and str(list(record.alts)[0]) == 'A' or \
-                                str(record.ref) == 'C' and str(list(record.alts)[0]) == 'T':
-                            csv_record_maker(pos_lst, change_lst, var_lst, ffpe_lst, ref_lst, perc_lst, record, per_exl)
-        except KeyError as e:
-            print("ERROR: The requested filter tag " + str(e) + " does not exist")
-
-    # If the directory "FUSAC_Stats" does not yet exist, creates the directory
-    if os.path.isdir("FUSAC_Stats"):
-        shutil.rmtree('FUSAC_Stats')
-        os.makedirs('FUSAC_Stats')
-    else:
-        os.makedirs('FUSAC_Stats')
-    # Prints out the most important statistics to a .csv file to be used with R
-
-    if ffpe_n == "all":
-        pd.DataFrame({'Ref': ref_lst, 'Var': var_lst, 'FFPE': ffpe_lst, 'Perc': perc_lst,
-                      'NucChange': change_lst}).to_csv("FUSAC_Stats/fusac_all_stats.csv")
-        pd.DataFrame({'Ref': f_ref_lst, 'Var': f_var_lst, 'FFPE': f_ffpe_lst, 'Perc': f_perc_lst,
-                      'NucChange': f_change_lst}).to_csv("FUSAC_Stats/fusac_stats.csv")
-    else:
-        pd.DataFrame({'Ref': ref_lst, 'Var': var_lst, 'FFPE': ffpe_lst, 'Perc': perc_lst,
-                      'NucChange': change_lst}).to_csv("FUSAC_Stats/fusac_stats.csv")
-
-
-def csv_record_maker(pos_lst, change_lst, var_lst, ffpe_lst, ref_lst, perc_lst, record, per_exl):
-    """ The csv_record_maker function extracts information from a FFPE-artefact tagged record extracted the output from fusac.py, more specifically
-    from the "samples field. Generates data regarding the molecular support for the nucleotide in the reference genome
-    for the variant-call position, the variant nucleotide in the variant-record, the number of FFPE-artefacts found,
-    the number of unknowns found, the number of deletions found, as well as the percentile ratio of FFPE artefacts in
-    the variant-record. The generated data is then used to populate the lists used as input.
-
-    Args:
-        :param pos_lst: List containing the position for studied variant-records
-        :param change_lst: List containing the mismatch for studied variant-records
-        :param ref_lst: List containing the molecular support for the reference genome nucleotide for each studied
-        variant call position respectively
-        :param var_lst: List containing the molecular support for the variant-record variant-call position for each
-        studied variant call position respectively
-        :param ffpe_lst: List containing the molcular support for FFPE-artefacts on the variant-record variant-call
-         position for each studied variant call position respectively
-        :param perc_lst: List containing the percentual ratio of molecules support FFPE-artefacts to the total
-        number of molecules studied for each studied variant call position respectively
-        :param record: The variant-record of interest
-        :param per_exl: Optional input argument controlling the percentage threshold from which to remove records with
-        values beneath it
-    """
-    rec_samp = record.samples
-    for sample in rec_samp:
-            ffpe_perc = 0
-            samp_dat = list(rec_samp[sample]['UMI'])
-            rec_str = samp_dat[0]
-            rec_splt = rec_str.split(';')
-
-            rec_var = int(rec_splt[1])
-            rec_ffpe = int(rec_splt[2])
-            rec_ref = int(rec_splt[0])
-            rec_n = int(rec_splt[3])
-            rec_del = int(rec_splt[4])
-            perc_rec = (rec_ref + rec_var + rec_ffpe + rec_n + rec_del)
-            if perc_rec != 0:
-                ffpe_perc = (rec_ffpe/perc_rec)*100
-
-            if per_exl == 0:
-                pos_lst.append(str(record.pos))
-                change_lst.append(str(record.ref) + ">" + str(list(record.alts)[0]))
-                var_lst.append(rec_var)
-                ffpe_lst.append(rec_ffpe)
-                ref_lst.append(rec_ref)
-                perc_lst.append(ffpe_perc)
-            else:
-                if not int(per_exl[0]) <= ffpe_perc <= int(per_exl[1]):
-                    continue
-                else:
-                    pos_lst.append(str(record.pos))
-                    change_lst.append(str(record.ref) + ">" + str(list(record.alts)[0]))
-                    var_lst.append(rec_var)
-                    ffpe_lst.append(rec_ffpe)
-                    ref_lst.append(rec_ref)
-                    perc_lst.append(ffpe_perc)
+    stat_wrt = stat_function.StatWriter(None, ffpe_n, per_exl)
+    try:
+        for record in vcf_file.fetch():
+            stat_wrt.add(record)
+    finally:
+        stat_wrt.close()
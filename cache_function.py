@@ -0,0 +1,86 @@
+from collections import OrderedDict
+import nuc_function
+import sweep_function
+
+
+class ReadCache:
+    """ The ReadCache class holds the parsed UMI-tag and the reference-to-query coordinate map of recently seen reads,
+    so that a read overlapping several variant-records is parsed once rather than once for every record. Reads are
+    keyed by their query-name and flag, holding the mate of the read, and an entry is solely reused for an alignment
+    starting at the same position. The cache is a LRU cache holding at most max_reads reads, from which evict
+    additionally drops the reads ending before a position once sorted variant-records have moved past them.
+
+    Example entry for a read aligned to position 100-132 of the first contig:
+        read_dict[("PairedFFPERead_AAATTT+CCCGGG", 99)] = (100, 132, 0, ["PairedFFPERead_AAATTT+CCCGGG", "Pos_Str",
+        "AAATTT_CCCGGG"], ((100, 132, 0),))
+    """
+    __slots__ = ("max_reads", "read_dict", "hits", "misses", "evictions")
+
+    def __init__(self, max_reads):
+        self.max_reads = max_reads
+        self.read_dict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.read_dict)
+
+    def get(self, read, umi_fun):
+        """ The get method returns the cache entry of a read, parsing the read with umi_fun and mapping its CIGAR
+        operations if the read is not in the cache. The least recently used read is dropped once the cache is full.
+
+        Args:
+            :param read: Read of interest
+            :param umi_fun: Function parsing the UMI-tag of a read, such as umi_parse
+
+        Returns:
+            :return: Returns a tuple containing the reference start, the read_end and the reference id of the read,
+            followed by the umi_fun output and the ref_map output of the read
+        """
+        # The flag holds the mate of the read, and separates its primary, secondary and supplementary alignments
+        read_key = (read.query_name, read.flag)
+        ref_start = read.reference_start
+        read_ent = self.read_dict.get(read_key)
+        if read_ent is not None and read_ent[0] == ref_start:
+            self.hits += 1
+            self.read_dict.move_to_end(read_key)
+            return read_ent
+        # A read missing from the cache, or cached for another alignment such as a supplementary alignment
+        self.misses += 1
+        read_ent = (ref_start, sweep_function.read_end(read), read.reference_id, umi_fun(read),
+                    nuc_function.ref_map(read))
+        self.read_dict[read_key] = read_ent
+        self.read_dict.move_to_end(read_key)
+        if len(self.read_dict) > self.max_reads:
+            self.read_dict.popitem(last=False)
+            self.evictions += 1
+        return read_ent
+
+    def evict(self, ref_id, rec_pos):
+        """ The evict method drops the reads on other contigs or ending at or before a position, from the least
+        recently used read onwards until a read covering the position or beyond is reached. Reads are added in
+        coordinate order when sorted variant-records are processed, whereby the reads ending first are at the least
+        recently used end of the cache.
+
+        Args:
+            :param ref_id: The reference id of the contig of the position
+            :param rec_pos: The 0-based position of the variant-record
+        """
+        while self.read_dict:
+            read_key, read_ent = next(iter(self.read_dict.items()))
+            if read_ent[2] == ref_id and read_ent[1] > rec_pos:
+                break
+            del self.read_dict[read_key]
+            self.evictions += 1
+
+    def stats(self):
+        """ The stats method summarizes the hit/miss statistics of the cache.
+
+        Returns:
+            :return: Returns a string with the no. hits, misses and evictions, and the hit rate of the cache
+        """
+        n_gets = self.hits + self.misses
+        hit_rate = 100 * self.hits / n_gets if n_gets else 0
+        return str(self.hits) + " hits, " + str(self.misses) + " misses (" + str(round(hit_rate, 1)) + "% hit rate), " \
+            + str(self.evictions) + " evictions"
@@ -0,0 +1,228 @@
+import itertools
+import json
+import os
+import time
+import warnings
+import pysam
+
+# Extensions of the checkpoint of a run, and of the partial output of the run while it is copied by a resumed run
+CKPT_EXT = ".ckpt"
+PART_EXT = ".part"
+# Arguments solely changing how a run is executed rather than its output, which may differ for the resumed run
+RUN_ARGS = ("threads", "queueSize", "maxInFlight", "reorderBuffer", "mode", "chunkSize", "backend", "readCache",
+            "shardSize", "compressionLevel", "index", "writeThreads", "profile", "cProfile", "resume",
+            "checkpointInterval")
+
+
+class CkptWriter:
+    """ The CkptWriter class records the progress of a run in a checkpoint file next to the output VCF-file, so that a
+    run ended early can be resumed without annotating the finished variant-records again. Used in place of the output
+    VCF filehandle, it counts the written records, and the writers of the thread and process modes report every
+    variant-record, or shard, once it has been written in order. Every ckpt_int seconds the output is flushed and a
+    mark of the no. finished records, shards and written records is added to the checkpoint. The marks of every
+    checkpoint are kept, as the BGZF-blocks of a compressed output are buffered by htslib after a flush, and a resumed
+    run thus continues from the latest mark whose records have all reached the partial output, see part_mark.
+
+    Example checkpoint of a run in thread mode that has written 1200 of its first 1500 records:
+        {"input": "/data/calls.vcf.gz", "bams": [...], "options": {...}, "shards": null,
+         "marks": [[0, 0, 0], [700, 0, 560], [1500, 0, 1200]]}
+    """
+    __slots__ = ("rec_out", "n_vcf", "ckpt_path", "ckpt_info", "ckpt_int", "ckpt_marks", "n_recs", "n_shards", "n_wrt",
+                 "t_ckpt")
+
+    def __init__(self, rec_out, n_vcf, ckpt_path, ckpt_info, ckpt_int=60, ckpt_marks=None):
+        self.rec_out = rec_out
+        self.n_vcf = n_vcf
+        self.ckpt_path = ckpt_path
+        self.ckpt_info = ckpt_info
+        self.ckpt_int = ckpt_int
+        self.ckpt_marks = [[0, 0, 0]] if ckpt_marks is None else list(ckpt_marks)
+        self.n_recs, self.n_shards = self.ckpt_marks[-1][:2]
+        self.n_wrt = 0
+        self.t_ckpt = time.monotonic()
+
+    def write(self, record):
+        """ The write method writes an annotated variant-record to the output, and counts it.
+
+        Args:
+            :param record: Annotated variant-record
+        """
+        self.rec_out.write(record)
+        self.n_wrt += 1
+
+    def done(self, n_recs, n_shards=0):
+        """ The done method adds variant-records, and the shards holding them, that have been written in order, and
+        saves the checkpoint once ckpt_int seconds have passed since it was last saved.
+
+        Args:
+            :param n_recs: No. variant-records finished, including records without annotation
+            :param n_shards: No. shards finished, for the sharded process mode
+        """
+        self.n_recs += n_recs
+        self.n_shards += n_shards
+        if time.monotonic() - self.t_ckpt >= self.ckpt_int:
+            self.save()
+
+    def save(self):
+        """ The save method flushes the output VCF-file and adds a mark of the progress of the run to the checkpoint.
+        """
+        self.n_vcf.flush()
+        ckpt_mark = [self.n_recs, self.n_shards, self.n_wrt]
+        if ckpt_mark != self.ckpt_marks[-1]:
+            self.ckpt_marks.append(ckpt_mark)
+        ckpt_save(self.ckpt_path, dict(self.ckpt_info, marks=self.ckpt_marks))
+        self.t_ckpt = time.monotonic()
+
+    def close(self):
+        """ The close method removes the checkpoint once the run has finished, as there is nothing left to resume.
+        """
+        if os.path.exists(self.ckpt_path):
+            os.remove(self.ckpt_path)
+
+
+def ckpt_info(args):
+    """ The ckpt_info function describes the input and the options of a run, which a resumed run is required to share
+    with the run that wrote the checkpoint, see RUN_ARGS.
+
+    Args:
+        :param args: Dict of the parsed arguments of the run
+
+    Returns:
+        :return: Returns a dict with the absolute paths of the input files and the output options of the run
+    """
+    run_opts = {arg_nm: arg_val for arg_nm, arg_val in args.items() if arg_nm not in RUN_ARGS}
+    # Round-trips the options through JSON, so that they compare equal to the options loaded from a checkpoint
+    return {"input": os.path.abspath(args["inputVCF"]),
+            "bams": [os.path.abspath(bam_path) for bam_path in args["inputBAM"]],
+            "options": json.loads(json.dumps(run_opts)), "shards": None}
+
+
+def ckpt_save(ckpt_path, ckpt_dict):
+    """ The ckpt_save function writes the checkpoint atomically: it is written to a temporary file and synced to disk
+    before it replaces the previous checkpoint, so that the checkpoint is always either the previous or the new one.
+
+    Args:
+        :param ckpt_path: Path of the checkpoint
+        :param ckpt_dict: Dict of the checkpoint
+    """
+    tmp_path = ckpt_path + ".tmp"
+    with open(tmp_path, "w") as ckpt_file:
+        json.dump(ckpt_dict, ckpt_file)
+        ckpt_file.flush()
+        os.fsync(ckpt_file.fileno())
+    os.replace(tmp_path, ckpt_path)
+
+
+def ckpt_load(ckpt_path):
+    """ The ckpt_load function loads the checkpoint of an earlier run.
+
+    Args:
+        :param ckpt_path: Path of the checkpoint
+
+    Returns:
+        :return: Returns the dict of the checkpoint, or None if there is no checkpoint
+    """
+    if not os.path.exists(ckpt_path):
+        return
+    with open(ckpt_path) as ckpt_file:
+        return json.load(ckpt_file)
+
+
+def ckpt_check(ckpt_dict, run_info):
+    """ The ckpt_check function compares the input and the options of a checkpoint to those of the resumed run.
+
+    >>> ckpt_check({"input": "a.vcf", "bams": ["a.bam"], "options": {"output": "a.vcf.gz"}},
+    ...            {"input": "a.vcf", "bams": ["a.bam"], "options": {"output": "b.vcf.gz"}})
+    'output'
+
+    Args:
+        :param ckpt_dict: Dict of the checkpoint
+        :param run_info: The ckpt_info output of the resumed run
+
+    Returns:
+        :return: Returns the name of the first input or option differing from the checkpoint, or None
+    """
+    for info_nm in ("input", "bams"):
+        if ckpt_dict[info_nm] != run_info[info_nm]:
+            return info_nm
+    for opt_nm in sorted(set(ckpt_dict["options"]) | set(run_info["options"])):
+        if ckpt_dict["options"].get(opt_nm) != run_info["options"].get(opt_nm):
+            return opt_nm
+
+
+def out_part(out_path):
+    """ The out_part function moves the partial output of the run that wrote the checkpoint aside, before the output
+    VCF-file of the resumed run is opened. A partial output left by an earlier resumed run that ended while copying it
+    is kept, as it is the output of the checkpoint.
+
+    Args:
+        :param out_path: Path of the output VCF-file
+
+    Returns:
+        :return: Returns the path of the partial output
+    """
+    part_path = out_path + PART_EXT
+    if not os.path.exists(part_path):
+        os.replace(out_path, part_path)
+    return part_path
+
+
+def part_read(part_path):
+    """ The part_read function iterates over the variant-records of a partial output, up to the first record that
+    cannot be read, such as the records of a truncated BGZF-block. A partial output without a readable header, such as
+    a compressed output killed before its first BGZF-block reached the disk, holds no records. The htslib messages on
+    the missing EOF marker and the truncated block are silenced, as a partial output is expected to be truncated.
+
+    Args:
+        :param part_path: Path of the partial output
+
+    Returns:
+        :return: Yields the readable variant-records
+    """
+    hts_verb = pysam.set_verbosity(0)
+    part_file = None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            part_file = pysam.VariantFile(part_path, "r", ignore_truncation=True)
+        yield from part_file
+    except (OSError, ValueError):
+        return
+    finally:
+        if part_file is not None:
+            try:
+                part_file.close()
+            except OSError:
+                pass
+        pysam.set_verbosity(hts_verb)
+
+
+def part_mark(part_path, ckpt_marks):
+    """ The part_mark function selects the latest mark of the checkpoint whose written records can all be read from
+    the partial output.
+
+    Args:
+        :param part_path: Path of the partial output
+        :param ckpt_marks: List of the marks of the checkpoint, see CkptWriter
+
+    Returns:
+        :return: Returns the list of the marks up to and including the selected mark
+    """
+    n_part = sum(1 for _ in itertools.islice(part_read(part_path), ckpt_marks[-1][2]))
+    mark_ind = max(mark_ind for mark_ind, ckpt_mark in enumerate(ckpt_marks) if ckpt_mark[2] <= n_part)
+    return ckpt_marks[:mark_ind + 1]
+
+
+def out_copy(part_path, rec_out, n_wrt):
+    """ The out_copy function writes the variant-records of the partial output saved by the checkpoint to the output of
+    the resumed run, as pysam cannot append to a VCF-file. The records pass through the same writers as the annotated
+    records, such as the StatWriter, so that the statistics CSV-files hold every record as well. Records written after
+    the selected mark are left out, as their input records are annotated again.
+
+    Args:
+        :param part_path: Path of the partial output
+        :param rec_out: Writer of the output, such as the CkptWriter
+        :param n_wrt: No. written records of the selected mark, see part_mark
+    """
+    for record in itertools.islice(part_read(part_path), n_wrt):
+        rec_out.write(record)
@@ -0,0 +1,199 @@
+import functools
+
+# Translation of the UMI nucleotides into octal digits, packing every nucleotide of a UMI-half into 3 bits of an
+# integer. Every other character accepted by int() is translated into an invalid digit, so that UMI-halves containing
+# any other character fail to pack, as do UMI-halves longer than UMI_MAX_LEN nucleotides
+UMI_TRANS = str.maketrans("ACGTN0123456789_+- \t\n\r\x0b\x0c", "12345" + "x" * 19)
+UMI_BITS = 64
+UMI_MAX_LEN = 21
+# Mask of the lowest bit of every 3-bit nucleotide in either half of a packed umi-key, see umi_code
+UMI_MASK = sum(1 << (3 * n_ind) for n_ind in range(UMI_MAX_LEN))
+UMI_MASK |= UMI_MASK << UMI_BITS
+# Clustering methods accepted by umi_clust
+CLUST_LST = ("hamming", "directional")
+# Max. no. umi-keys held packed by umi_code, which are kept for the lifetime of the thread or worker process
+UMI_CODE_CAP = 65536
+
+
+def umi_dist(umi_a, umi_b):
+    """ The umi_dist function returns the Hamming distance between two packed umi-keys with halves of equal length.
+    Every nucleotide differing between the keys leaves at least one bit set in its 3 bits of the XOR of the keys, which
+    are folded onto the lowest bit of the nucleotide and counted.
+
+    >>> umi_dist(umi_code("AACG_TT"), umi_code("ATCG_TA"))
+    2
+
+    Args:
+        :param umi_a: The first packed umi-key
+        :param umi_b: The second packed umi-key
+
+    Returns:
+        :return: Returns the no. nucleotides differing between the umi-keys
+    """
+    umi_xor = umi_a ^ umi_b
+    return bin((umi_xor | umi_xor >> 1 | umi_xor >> 2) & UMI_MASK).count("1")
+
+
+@functools.lru_cache(maxsize=UMI_CODE_CAP)
+def umi_code(umi_id):
+    """ The umi_code function packs a umi-key generated by pos_function.umi_parse into an integer using 3 bits per
+    nucleotide, which lets the Hamming distance between umi-keys be computed on integers. The left half is stored in
+    the upper and the right half in the lower UMI_BITS bits. The packed umi-keys are cached across the positions and
+    variant-records of the process, as the UMI-families of a position are mostly found again at the overlapping
+    positions, so that the reads of a run are not packed at all unless the UMI-families are clustered.
+
+    >>> umi_code("AC_GT")
+    184467440737095516188
+
+    Args:
+        :param umi_id: The umi-key of interest
+
+    Returns:
+        :return: Returns the packed umi-key, or None for umi-keys whose halves cannot be packed
+    """
+    umi_hlvs = umi_id.split("_")
+    if len(umi_hlvs) != 2 or len(umi_hlvs[0]) > UMI_MAX_LEN or len(umi_hlvs[1]) > UMI_MAX_LEN:
+        return None
+    try:
+        return int(umi_hlvs[0].translate(UMI_TRANS), 8) << UMI_BITS | int(umi_hlvs[1].translate(UMI_TRANS), 8)
+    except ValueError:
+        return None
+
+
+def umi_shape(umi_id):
+    """ The umi_shape function returns the no. nucleotides in either half of a packed umi-key, the Hamming distance is
+    only defined between umi-keys of the same shape. The leading nucleotide of a half is never packed as 0, which makes
+    the no. nucleotides follow from the bit length of the half.
+
+    Args:
+        :param umi_id: The packed umi-key of interest
+
+    Returns:
+        :return: Returns a tuple with the no. nucleotides in the left and the right half of the umi-key
+    """
+    code_l = umi_id >> UMI_BITS
+    code_r = umi_id & ((1 << UMI_BITS) - 1)
+    return (code_l.bit_length() + 2) // 3, (code_r.bit_length() + 2) // 3
+
+
+def seg_masks(umi_shp, max_dist):
+    """ The seg_masks function divides the nucleotides of umi-keys of a given shape into max_dist + 1 segments of
+    consecutive nucleotides, and returns a bit mask selecting each segment. Two umi-keys within max_dist of each other
+    differ in at most max_dist segments, so at least one of their segments is identical (the pigeonhole principle).
+
+    Args:
+        :param umi_shp: The umi_shape output of the umi-keys
+        :param max_dist: The max. Hamming distance between umi-keys of the same cluster
+
+    Returns:
+        :return: Returns a list with a bit mask for every segment
+    """
+    bit_lst = ([3 * n_ind for n_ind in range(umi_shp[1])] +
+               [UMI_BITS + 3 * n_ind for n_ind in range(umi_shp[0])])
+    n_seg = max(1, min(max_dist + 1, len(bit_lst)))
+    seg_lst = []
+    for seg_ind in range(n_seg):
+        seg_mask = 0
+        for bit in bit_lst[seg_ind * len(bit_lst) // n_seg:(seg_ind + 1) * len(bit_lst) // n_seg]:
+            seg_mask |= 7 << bit
+        seg_lst.append(seg_mask)
+    return seg_lst
+
+
+def umi_adj(umi_lst, umi_cnt, max_dist, method):
+    """ The umi_adj function finds the neighbours of every umi-key of a shape within max_dist, using an index of the
+    umi-keys by each of their seg_masks segments. Only umi-keys sharing a segment are compared, which keeps the no.
+    comparisons close to linear in the no. umi-keys, rather than comparing all pairs of umi-keys.
+
+    Args:
+        :param umi_lst: List of packed umi-keys of the same shape
+        :param umi_cnt: Dict with the no. read-pairs of every umi-key
+        :param max_dist: The max. Hamming distance between neighbouring umi-keys
+        :param method: "hamming" for connecting all neighbours, or "directional" for solely connecting a umi-key to
+        neighbours with at most half (rounded up) of its no. read-pairs, as in the directional method of UMI-tools
+
+    Returns:
+        :return: Returns a dict with a set of the neighbours of every umi-key
+    """
+    seg_idx = {}
+    for seg_ind, seg_mask in enumerate(seg_masks(umi_shape(umi_lst[0]), max_dist)):
+        for umi_id in umi_lst:
+            seg_idx.setdefault((seg_ind, umi_id & seg_mask), []).append(umi_id)
+
+    # Umi-keys sharing several segments are compared once per segment, the neighbours are thus kept as a set
+    adj_dict = {umi_id: set() for umi_id in umi_lst}
+    for seg_umis in seg_idx.values():
+        for umi_ind, umi_a in enumerate(seg_umis):
+            for umi_b in seg_umis[umi_ind + 1:]:
+                if umi_dist(umi_a, umi_b) > max_dist:
+                    continue
+                cnt_a = umi_cnt[umi_a]
+                cnt_b = umi_cnt[umi_b]
+                if method != "directional" or cnt_a >= 2 * cnt_b - 1:
+                    adj_dict[umi_a].add(umi_b)
+                if method != "directional" or cnt_b >= 2 * cnt_a - 1:
+                    adj_dict[umi_b].add(umi_a)
+    return adj_dict
+
+
+def umi_clust(umi_dict, max_dist=1, method="directional"):
+    """ The umi_clust function merges the UMI-families of a variant-record position whose UMI-tags differ by sequencing
+    errors. UMI-keys are connected to their neighbours found by umi_adj, and every umi-key, in order of decreasing
+    no. read-pairs, collects all umi-keys reachable from it that are not yet part of a cluster. The reads of every
+    cluster are merged into the UMI-family of its most abundant umi-key. The umi-keys are compared packed by umi_code,
+    and umi-keys that cannot be packed are never merged.
+
+    Args:
+        :param umi_dict: Dict of the UMI-families of the position, keyed by the umi-key of umi_parse
+        Example dict:
+        umi_dict = {"ACTGCA_ACTGCA": {"Pos_Str": {example_name_UMI_ACTGCA+ACTGCA: [read1, read2]}, "Neg_Str": {}}}
+        :param max_dist: The max. Hamming distance between neighbouring umi-keys
+        :param method: "hamming" for merging every connected group of umi-keys, or "directional" for the directional
+        adjacency method
+
+    Returns:
+        :return: Returns a dict of the merged UMI-families in the format of umi_dict, in the order of umi_dict
+    """
+    shp_dict = {}
+    code_ids = {}
+    umi_cnt = {}
+    for umi_id, umi_fam in umi_dict.items():
+        code_id = umi_code(umi_id)
+        if code_id is not None:
+            shp_dict.setdefault(umi_shape(code_id), []).append(code_id)
+            code_ids[code_id] = umi_id
+            # The abundance of a umi-key is its no. read-pairs on both strands
+            umi_cnt[code_id] = len(umi_fam["Pos_Str"]) + len(umi_fam["Neg_Str"])
+
+    # The clusters are formed on the packed umi-keys, and mapped back onto the umi-keys of umi_dict
+    clu_dict = {}
+    for umi_lst in shp_dict.values():
+        if len(umi_lst) < 2:
+            continue
+        adj_dict = umi_adj(umi_lst, umi_cnt, max_dist, method)
+        # Ties in abundance are broken by the umi-key, keeping the clusters independent of the read order
+        for umi_seed in sorted(umi_lst, key=lambda umi_id: (-umi_cnt[umi_id], umi_id)):
+            if umi_seed in clu_dict:
+                continue
+            clu_dict[umi_seed] = umi_seed
+            umi_que = [umi_seed]
+            while umi_que:
+                for umi_id in adj_dict[umi_que.pop()]:
+                    if umi_id not in clu_dict:
+                        clu_dict[umi_id] = umi_seed
+                        umi_que.append(umi_id)
+    clu_dict = {code_ids[code_id]: code_ids[code_seed] for code_id, code_seed in clu_dict.items()}
+
+    clu_res = {}
+    for umi_id, umi_fam in umi_dict.items():
+        umi_seed = clu_dict.get(umi_id, umi_id)
+        if umi_seed == umi_id:
+            clu_res[umi_id] = umi_fam
+    for umi_id, umi_seed in clu_dict.items():
+        if umi_seed == umi_id:
+            continue
+        for strand, str_dict in umi_dict[umi_id].items():
+            seed_dict = clu_res[umi_seed][strand]
+            for qr_nm, read_lst in str_dict.items():
+                seed_dict.setdefault(qr_nm, []).extend(read_lst)
+    return clu_res
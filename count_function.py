@@ -1,84 +1,61 @@
-def mol_count(inp_dict):
-    """ The mol_count function uses the output generated by the var_extract function, more specifically support for
-    each variant-type as well as the support for the reference and variant call for str1 and str2. Returns a list
-    consisting of the support for each variant type
+import numpy as np
+import nuc_function
+
+# No. nucleotide codes and category codes in the UMI-family table
+N_NUC = nuc_function.NUC_EMPTY + 1
+N_CAT = nuc_function.CAT_NONE + 1
+# No. bins of the nucleotide support, counted per consensus, strand, UMI-group (paired, single or neither) and code
+N_NUC_BIN = 2 * 2 * 3 * N_NUC
+
+
+def fam_count(fam_tbl):
+    """ The fam_count function counts the support of every nucleotide and variant type in the output generated by the
+    var_extract function, for the mate as well as the singleton consensus, through a single bincount over the columns
+    of the table. Every consensus nucleotide of a UMI is binned by its consensus, strand, UMI-group and nucleotide
+    code, and every category code by its consensus. UMIs with reads on both strands are in the paired group, UMIs with
+    reads on a single strand in the single group for that strand. The strand of a single UMI lacking reads is counted
+    in neither group.
 
     Args:
-        :param inp_dict: The output dict from the var_extract function
-        Example dict for a FFPE-artefact:
-        inp_dict = umi_key: {"Single_Hits": Pos_Str_Hits: {}, Neg_Str_Hits:{C,T}, "Mate_Hits": True_Variant_Hits": {},
-        "FFPE_Hits": {"Pos_Str": C, "Pos_Str": T}, "N_Hits": {}, "Del_Hits": {}, "Reference_Support": 0,
-        "True_Variant_Support": 0, "FFPE_Support": 1, "N_Support": 0, "Del_Support": 0}}
+        :param fam_tbl: The FamTable generated by the var_extract function
+        Example table for a FFPE-artefact:
+        fam_tbl.umi_ids = ["AAATTT_CCCGGG"], fam_tbl.pos_nuc[0] = array("b", [3]),
+        fam_tbl.neg_nuc[0] = array("b", [1]), fam_tbl.cat[0] = array("b", [2])
 
     Returns:
-        :return: Returns a list consisting of the support for each variant type
-        Example list for a FFPE-artefact:
-        [0,0,1,0,0]
+        :return: Returns a tuple of the category support, indexed by [cons_ind][cat_code], and the nucleotide support,
+        indexed by [cons_ind][strand, 0 for Pos_Str][group, 0 for paired and 1 for single][nuc_code]
     """
-    ref_sup = 0
-    var_sup = 0
-    ffpe_sup = 0
-    n_sup = 0
-    del_sup = 0
-    # Counts the total support for each variant-option for every UMI-key entry in input_dict
-    for umi_key in inp_dict:
-        if inp_dict[umi_key]["Mate_Hits"]:
-            ref_sup += inp_dict[umi_key]["Mate_Hits"]["Reference_Support"]
-            var_sup += inp_dict[umi_key]["Mate_Hits"]["True_Variant_Support"]
-            ffpe_sup += inp_dict[umi_key]["Mate_Hits"]["FFPE_Support"]
-            n_sup += inp_dict[umi_key]["Mate_Hits"]["N_Support"]
-            del_sup += inp_dict[umi_key]["Mate_Hits"]["Del_Support"]
-        else:
-            continue
-    return [ref_sup, var_sup, ffpe_sup, n_sup, del_sup]
+    n_umi = len(fam_tbl)
+    # Views the mate and singleton columns of the table as a single array each, followed by their cons_ind
+    pos_arr = np.frombuffer(fam_tbl.pos_nuc[0] + fam_tbl.pos_nuc[1], dtype=np.int8)
+    neg_arr = np.frombuffer(fam_tbl.neg_nuc[0] + fam_tbl.neg_nuc[1], dtype=np.int8)
+    cat_arr = np.frombuffer(fam_tbl.cat[0] + fam_tbl.cat[1], dtype=np.int8)
+    cons_arr = np.repeat(np.arange(2), n_umi)
 
+    # Classified UMIs are paired, unclassified UMIs lacking reads on the other strand are single
+    pair_arr = cat_arr != nuc_function.CAT_NONE
+    pos_grp = np.where(pair_arr, 0, np.where(neg_arr == nuc_function.NUC_EMPTY, 1, 2))
+    neg_grp = np.where(pair_arr, 0, np.where(pos_arr == nuc_function.NUC_EMPTY, 1, 2))
+    pos_bin = ((cons_arr * 2) * 3 + pos_grp) * N_NUC + pos_arr
+    neg_bin = ((cons_arr * 2 + 1) * 3 + neg_grp) * N_NUC + neg_arr
+    cat_bin = N_NUC_BIN + cons_arr * N_CAT + cat_arr
 
-def nuc_count(inp_dict, nuc):
-    """ The nuc_count function uses the output generated by the var_extract function, more specifically the support for
-    a given nucleotide of interest. Returns a dict containing subsequent dicts with the support for the nucleotide
-    for paired reads on string 1, string 2, as well as the support for the nuceleotide on single reads belonging to
-     string 1 and string 2.
+    sup_arr = np.bincount(np.concatenate((pos_bin, neg_bin, cat_bin)), minlength=N_NUC_BIN + 2 * N_CAT)
+    return sup_arr[N_NUC_BIN:].reshape(2, N_CAT), sup_arr[:N_NUC_BIN].reshape(2, 2, 3, N_NUC)
+
+
+def mol_count(fam_cnt, cons_ind):
+    """ The mol_count function uses the output generated by the fam_count function, more specifically support for
+    each variant-type. Returns a list consisting of the support for each variant type
 
     Args:
-        :param inp_dict: The output dict from the var_extract function
-        Example dict for a FFPE-artefact:
-        inp_dict = umi_key: {"Single_Hits": Pos_Str_Hits: {}, Neg_Str_Hits:{C,T}, "Mate_Hits": True_Variant_Hits": {},
-        "FFPE_Hits": {"Pos_Str": C, "Neg_Str": T}, "N_Hits": {}, "Del_Hits": {}, "Reference_Support": 0,
-        "True_variant_Support": 0, "FFPE_Support": 1, "N_Support": 0, "Del_Support": 0}}
-        :param nuc: The nucleotide of interest
+        :param fam_cnt: The output tuple from the fam_count function
+        :param cons_ind: 0 for the mate consensus, 1 for the singleton consensus
 
     Returns:
-        :return:  Returns a dict with separate dicts giving the support for the nucleotide for the positive and negative
-        strand, as well as each variant type
-        Example dict for the nucleotide C for a imaginary input_dict:
-        n_sup = {"Paired": {"Pos_Str": {C: {12}}, "Neg_Str": C: {11}, "Pos_Str_Single": C: {5},
-        "Neg_Str_Single": C: {2}}
+        :return: Returns a list consisting of the support for each variant type
+        Example list for a FFPE-artefact:
+        [0,0,1,0,0]
     """
-    n_sup = {"Paired": {}, "Pos_Str_Single": {}, "Neg_Str_Single": {}}
-    for n in nuc:
-        n_sup["Paired"] = {"Pos_Str": {}, "Neg_Str": {}}
-        n_sup["Paired"]["Pos_Str"][n] = 0
-        n_sup["Paired"]["Neg_Str"][n] = 0
-        n_sup["Pos_Str_Single"][n] = 0
-        n_sup["Neg_Str_Single"][n] = 0
-        for umi_key in inp_dict:
-            # Iterates through each alternative allele called by the variant caller
-            # Counts the no. molecules supporting the variant for each direction in the single hits
-            if inp_dict[umi_key]:
-                if inp_dict[umi_key]["Single_Hits"]:
-                    for sh_dir in inp_dict[umi_key]["Single_Hits"]:
-                        if inp_dict[umi_key]["Single_Hits"][sh_dir]:
-                            if n in inp_dict[umi_key]["Single_Hits"][sh_dir]:
-                                n_sup[sh_dir][n] += 1
-            # Sees if the dict "Mate Hits" is empty, if not, counts the no molecules supporting the variant for each
-            # dict within the "Mate Hits" dictionary
-            if inp_dict[umi_key]["Mate_Hits"]:
-                new_lst = list(inp_dict[umi_key]["Mate_Hits"].items())
-                new_dict = dict(new_lst[0:-7])
-                for v_h in new_dict:
-                    if new_dict[v_h]:
-                        for s_t in new_dict[v_h]:
-                            if new_dict[v_h][s_t]:
-                                if n in new_dict[v_h][s_t]:
-                                    n_sup["Paired"][s_t][n] += 1
-    return n_sup
+    return [int(cat_sup) for cat_sup in fam_cnt[0][cons_ind][:len(nuc_function.CAT_LST)]]
@@ -0,0 +1,127 @@
+from array import array
+import nuc_function
+
+
+class FamTable:
+    """ The FamTable class stores the classified UMI-families of a variant-record position as a compact table, in place
+    of a dict of nested dicts for every UMI. Every UMI is a row, stored as an index into a set of byte-sized columns:
+    the consensus nucleotide codes of its positive and negative strand, and its category code. Every column exists
+    twice, for the mate (cons_ind 0) and the singleton (cons_ind 1) consensus of the UMI.
+
+    Example table for a FFPE-artefact UMI followed by a UMI with reads on the positive strand only, with the umi-keys
+    generated by umi_parse:
+        fam_tbl.umi_ids = ["AAATTT_CCCGGG", "GGGAAA_TTTCCC"]
+        fam_tbl.pos_nuc[0] = array("b", [3, 1]), fam_tbl.neg_nuc[0] = array("b", [1, 16])
+        fam_tbl.cat[0] = array("b", [2, 5])
+    """
+    __slots__ = ("umi_ids", "pos_nuc", "neg_nuc", "cat")
+
+    def __init__(self):
+        self.umi_ids = []
+        self.pos_nuc = (array("b"), array("b"))
+        self.neg_nuc = (array("b"), array("b"))
+        self.cat = (array("b"), array("b"))
+
+    def __len__(self):
+        return len(self.umi_ids)
+
+    def add(self, umi_id, pos_str_cons, neg_str_cons, var_nuc, ref_nuc, ffpe_n):
+        """ The add method classifies a UMI-family from the pos_hits output of its strands, and appends it to the
+        table. A UMI with reads on both strands is classified by ffpe_code, whereas a UMI lacking reads on either
+        strand is stored with the category code CAT_NONE. The UMI is classified from its coded consensus nucleotides,
+        as reclass does, so that a base coded as N is classified as N for every alternative allele.
+
+        Args:
+            :param umi_id: The umi-key of the UMI-family
+            :param pos_str_cons: The pos_hits output of the positive strand, or None if the strand lacks reads
+            :param neg_str_cons: The pos_hits output of the negative strand, or None if the strand lacks reads
+            :param var_nuc: The nucleotide called in the variant-record
+            :param ref_nuc: The nucleotide found in the reference genome at the variant-call position
+            :param ffpe_n: Parameter determining if all mismatches should be classified as ffpe, or solely C:G>T:A
+        """
+        # The codes are computed before any column is appended to, keeping the columns aligned with umi_ids
+        nuc_codes = [(str_code(pos_str_cons, cons_ind), str_code(neg_str_cons, cons_ind)) for cons_ind in (0, 1)]
+        self.umi_ids.append(umi_id)
+        for cons_ind, (pos_code, neg_code) in enumerate(nuc_codes):
+            cat_code = nuc_function.CAT_NONE
+            if pos_str_cons and neg_str_cons:
+                cat_code = nuc_function.ffpe_code(nuc_function.nuc_decode(pos_code), nuc_function.nuc_decode(neg_code),
+                                                  var_nuc, ref_nuc, ffpe_n)
+            self.pos_nuc[cons_ind].append(pos_code)
+            self.neg_nuc[cons_ind].append(neg_code)
+            self.cat[cons_ind].append(cat_code)
+
+    def reclass(self, var_nuc, ref_nuc, ffpe_n):
+        """ The reclass method classifies the UMI-families of the table for another variant nucleotide, such as the
+        next alternative allele of a multi-allelic variant-record. The consensus nucleotides of every UMI are decoded
+        from the table rather than recomputed from its reads, and the returned table shares the UMI and consensus
+        columns of this table.
+
+        Args:
+            :param var_nuc: The nucleotide called in the variant-record
+            :param ref_nuc: The nucleotide found in the reference genome at the variant-call position
+            :param ffpe_n: Parameter determining if all mismatches should be classified as ffpe, or solely C:G>T:A
+
+        Returns:
+            :return: Returns a FamTable with the category codes of every UMI for the variant nucleotide
+        """
+        fam_tbl = FamTable()
+        fam_tbl.umi_ids = self.umi_ids
+        fam_tbl.pos_nuc = self.pos_nuc
+        fam_tbl.neg_nuc = self.neg_nuc
+        for cons_ind in (0, 1):
+            cat_arr = fam_tbl.cat[cons_ind]
+            for pos_code, neg_code in zip(self.pos_nuc[cons_ind], self.neg_nuc[cons_ind]):
+                cat_code = nuc_function.CAT_NONE
+                if pos_code != nuc_function.NUC_EMPTY and neg_code != nuc_function.NUC_EMPTY:
+                    cat_code = nuc_function.ffpe_code(nuc_function.nuc_decode(pos_code),
+                                                      nuc_function.nuc_decode(neg_code), var_nuc, ref_nuc, ffpe_n)
+                cat_arr.append(cat_code)
+        return fam_tbl
+
+    def fam_dict(self, cons_ind):
+        """ The fam_dict method rebuilds the nested dict of every UMI in the table, in the format var_extract returned
+        before the table was introduced, keyed by the umi-key. Used for inspecting the classification of
+        individual UMIs.
+
+        Args:
+            :param cons_ind: 0 for the mate consensus, 1 for the singleton consensus
+
+        Returns:
+            :return: Returns a dict with a single-hits and a mate-hits dict for every UMI
+            Example dict:
+            fam_dict[umi_key] = {"Single_Hits": {"Pos_Str_Single": {}, "Neg_Str_Single": {}},
+            "Mate_Hits": {"Reference_Hits": {}, "True_Variant_Hits": {}, "FFPE_Hits": {"Pos_Str": T, "Neg_Str": C},
+            "N_Hits": {}, "Del_Hits": {}, "Reference_Support": 0, "True_Variant_Support": 0, "FFPE_Support": 1,
+            "N_Support": 0, "Del_Support": 0}}
+        """
+        fam_res = {}
+        for umi_ind, umi_id in enumerate(self.umi_ids):
+            pos_code = self.pos_nuc[cons_ind][umi_ind]
+            neg_code = self.neg_nuc[cons_ind][umi_ind]
+            s_dict = {"Pos_Str_Single": {}, "Neg_Str_Single": {}}
+            n_dict = {}
+            if pos_code != nuc_function.NUC_EMPTY and neg_code != nuc_function.NUC_EMPTY:
+                n_dict = nuc_function.cat_dict(self.cat[cons_ind][umi_ind], nuc_function.nuc_decode(pos_code),
+                                               nuc_function.nuc_decode(neg_code))
+            elif pos_code != nuc_function.NUC_EMPTY:
+                s_dict["Pos_Str_Single"] = nuc_function.nuc_decode(pos_code)
+            else:
+                s_dict["Neg_Str_Single"] = nuc_function.nuc_decode(neg_code)
+            fam_res[umi_id] = {"Single_Hits": s_dict, "Mate_Hits": n_dict}
+        return fam_res
+
+
+def str_code(str_cons, cons_ind):
+    """ The str_code function converts the consensus nucleotide of a strand into its code in the UMI-family table.
+
+    Args:
+        :param str_cons: The pos_hits output of the strand, or None if the strand lacks reads
+        :param cons_ind: 0 for the mate consensus, 1 for the singleton consensus
+
+    Returns:
+        :return: Returns the integer code of the consensus nucleotide, NUC_EMPTY if the strand lacks reads
+    """
+    if str_cons is None:
+        return nuc_function.NUC_EMPTY
+    return nuc_function.nuc_code(str_cons[cons_ind])
@@ -0,0 +1,116 @@
+import nuc_function
+
+# Filters of the ReadFilter, in the order of the drop counts it returns
+FLT_LST = ("Flag", "MAPQ", "BaseQ")
+FLT_FLAG = 0
+FLT_MAPQ = 1
+FLT_BQ = 2
+
+
+class ReadFilter:
+    """ The ReadFilter class drops the reads of a variant-record position before they are grouped into UMI-families,
+    through the SAM flags and mapping quality of the read, and the base quality of the read at the position. The flag
+    and mapping quality checks are integer comparisons on the read, and are run before the UMI-tag of the read is
+    parsed, whereas the base quality requires the query index of the position and is solely looked up for reads
+    passing the other filters. The reads dropped by every filter are counted for every position.
+
+    Example filter dropping secondary, supplementary and QC-failed reads as well as reads with a MAPQ below 20:
+        read_flt = ReadFilter(min_mapq=20, exl_flags=0xB00)
+    """
+    __slots__ = ("min_mapq", "req_flags", "exl_flags", "min_bq")
+
+    def __init__(self, min_mapq=0, req_flags=0, exl_flags=0, min_bq=0):
+        self.min_mapq = min_mapq
+        self.req_flags = req_flags
+        self.exl_flags = exl_flags
+        self.min_bq = min_bq
+
+    def read_drop(self, read):
+        """ The read_drop method checks the SAM flags and mapping quality of a read, which do not depend on the
+        variant-record position.
+
+        Args:
+            :param read: Read of interest
+
+        Returns:
+            :return: Returns the index of the filter dropping the read in FLT_LST, or None if the read is kept
+        """
+        read_flag = read.flag
+        if read_flag & self.exl_flags or read_flag & self.req_flags != self.req_flags:
+            return FLT_FLAG
+        if read.mapping_quality < self.min_mapq:
+            return FLT_MAPQ
+
+    def bq_drop(self, read, rec_pos):
+        """ The bq_drop method checks the base quality of a read at the variant-record position. Reads without a
+        nucleotide aligned to the position, such as reads with a deletion at the position, are kept.
+
+        Args:
+            :param read: Read of interest
+            :param rec_pos: The 0-based position of the variant-record
+
+        Returns:
+            :return: Returns True if the base quality of the read at the position is below min_bq
+        """
+        try:
+            ind_pos = nuc_function.ref_query(read, rec_pos)
+        except ValueError:
+            return False
+        read_qual = read.query_qualities
+        return read_qual is not None and read_qual[ind_pos] < self.min_bq
+
+    def apply(self, rec_pos, bam_lst, umi_lst=None, nuc_lst=None):
+        """ The apply method drops the filtered reads of a variant-record position from the list of reads, along with
+        their entries in the lists of pre-parsed UMI-tags and nucleotides.
+
+        Args:
+            :param rec_pos: The 0-based position of the variant-record
+            :param bam_lst: List of reads overlapping the position
+            :param umi_lst: List of pre-parsed umi_parse output for the reads in bam_lst, or None
+            :param nuc_lst: List of the nucleotides of the reads in bam_lst at the position, or None
+
+        Returns:
+            :return: Returns a tuple of the kept reads, their umi_lst and nuc_lst entries (or None), and a tuple of
+            the no. reads dropped by every filter in FLT_LST
+            Example tuple for two reads of which the second is a secondary alignment:
+            ([read_1], None, None, (1, 0, 0))
+        """
+        drop_cnt = [0, 0, 0]
+        keep_inds = []
+        for read_ind, read in enumerate(bam_lst):
+            flt_ind = self.read_drop(read)
+            if flt_ind is None and self.min_bq > 0 and self.bq_drop(read, rec_pos):
+                flt_ind = FLT_BQ
+            if flt_ind is None:
+                keep_inds.append(read_ind)
+            else:
+                drop_cnt[flt_ind] += 1
+        if len(keep_inds) == len(bam_lst):
+            return bam_lst, umi_lst, nuc_lst, (0, 0, 0)
+        bam_lst = [bam_lst[read_ind] for read_ind in keep_inds]
+        if umi_lst is not None:
+            umi_lst = [umi_lst[read_ind] for read_ind in keep_inds]
+        if nuc_lst is not None:
+            nuc_lst = [nuc_lst[read_ind] for read_ind in keep_inds]
+        return bam_lst, umi_lst, nuc_lst, tuple(drop_cnt)
+
+
+def flt_maker(min_mapq=0, req_flags=0, exl_flags=0, min_bq=0):
+    """ The flt_maker function creates the ReadFilter of the input arguments, or None if every filter is disabled, in
+    which case the reads are not checked at all.
+
+    >>> flt_maker() is None
+    True
+
+    Args:
+        :param min_mapq: Min. mapping quality of a read
+        :param req_flags: SAM flags a read is required to have
+        :param exl_flags: SAM flags a read is dropped for having
+        :param min_bq: Min. base quality of a read at the variant-record position
+
+    Returns:
+        :return: Returns a ReadFilter, or None
+    """
+    if min_mapq <= 0 and req_flags == 0 and exl_flags == 0 and min_bq <= 0:
+        return
+    return ReadFilter(min_mapq, req_flags, exl_flags, min_bq)
@@ -5,64 +5,255 @@
 # Made for Klinisk Genetik, Uppsala Akademiska Sjukhus 2019
 
 # Imports modules
+import os
 import pysam
 import time
 import argparse
+import functools
 import threading
+import multiprocessing
 import queue
-from collections import deque
+import itertools
 import build_function
 import pos_function
+import pool_function
+import sweep_function
+import clust_function
+import cache_function
+import stat_function
+import arrow_function
+import out_function
+import flt_function
+import prof_function
+import ckpt_function
+import region_function
 
 
 class ProducerThread(threading.Thread):
-    def __init__(self, vcf_file, thr_que, target=None, name=None):
+    def __init__(self, vcf_file, thr_que, n_cons, fly_sem=None, stop_evt=None, target=None, name=None):
         super(ProducerThread, self).__init__()
         self.target = target
         self.name = name
         self.thr_que = thr_que
         self.vcf_file = vcf_file
+        self.n_cons = n_cons
+        self.fly_sem = fly_sem
+        self.stop_evt = stop_evt
+        self.error = None
 
     def run(self):
-        # Populates the thr_que if not full until every record in the vcf_file has been retrieved
-        for record in self.vcf_file:
-            self.thr_que.append(record)
+        # Populates the thr_que, blocking while it is full, until every record in the vcf_file has been retrieved,
+        # numbering the records in input order. Blocks while the max. no. records in flight has been reached, and stops
+        # once stop_evt is set by a failing record. An error reading the vcf_file is kept for the main thread
+        try:
+            for rec_ord, record in enumerate(self.vcf_file):
+                if self.stop_evt is not None and self.stop_evt.is_set():
+                    break
+                if self.fly_sem is not None:
+                    self.fly_sem.acquire()
+                self.thr_que.put((rec_ord, record))
+        except Exception as err:
+            self.error = err
+        finally:
+            # Ends every consumer through a sentinel, which is only reached once all records have been taken
+            for _ in range(self.n_cons):
+                self.thr_que.put(None)
+
+
+class OrderedWriter:
+    def __init__(self, n_vcf, max_pend, fly_sem=None, ann_wrt=None, ckpt_wrt=None):
+        self.n_vcf = n_vcf
+        self.max_pend = max_pend
+        self.fly_sem = fly_sem
+        self.ann_wrt = ann_wrt
+        self.ckpt_wrt = ckpt_wrt
+        self.nxt_ord = 0
+        self.pend = {}
+        self.cond = threading.Condition()
+        self.error = None
+        self.stop_evt = threading.Event()
+
+    def put(self, rec_ord, n_cop, samp_anns=None):
+        # Holds back the result of a record until every earlier record has been put, then writes all held back
+        # results that are next in input order. A result more than max_pend records ahead of the next record to be
+        # written waits until the writer has caught up, which bounds the no. results held back. A max_pend of 0 holds
+        # back any no. results, as for the queue size and the in-flight limit. The annotations of every sample are
+        # handed to the optional annotation writer along with the record, unless the record passed through unannotated,
+        # and every record written in order is reported to the optional checkpoint writer
+        with self.cond:
+            while self.error is None and 0 < self.max_pend <= rec_ord - self.nxt_ord:
+                self.cond.wait()
+            # Once a record has failed no result is written, and the record is no longer in flight
+            if self.error is not None:
+                if self.fly_sem is not None:
+                    self.fly_sem.release()
+                return
+            self.pend[rec_ord] = (n_cop, samp_anns)
+            while self.nxt_ord in self.pend:
+                n_cop, samp_anns = self.pend.pop(self.nxt_ord)
+                if n_cop is not None:
+                    self.n_vcf.write(n_cop)
+                    if self.ann_wrt is not None and samp_anns is not None:
+                        self.ann_wrt.add(n_cop, samp_anns)
+                self.nxt_ord += 1
+                if self.ckpt_wrt is not None:
+                    self.ckpt_wrt.done(1)
+                # The record is no longer in flight once written, allowing the producer to read another record
+                if self.fly_sem is not None:
+                    self.fly_sem.release()
+            self.cond.notify_all()
+
+    def fail(self, rec_ord, err):
+        # Stops the run at the first failing record: the error is kept for the main thread, the producer stops reading
+        # through stop_evt, and the held back results are dropped, so that neither the failing record nor any later
+        # record is written or reported to the checkpoint writer. The failing and dropped records are no longer in
+        # flight, and results waiting for the writer to catch up are released
+        with self.cond:
+            if self.error is None:
+                self.error = (rec_ord, err)
+                self.stop_evt.set()
+                if self.fly_sem is not None:
+                    for _ in self.pend:
+                        self.fly_sem.release()
+                self.pend.clear()
+            if rec_ord is not None and self.fly_sem is not None:
+                self.fly_sem.release()
+            self.cond.notify_all()
 
 
 class ConsumerThread(threading.Thread):
-    def __init__(self, bam_path, thr_que, res_que, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, target=None, name=None):
+    def __init__(self, bam_paths, thr_que, rec_wrt, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, backend="fetch",
+                 clu_fun=None, cache_size=0, samp_lst=None, fam_out=False, fmt_mode="packed", read_flt=None,
+                 call_prof=None, pass_idx=None, target=None, name=None):
         super(ConsumerThread, self).__init__()
         self.target = target
         self.name = name
         self.thr_que = thr_que
-        self.res_que = res_que
-        self.bam_path = bam_path
+        self.rec_wrt = rec_wrt
+        self.bam_paths = bam_paths
+        self.samp_lst = samp_lst
+        self.fam_out = fam_out
+        self.fmt_mode = fmt_mode
+        self.read_flt = read_flt
+        self.call_prof = call_prof
+        self.pass_idx = pass_idx
         self.ffpe_n = ffpe_n
         self.ext_fun = ext_fun
         self.spl_fun = spl_fun
         self.us_cha = q_spl_cha
         self.spl_cha = u_spl_cha
+        self.backend = backend
+        self.clu_fun = clu_fun
+        # Every BAM-file has a cache of its own, as the reads of different BAM-files may share their query-names
+        self.read_caches = [None] * len(bam_paths)
+        if cache_size > 0:
+            self.read_caches = [cache_function.ReadCache(cache_size) for _ in bam_paths]
 
     def run(self):
-        # Calls upon the function vcf_extract while the queue is not empty, stores the results in res_que if not None
-        bam_file = pysam.AlignmentFile(self.bam_path, "r", check_sq=False)
-        while self.thr_que:
-            record = self.thr_que.popleft()
-            # record = self.thr_que.get()
-            n_cop = build_function.vcf_extract(record, bam_file, self.ffpe_n, self.ext_fun, self.spl_fun, self.us_cha,
-                                               self.spl_cha)
-            if n_cop is not None:
-                self.res_que.put(n_cop)
+        # Annotates the records from the queue using the chosen backend until the sentinel is reached, and hands the
+        # annotated records to the writer, or None for records without annotation so that later records are not held
+        # back. In the multi-sample mode the record is annotated from the BAM-file of every sample. Records outside the
+        # regions of pass_idx are handed to the writer unannotated. A failing record stops the run through the writer,
+        # after which the remaining records are handed back unannotated until the sentinel, so that the producer is
+        # never left waiting. With --cProfile the first consumer to start is profiled, and its stats are dumped once it
+        # has reached the sentinel
+        if self.call_prof is not None:
+            self.call_prof.start()
+        try:
+            bam_files = [pysam.AlignmentFile(bam_path, "r", check_sq=False) for bam_path in self.bam_paths]
+        except Exception as err:
+            self.rec_wrt.fail(None, err)
+        while True:
+            que_item = self.thr_que.get()
+            if que_item is None:
+                break
+            rec_ord, record = que_item
+            if self.rec_wrt.stop_evt.is_set():
+                self.rec_wrt.put(rec_ord, None)
+                continue
+            if self.pass_idx is not None and not self.pass_idx.rec_in(record.chrom, record.start):
+                self.rec_wrt.put(rec_ord, record)
+                continue
+            n_cop = None
+            samp_anns = None
+            try:
+                rec_tpl = build_function.rec_tuple(record)
+                samp_anns = [sweep_function.sweep_annotate([rec_tpl], bam_file, self.ffpe_n, self.ext_fun,
+                                                           self.spl_fun, self.us_cha, self.spl_cha, self.backend,
+                                                           self.clu_fun, read_cache, self.fam_out,
+                                                           self.read_flt)[0]
+                             for bam_file, read_cache in zip(bam_files, self.read_caches)]
+                if self.samp_lst is not None:
+                    n_cop = build_function.samp_apply(record, self.samp_lst, samp_anns, self.fmt_mode)
+                elif samp_anns[0] is not None:
+                    n_cop = build_function.rec_apply(record, samp_anns[0], self.fmt_mode)
+            except Exception as err:
+                self.rec_wrt.fail(rec_ord, err)
+                continue
+            self.rec_wrt.put(rec_ord, n_cop, samp_anns)
+        if self.call_prof is not None:
+            self.call_prof.dump()
 
 
 def main():
     t_start = time.time()
 
     parser = argparse.ArgumentParser(description='FUSAC - FFPE-tissue UMI-based Sequence Artefact Classifier')
-    parser.add_argument('-b', '--inputBAM', help='Input BAM file (Required)', required=True)
+    parser.add_argument('-b', '--inputBAM', nargs='+', help='Input BAM file, or one BAM file for every sample given '
+                                                            'by --sampleNames (Required)', required=True)
     parser.add_argument('-v', '--inputVCF', help='Input VCF file (Required)', required=True)
+    parser.add_argument('-sn', '--sampleNames', nargs='+', help='VCF samples of the input BAM files in the same '
+                                                                'order, annotating every sample from its own BAM '
+                                                                'file. Default: every VCF sample from a single BAM '
+                                                                'file, or the VCF samples in order for several BAM '
+                                                                'files', required=False, default=None)
     parser.add_argument('-t', '--threads', help='No. threads to run the program (Optional)', required=False, default=1)
-    parser.add_argument('-qs', '--queueSize', help='Input Queue-Size (Optional)', required=False, default=0)
+    parser.add_argument('-qs', '--queueSize', help='Max. no. variant-records waiting in the thread mode queue, '
+                                                   '0 for no limit (Optional)', required=False, default=100)
+    parser.add_argument('-mi', '--maxInFlight', help='Max. no. variant-records read from the VCF but not yet written '
+                                                     'in thread mode, 0 for no limit (Optional)',
+                        required=False, default=1000)
+    parser.add_argument('-rb', '--reorderBuffer', help='Max. no. finished variant-records held back in thread mode '
+                                                       'while waiting for an earlier record to finish, 0 for no limit '
+                                                       '(Optional)',
+                        required=False, default=1000)
+    parser.add_argument('-m', '--mode', help='Execution mode, "process" runs --threads worker processes instead of '
+                                             'threads. Default: thread, Alternative: process',
+                        required=False, default="thread")
+    parser.add_argument('-cs', '--chunkSize', help='No. variant-records sent to a worker process at a time '
+                                                   '(Optional)', required=False, default=50)
+    parser.add_argument('-be', '--backend', help='Backend used for extracting the nucleotide of every read at the '
+                                                 'variant position, "pileup" uses the htslib pileup engine. '
+                                                 'Default: fetch, Alternative: pileup',
+                        required=False, default="fetch")
+    parser.add_argument('-rc', '--readCache', help='Max. no. reads held by the per-read cache of every thread in '
+                                                   'thread mode, worthwhile for densely spaced variant-records. '
+                                                   'Default: 0 (disabled), Alternative: Any integer',
+                        required=False, default=0)
+    parser.add_argument('-ss', '--shardSize', help='Max. no. bases in a genomic shard when running in process mode '
+                                                   'with an indexed VCF, 0 disables sharding (Optional)',
+                        required=False, default=1000000)
+    parser.add_argument('-uc', '--umiClustering', help='Merges UMI-families whose UMI-tags differ by at most '
+                                                       '--umiDistance nucleotides, "hamming" merges all such UMIs, '
+                                                       '"directional" uses the directional adjacency method. '
+                                                       'Default: none, Alternative: hamming, directional',
+                        required=False, default="none")
+    parser.add_argument('-ud', '--umiDistance', help='Max. Hamming distance between UMI-tags merged by '
+                                                     '--umiClustering (Optional)', required=False, default=1)
+    parser.add_argument('-mq', '--minMapq', help='Min. mapping quality of the reads grouped into UMI-families. '
+                                                 'Default: 0 (Optional)',
+                        required=False, default=0)
+    parser.add_argument('-rf', '--requireFlags', help='SAM flags the reads grouped into UMI-families are required to '
+                                                      'have, as an integer or hex value. Default: 0 (Optional)',
+                        required=False, default="0")
+    parser.add_argument('-xf', '--excludeFlags', help='SAM flags for which reads are dropped before they are grouped '
+                                                      'into UMI-families, as an integer or hex value, such as 0xB00 '
+                                                      'for secondary, supplementary and QC-failed reads. '
+                                                      'Default: 0 (Optional)',
+                        required=False, default="0")
+    parser.add_argument('-mbq', '--minBaseQuality', help='Min. base quality of the reads at the variant position. '
+                                                         'Default: 0 (Optional)',
+                        required=False, default=0)
     parser.add_argument('-fn', '--ffpeNucleotides', help='Choose "all" to include all base transitions in the analysis,'
                                                          'Default: C:G>T:A, Alternative: All',
                         required=False, default="standard")
@@ -87,15 +278,112 @@ def main():
                                                                     'to filter the results when generating the output '
                                                                     'CSV-file based on FFPE VAF range',
                         required=False, default=["0", "100"])
+    parser.add_argument('-o', '--output', help='Output VCF file, written as bgzipped VCF for .vcf.gz, as BCF for .bcf, '
+                                               'and as uncompressed VCF otherwise. Default: fusac_output.vcf',
+                        required=False, default="fusac_output.vcf")
+    parser.add_argument('-cl', '--compressionLevel', help='Compression level of the bgzipped VCF or BCF output, from 0 '
+                                                          'to 9. Default: -1 (htslib default)',
+                        required=False, default=-1)
+    parser.add_argument('-ix', '--index', help='Index created for the bgzipped VCF or BCF output: "auto" for TBI for '
+                                               'bgzipped VCF and CSI for BCF, "tbi", "csi" or "no". Requires a sorted '
+                                               'input VCF file. Default: auto',
+                        required=False, default="auto")
+    parser.add_argument('-wt', '--writeThreads', help='No. htslib threads compressing the bgzipped VCF or BCF output '
+                                                      'alongside the annotation. Default: 1 (Optional)',
+                        required=False, default=1)
+    parser.add_argument('-ff', '--formatFields', help='FORMAT fields of the output VCF file, "packed" for the UMI and '
+                                                      'SUMI strings, "typed" for an Integer field for every value of '
+                                                      'the strings (UMI_REF, UMI_ALT, UMI_FFPE, ...), or "both". '
+                                                      'Default: packed',
+                        required=False, default="packed")
+    parser.add_argument('-pq', '--parquetOutput', help='Prefix of the columnar Parquet output, written alongside the '
+                                                       'output VCF file as <prefix>_variants.parquet with the UMI and '
+                                                       'SUMI support of every sample and alternative allele as integer '
+                                                       'columns. Requires pyarrow. Default: none (Optional)',
+                        required=False, default="none")
+    parser.add_argument('-pf', '--parquetFamilies', help='Also write <prefix>_families.parquet with the consensus '
+                                                         'nucleotides and variant type of every UMI-family, when '
+                                                         'running with --parquetOutput. Default: no, Alternative: yes',
+                        required=False, default="no")
+    parser.add_argument('-pr', '--profile', help='Path of a JSON metrics file with the time spent in, and the no. '
+                                                 'calls of, every stage of the run (VCF read, BAM fetch, UMI parse, '
+                                                 'grouping, consensus, classification, formatting, write, CSV) for '
+                                                 'every worker thread or process. Default: none (Optional)',
+                        required=False, default="none")
+    parser.add_argument('-cp', '--cProfile', help='Path of a pstats file with the cProfile stats of a single worker '
+                                                  'thread or process. Default: none (Optional)',
+                        required=False, default="none")
+    parser.add_argument('-ci', '--checkpointInterval', help='Seconds between the checkpoints of the progress of the '
+                                                            'run, saved next to the output VCF file as <output>.ckpt '
+                                                            'and removed once the run has finished, 0 disables the '
+                                                            'checkpoints. A compressed output is solely checkpointed '
+                                                            'up to its last BGZF block on disk. Default: 60 (Optional)',
+                        required=False, default=60)
+    parser.add_argument('-re', '--resume', help='Resumes a run ended early from its checkpoint, annotating solely the '
+                                                'variant-records left after the checkpoint, with the same input and '
+                                                'output options, or discards the checkpoint with "no". Required when '
+                                                'the checkpoint of an earlier run exists. Default: none, '
+                                                'Alternative: yes, no',
+                        required=False, default="none")
+    parser.add_argument('-rg', '--regions', help='Path of a BED file of the target regions, solely the variant-records '
+                                                 'within the regions are annotated, fetched through the VCF index when '
+                                                 'indexed. Default: none (Optional)',
+                        required=False, default="none")
+    parser.add_argument('-ot', '--offTarget', help='Handling of the variant-records outside the --regions, "drop" '
+                                                   'leaves them out of the output, "pass" writes them unannotated. '
+                                                   'Default: drop, Alternative: pass',
+                        required=False, default="drop")
 
     args = vars(parser.parse_args())
-    thr_que = deque([0]*int(args["queueSize"]))
+    thr_que = queue.Queue(int(args["queueSize"]))
+    max_fly = int(args["maxInFlight"])
     ffpe_n = str(args["ffpeNucleotides"])
     umi_pos = str(args["umiPosition"])
     u_spl_cha = str(args["UMISplitCharacter"])
     q_spl_cha = str(args["QrnSplitCharacter"])
     cf_arg = str(args["csvFile"])
     per_exl = args["percentageExclude"]
+    run_mode = str(args["mode"])
+    backend = str(args["backend"])
+    clu_mode = str(args["umiClustering"])
+    pq_out = str(args["parquetOutput"])
+    prof_path = str(args["profile"])
+    cprof_path = str(args["cProfile"])
+    fmt_mode = str(args["formatFields"])
+    out_path = str(args["output"])
+    idx_type = str(args["index"])
+    if idx_type not in out_function.IDX_TYPES:
+        parser.error("the index must be one of " + ", ".join(out_function.IDX_TYPES))
+    if fmt_mode not in build_function.FMT_MODES:
+        parser.error("the format fields must be one of " + ", ".join(build_function.FMT_MODES))
+    fam_out = pq_out != "none" and str(args["parquetFamilies"]) == "yes"
+    if pq_out != "none" and arrow_function.pa is None:
+        parser.error("the Parquet output requires pyarrow, install it or run without --parquetOutput")
+    bed_path = str(args["regions"])
+    off_mode = str(args["offTarget"])
+    if off_mode not in ("drop", "pass"):
+        parser.error("the off-target mode must be one of drop, pass")
+    ckpt_int = float(args["checkpointInterval"])
+    ckpt_path = out_path + ckpt_function.CKPT_EXT
+    part_path = out_path + ckpt_function.PART_EXT
+    res_mode = str(args["resume"])
+    if res_mode not in ("none", "yes", "no"):
+        parser.error("the resume mode must be one of yes, no")
+    if res_mode == "yes" and pq_out != "none":
+        parser.error("a resumed run cannot append to the Parquet output, run without --parquetOutput")
+    # The checkpoint of an earlier run is solely resumed or discarded on request, rather than overwritten by a rerun
+    if res_mode == "none" and (os.path.exists(ckpt_path) or os.path.exists(part_path)):
+        parser.error("the checkpoint " + ckpt_path + " of an earlier run exists, resume it with --resume yes or "
+                     "discard it with --resume no")
+
+    # The read filter is None when every filter is disabled, in which case the reads are not checked
+    read_flt = flt_function.flt_maker(int(args["minMapq"]), int(str(args["requireFlags"]), 0),
+                                      int(str(args["excludeFlags"]), 0), int(args["minBaseQuality"]))
+
+    # The clustering function is a partial of a module-level function, which keeps it picklable for the process mode
+    clu_fun = None
+    if clu_mode in clust_function.CLUST_LST:
+        clu_fun = functools.partial(clust_function.umi_clust, max_dist=int(args["umiDistance"]), method=clu_mode)
 
     if umi_pos == "qrn":
         ext_fun = pos_function.qrn_ext
@@ -108,46 +396,221 @@ def main():
     else:
         spl_fun = pos_function.cha_splt
 
-    res_que = queue.Queue()
     vcf_file = pysam.VariantFile(args['inputVCF'], "r")
-    bam_path = args['inputBAM']
+    bam_paths = args['inputBAM']
     vcf_head = vcf_file.header
+    # Several BAM-files, or named samples, annotate every sample from its own BAM-file in a single pass over the VCF
+    samp_lst = args["sampleNames"]
+    if samp_lst is None and len(bam_paths) > 1:
+        samp_lst = list(vcf_head.samples)
+    if samp_lst is not None:
+        if len(samp_lst) != len(bam_paths):
+            parser.error("the no. samples (" + str(len(samp_lst)) + ") does not match the no. BAM files (" +
+                         str(len(bam_paths)) + ")")
+        for sample in samp_lst:
+            if sample not in vcf_head.samples:
+                parser.error("the sample " + sample + " does not exist in the VCF file")
     # Generates a new filter category as well as two new format categories for the generated output
     vcf_head.filters.add('FFPE', None, None, 'FFPE Artefact')
-    vcf_head.formats.add("UMI", ".", "String", "Paired mate information for variant then reference "
-                                               "Paired ref;Paired var;Single ref: Single var")
-    vcf_head.formats.add("SUMI", ".", "String", "Singleton information for variant then reference "
-                                                "Paired ref;Paired var;Single ref: Single var")
-
-    n_vcf = pysam.VariantFile('fusac_output.vcf', mode='w', header=vcf_head)
-
-    # Starts the producer thread to populate the queue
-    p_que = ProducerThread(name='producer', vcf_file=vcf_file, thr_que=thr_que)
-    p_que.start()
-    threads = []
-    for t in range(int(args["threads"])):
-        threads.append(ConsumerThread(name='consumer', bam_path=bam_path, thr_que=thr_que, res_que=res_que,
-                                      ffpe_n=ffpe_n, ext_fun=ext_fun, spl_fun=spl_fun, q_spl_cha=q_spl_cha,
-                                      u_spl_cha=u_spl_cha))
-
-    # Starts the consumer thread to generate output from the queue
-    for t in threads:
-        t.start()
-    p_que.join()
-    for t in threads:
-        t.join()
-
-    # Writes the consumer output to the vcf-file
-    while not res_que.empty():
-        n_vcf.write(res_que.get())
-        if res_que.empty():
-            n_vcf.close()
+    # The UMI and SUMI fields hold the support of every alternative allele of multi-allelic records
+    build_function.fmt_header(vcf_head, fmt_mode, read_flt is not None)
+
+    # The target regions are merged into an interval index, which drives the fetches of the indexed VCF-file when the
+    # off-target records are dropped, and solely selects the records to annotate when they pass through
+    reg_idx = None
+    pass_idx = None
+    if bed_path != "none":
+        try:
+            bed_idx = region_function.bed_read(bed_path)
+        except (OSError, ValueError) as bed_err:
+            parser.error(str(bed_err))
+        print("Target regions: " + str(len(bed_idx)) + " merged regions of " + str(bed_idx.bases()) + " bases")
+        if vcf_head.contigs and not any(contig in bed_idx for contig in vcf_head.contigs):
+            print("WARNING: None of the contigs of the BED file " + bed_path + " are in the VCF file")
+        if off_mode == "pass":
+            pass_idx = bed_idx
+        else:
+            reg_idx = bed_idx
+            if vcf_file.index is None:
+                print("WARNING: The VCF file is not indexed, every variant-record is read to find those within the "
+                      "regions")
 
+    # The checkpoint of the resumed run is required to share the input and output options of the run
+    run_info = ckpt_function.ckpt_info(args)
+    ckpt_dict = None
+    if res_mode == "yes":
+        ckpt_dict = ckpt_function.ckpt_load(ckpt_path)
+        if ckpt_dict is None:
+            print("WARNING: No checkpoint " + ckpt_path + " was found, every variant-record is annotated")
+        else:
+            ckpt_diff = ckpt_function.ckpt_check(ckpt_dict, run_info)
+            if ckpt_diff is not None:
+                parser.error("the " + ckpt_diff + " differs from the run of the checkpoint " + ckpt_path)
+    use_shards = run_mode == "process" and vcf_file.index is not None and int(args["shardSize"]) > 0
+    if ckpt_dict is not None:
+        if ckpt_dict["shards"] is not None and not use_shards:
+            parser.error("the checkpoint " + ckpt_path + " was written in the sharded process mode, resume it with "
+                         "--mode process and the indexed VCF file")
+        # Records finished in input order cannot be mapped onto shards, the resumed run then runs in chunks
+        if ckpt_dict["shards"] is None and use_shards:
+            use_shards = False
+    # The partial output of the checkpoint is moved aside before the output is opened, and the run is resumed from
+    # the latest mark of the checkpoint that has reached the partial output
+    ckpt_marks = None
+    n_shards = 0
+    shard_lst = None
+    if ckpt_dict is not None:
+        ckpt_function.out_part(out_path)
+        ckpt_marks = ckpt_function.part_mark(part_path, ckpt_dict["marks"])
+        n_shards = ckpt_marks[-1][1]
+        shard_lst = ckpt_dict["shards"]
+        print("Resuming from the checkpoint " + ckpt_path + ": " + str(ckpt_marks[-1][0]) +
+              " variant-records finished")
+    else:
+        # A run with --resume no discards the checkpoint and partial output of an earlier run
+        for old_path in (ckpt_path, part_path):
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    # The shards are saved by the checkpoint, so that a resumed run continues with the same shards
+    if use_shards and (ckpt_int > 0 or ckpt_dict is not None):
+        if shard_lst is None:
+            with pysam.AlignmentFile(bam_paths[0], "r", check_sq=False) as bam_file:
+                shard_lst = pool_function.shard_maker(vcf_file, bam_file, int(args["shardSize"]),
+                                                      4 * int(args["threads"]), reg_idx)
+        run_info["shards"] = [list(shard) for shard in shard_lst]
+        shard_lst = [tuple(shard) for shard in shard_lst[n_shards:]]
+
+    # The stage timers solely replace the functions of every stage when profiling, leaving them untouched otherwise
+    if prof_path != "none":
+        prof_function.prof_install()
+
+    n_vcf = out_function.out_open(out_path, vcf_head, int(args["compressionLevel"]), int(args["writeThreads"]))
+    vcf_out = n_vcf
+    if prof_path != "none":
+        vcf_out = prof_function.ProfWriter(n_vcf)
+    # The statistics CSV-files are written alongside the output VCF-file, as every annotated record is written
+    rec_out = vcf_out
+    stat_wrt = None
     if cf_arg == "yes":
-        with pysam.VariantFile("fusac_output.vcf", "r") as fum_out:
-            build_function.csv_maker(fum_out, ffpe_n, per_exl)
+        stat_wrt = stat_function.StatWriter(vcf_out, ffpe_n, per_exl)
+        rec_out = stat_wrt
+    # The Parquet-files are written from the annotations of every record, as it is written to the output VCF-file
+    ann_wrt = None
+    if pq_out != "none":
+        ann_wrt = arrow_function.ArrowWriter(pq_out, samp_lst if samp_lst is not None else [None], fam_out)
+    # The checkpoint writer counts the written records, and saves a checkpoint every ckpt_int seconds
+    ckpt_wrt = None
+    if ckpt_int > 0 or ckpt_dict is not None:
+        ckpt_wrt = ckpt_function.CkptWriter(rec_out, n_vcf, ckpt_path, run_info,
+                                            ckpt_int if ckpt_int > 0 else float("inf"), ckpt_marks)
+        rec_out = ckpt_wrt
+    # The variant-records within the regions are fetched region by region from an indexed VCF-file
+    vcf_itr = vcf_file
+    if reg_idx is not None:
+        if vcf_file.index is not None:
+            vcf_itr = region_function.region_records(vcf_file, reg_idx)
+        else:
+            vcf_itr = region_function.region_filter(vcf_file, reg_idx)
+    # The written records of the mark are copied from the partial output, which is removed once they are saved
+    if ckpt_dict is not None:
+        ckpt_function.out_copy(part_path, rec_out, ckpt_marks[-1][2])
+        ckpt_wrt.save()
+        os.remove(part_path)
+        vcf_itr = itertools.islice(vcf_itr, ckpt_marks[-1][0], None)
+
+    prof_items = ()
+    if run_mode == "process":
+        # The workers report their stage stats through a dict shared with the main process, and a single worker
+        # claims the lock of the cProfile stats
+        prof_hook = None
+        prof_mgr = None
+        if prof_path != "none" or cprof_path != "none":
+            prof_dict = None
+            if prof_path != "none":
+                prof_mgr = multiprocessing.Manager()
+                prof_dict = prof_mgr.dict()
+            call_prof = None
+            if cprof_path != "none":
+                call_prof = prof_function.CallProf(cprof_path, multiprocessing.Lock())
+            prof_hook = prof_function.PoolProf(prof_dict, call_prof)
+        fus_opts = {"ffpe_n": ffpe_n, "ext_fun": ext_fun, "spl_fun": spl_fun, "q_spl_cha": q_spl_cha,
+                    "u_spl_cha": u_spl_cha, "backend": backend,
+                    "clu_fun": clu_fun, "fam_out": fam_out, "fmt_mode": fmt_mode,
+                    "read_flt": read_flt, "prof_hook": prof_hook, "reg_idx": reg_idx, "pass_idx": pass_idx}
+        if use_shards:
+            pool_function.shard_run(vcf_file, rec_out, args['inputVCF'], bam_paths, int(args["threads"]),
+                                    int(args["shardSize"]), fus_opts, samp_lst, ann_wrt, shard_lst, ckpt_wrt)
+        else:
+            pool_function.pool_run(vcf_itr, rec_out, bam_paths, int(args["threads"]), int(args["chunkSize"]),
+                                   fus_opts, samp_lst, ann_wrt, ckpt_wrt)
+        n_vcf.close()
+        if prof_mgr is not None:
+            prof_items = list(prof_hook.prof_dict.values())
+            prof_mgr.shutdown()
+    else:
+        # The semaphore bounds the no. records read from the VCF but not yet written to the output
+        fly_sem = None
+        if max_fly > 0:
+            fly_sem = threading.BoundedSemaphore(max_fly)
+        # Writes the consumer output to the vcf-file in input order as soon as it is available
+        rec_wrt = OrderedWriter(rec_out, int(args["reorderBuffer"]), fly_sem, ann_wrt, ckpt_wrt)
+        # Starts the producer thread to populate the queue, until a record fails
+        if prof_path != "none":
+            vcf_itr = prof_function.prof_iter("vcf_read", vcf_itr)
+        p_que = ProducerThread(name='producer', vcf_file=vcf_itr, thr_que=thr_que, n_cons=int(args["threads"]),
+                               fly_sem=fly_sem, stop_evt=rec_wrt.stop_evt)
+        p_que.start()
+        call_prof = None
+        if cprof_path != "none":
+            call_prof = prof_function.CallProf(cprof_path, threading.Lock())
+        threads = []
+        for t in range(int(args["threads"])):
+            threads.append(ConsumerThread(name='consumer-' + str(t + 1), bam_paths=bam_paths, thr_que=thr_que,
+                                          rec_wrt=rec_wrt, ffpe_n=ffpe_n, ext_fun=ext_fun, spl_fun=spl_fun,
+                                          q_spl_cha=q_spl_cha, u_spl_cha=u_spl_cha, backend=backend, clu_fun=clu_fun,
+                                          cache_size=int(args["readCache"]), samp_lst=samp_lst,
+                                          fam_out=fam_out, fmt_mode=fmt_mode,
+                                          read_flt=read_flt, call_prof=call_prof, pass_idx=pass_idx))
+
+        # Starts the consumer thread to generate output from the queue
+        for t in threads:
+            t.start()
+        p_que.join()
+        for t in threads:
+            t.join()
+        # A failing record, or VCF-file, ends the run with an error as in the process mode, leaving the checkpoint of
+        # the records written before it
+        if rec_wrt.error is not None:
+            rec_ord, err = rec_wrt.error
+            if rec_ord is None:
+                raise RuntimeError("A consumer thread could not be started") from err
+            raise RuntimeError("Variant-record " + str(rec_ord + 1) + " could not be annotated") from err
+        if p_que.error is not None:
+            raise p_que.error
+        n_vcf.close()
+        # Reports the hit/miss statistics of the per-read cache of every consumer
+        for t_ind, t in enumerate(threads):
+            for bam_path, read_cache in zip(bam_paths, t.read_caches):
+                if read_cache is not None:
+                    print("Read cache of thread " + str(t_ind + 1) + " (" + bam_path + "): " + read_cache.stats())
+
+    # The output can solely be indexed once it has been closed
+    idx_path = out_function.out_index(out_path, idx_type)
+    if idx_path is not None:
+        print("Indexed the output: " + idx_path)
+    if stat_wrt is not None:
+        stat_wrt.close()
+    if ann_wrt is not None:
+        ann_wrt.close()
+    # The checkpoint is removed once every output has been written
+    if ckpt_wrt is not None:
+        ckpt_wrt.close()
 
     t_end = time.time()
+    if prof_path != "none":
+        run_info = {"mode": run_mode, "threads": int(args["threads"]), "backend": backend, "output": out_path}
+        prof_function.prof_dump(prof_path, t_end - t_start, run_info, prof_items)
+        print("Wrote the stage timings: " + prof_path)
     print("Total runtime: " + str(t_end - t_start) + "s")
 
 
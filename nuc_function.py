@@ -1,3 +1,41 @@
+# CIGAR operations consuming both the query and the reference (M, =, X), only the query (I, S), or only the reference
+# (D, N). Hard clips (H) and padding (P) consume neither
+CIG_MATCH = (0, 7, 8)
+CIG_QUERY = (1, 4)
+CIG_REF = (2, 3)
+# Insertions (I) and skipped regions (N), among the operations consuming only the query or only the reference
+CIG_INS = 1
+CIG_SKIP = 3
+
+# Symbols of the reads matching the reference or an alternative allele of a multi-base variant-record, as called by
+# allele_call, which take the place of the nucleotides of a SNV. ALT_SYMS holds a symbol for every alternative allele
+# of a multi-allelic record, of which multi-base records with more than MAX_ALTS alternative alleles are not classified
+MAX_ALTS = 8
+REF_SYM = "Ref"
+ALT_SYMS = ("Alt",) + tuple("Alt" + str(alt_ind) for alt_ind in range(2, MAX_ALTS + 1))
+ALT_SYM = ALT_SYMS[0]
+# Nucleotides of which a multi-base allele may consist
+ALLELE_NUC = frozenset("ACGTN")
+
+# Integer codes of the consensus nucleotides stored in the UMI-family table. NUC_NONE codes a strand with reads but
+# without a consensus nucleotide, and NUC_EMPTY a strand without any reads
+NUC_LST = ("A", "C", "G", "T", "N", "-", REF_SYM) + ALT_SYMS
+NUC_CODES = {nuc: nuc_ind for nuc_ind, nuc in enumerate(NUC_LST)}
+NUC_N = NUC_CODES["N"]
+NUC_NONE = len(NUC_LST)
+NUC_EMPTY = NUC_NONE + 1
+
+# Integer codes of the variant types of a UMI, in the order of the variant-type support in the UMI and SUMI fields.
+# CAT_NONE codes a UMI which could not be classified, such as a UMI lacking reads on either strand
+CAT_LST = ("Reference", "True_Variant", "FFPE", "N", "Del")
+CAT_REF = 0
+CAT_VAR = 1
+CAT_FFPE = 2
+CAT_N = 3
+CAT_DEL = 4
+CAT_NONE = 5
+
+
 def nuc_check(read, rec_pos):
     """ The nuc\_check function checks the variant-record position against the supplemented read, and then extracts
     the nucleotide belonging to this position in the read. Returns the nucleotide in the read mapping against
@@ -14,23 +52,197 @@ def nuc_check(read, rec_pos):
         :raises ValueError: If a ValueError is found, the function returns nothing
     """
     try:
-        # Gets the positions the sequence maps to in the reference
-        # Full length with soft clips is required for the index selection to be correct, nucleotides are always returned
-        # as they would be on the plus strand
-        # for any reverse strand
-        read_pos = read.get_reference_positions(full_length=True)
-        # Gets the index of the position the sequence maps to
-        ind_pos = read_pos.index(rec_pos)
-        # Obtains the query sequence (the sequence as it were read), reverse complemented if in reverse strand
-        read_seq = read.query_sequence
-        read_seq = list(read_seq)
+        # Gets the index of the query position the variant position maps to, nucleotides are always returned as they
+        # would be on the plus strand for any reverse strand
+        ind_pos = ref_query(read, rec_pos)
         # Gets the nucleotide present at the index position of the variant
-        read_nuc = read_seq[ind_pos]
+        read_nuc = read.query_sequence[ind_pos]
         return read_nuc
     except ValueError:
         pass
 
 
+def ref_query(read, rec_pos):
+    """ The ref_query function maps a reference position to the index of the query nucleotide aligned to it, through
+    walking the CIGAR operations of the read. The index includes any soft clipped nucleotides, equal to the index of
+    the position in get_reference_positions(full_length=True), without generating the list.
+
+    Args:
+        :param read: Input read
+        :param rec_pos: The position of the called variant in the reference genome
+
+    Returns:
+        :return: Returns the index of the query nucleotide aligned to the position
+
+    Raises:
+        :raises ValueError: Raises a ValueError if no query nucleotide is aligned to the position, as for positions
+        outside the read, or within a deletion or a skipped region
+    """
+    ref_pos = read.reference_start
+    cig_tpls = read.cigartuples
+    if ref_pos is None or ref_pos < 0 or rec_pos < ref_pos or not cig_tpls:
+        raise ValueError(rec_pos)
+    query_pos = 0
+    for cig_op, cig_len in cig_tpls:
+        if cig_op in CIG_MATCH:
+            if rec_pos < ref_pos + cig_len:
+                return query_pos + rec_pos - ref_pos
+            ref_pos += cig_len
+            query_pos += cig_len
+        elif cig_op in CIG_QUERY:
+            query_pos += cig_len
+        elif cig_op in CIG_REF:
+            ref_pos += cig_len
+            if rec_pos < ref_pos:
+                break
+    raise ValueError(rec_pos)
+
+
+def ref_map(read):
+    """ The ref_map function maps the reference positions of a read to the index of the query nucleotides aligned to
+    them, as a tuple of aligned blocks. Walks the CIGAR operations of the read as ref_query does, so that map_nuc
+    returns the nucleotide of the same index for any position.
+
+    Args:
+        :param read: Read of interest
+
+    Returns:
+        :return: Returns a tuple with the reference start, reference end and query start of every aligned block
+        Example tuple for a read at position 100 with the CIGAR 2S10M1D5M:
+        ((100, 110, 2), (111, 116, 12))
+    """
+    ref_pos = read.reference_start
+    cig_tpls = read.cigartuples
+    if ref_pos is None or ref_pos < 0 or not cig_tpls:
+        return ()
+    blk_lst = []
+    query_pos = 0
+    for cig_op, cig_len in cig_tpls:
+        if cig_op in CIG_MATCH:
+            blk_lst.append((ref_pos, ref_pos + cig_len, query_pos))
+            ref_pos += cig_len
+            query_pos += cig_len
+        elif cig_op in CIG_QUERY:
+            query_pos += cig_len
+        elif cig_op in CIG_REF:
+            ref_pos += cig_len
+    return tuple(blk_lst)
+
+
+def map_nuc(read, read_map, rec_pos):
+    """ The map_nuc function is an alternative to nuc_check, which looks up the query index of the position in the
+    ref_map output of the read instead of walking its CIGAR operations.
+
+    Args:
+        :param read: Read of interest
+        :param read_map: The ref_map output of the read
+        :param rec_pos: The position of the called variant in the reference genome
+
+    Returns:
+        :return: Returns the nucleotide in the read mapping against the variant-record position, or None if no
+        nucleotide is aligned to the position
+    """
+    for blk_start, blk_end, query_pos in read_map:
+        if rec_pos < blk_start:
+            return
+        if rec_pos < blk_end:
+            return read.query_sequence[query_pos + rec_pos - blk_start]
+
+
+def allele_check(read, rec_pos, ref_allele, alt_allele):
+    """ The allele_check function is the counterpart of nuc_check for multi-base variant-records (indels and MNVs),
+    calling whether a read matches the reference allele, the alternative allele, or neither. Calls allele_call with
+    the alternative allele as the single alternative allele of the record.
+
+    Args:
+        :param read: Input read
+        :param rec_pos: The 0-based position of the first nucleotide of the reference allele
+        :param ref_allele: The reference allele of the variant-record
+        :param alt_allele: The alternative allele of the variant-record
+
+    Returns:
+        :return: Returns REF_SYM or ALT_SYM for a read matching the reference or the alternative allele, "N" for a
+        read matching neither allele, or None for a read not spanning the reference allele
+        Example output for a read carrying the deletion of the variant-record CAT>C:
+        "Alt"
+    """
+    return allele_call(read, rec_pos, ref_allele, (alt_allele,))
+
+
+def allele_call(read, rec_pos, ref_allele, alt_alleles):
+    """ The allele_call function calls which allele of a multi-base variant-record a read matches, for any no.
+    alternative alleles. The CIGAR operations of the read are walked to find the query nucleotides aligned to the
+    reference span of the reference allele, including the insertions following any position of the span and excluding
+    the deleted positions. As the alignment is monotonic these nucleotides form a single query interval, which is
+    compared to the alleles. The interval is solely sliced from the query sequence if its length matches an allele, so
+    long indels never cause the query sequence to be sliced or compared nucleotide by nucleotide beyond the length of
+    the alleles. The interval is found once, however many alternative alleles the record has.
+
+    Args:
+        :param read: Input read
+        :param rec_pos: The 0-based position of the first nucleotide of the reference allele
+        :param ref_allele: The reference allele of the variant-record
+        :param alt_alleles: Tuple of the alternative alleles of the variant-record, at most MAX_ALTS
+
+    Returns:
+        :return: Returns REF_SYM, or the ALT_SYMS symbol of the first matching alternative allele, for a read matching
+        an allele of the record, "N" for a read matching no allele, or None for a read not spanning the reference
+        allele
+        Example output for a read carrying the insertion of the variant-record C>T,CAA:
+        "Alt2"
+    """
+    ref_pos = read.reference_start
+    cig_tpls = read.cigartuples
+    span_end = rec_pos + len(ref_allele)
+    if ref_pos is None or ref_pos < 0 or rec_pos < ref_pos or not cig_tpls:
+        return
+    query_pos = 0
+    span_start = None
+    span_stop = None
+    for cig_op, cig_len in cig_tpls:
+        if ref_pos > span_end:
+            break
+        if cig_op in CIG_MATCH:
+            # Aligned nucleotides within the span extend the query interval
+            ovl_start = max(ref_pos, rec_pos)
+            ovl_end = min(ref_pos + cig_len, span_end)
+            if ovl_start < ovl_end:
+                if span_start is None:
+                    span_start = query_pos + ovl_start - ref_pos
+                span_stop = query_pos + ovl_end - ref_pos
+            ref_pos += cig_len
+            query_pos += cig_len
+        elif cig_op in CIG_QUERY:
+            # Inserted nucleotides follow the reference position before them, soft clips never lie within the span
+            if cig_op == CIG_INS and rec_pos < ref_pos <= span_end:
+                if span_start is None:
+                    span_start = query_pos
+                span_stop = query_pos + cig_len
+            query_pos += cig_len
+        elif cig_op in CIG_REF:
+            if ref_pos < span_end and ref_pos + cig_len > rec_pos:
+                # A skipped region within the span leaves the allele of the read unknown
+                if cig_op == CIG_SKIP:
+                    return
+                if span_start is None:
+                    span_start = query_pos
+                    span_stop = query_pos
+            ref_pos += cig_len
+    # Reads ending within the span do not cover the full reference allele
+    if ref_pos < span_end or span_start is None:
+        return
+    span_len = span_stop - span_start
+    if span_len != len(ref_allele) and all(span_len != len(alt_allele) for alt_allele in alt_alleles):
+        return "N"
+    span_seq = read.query_sequence[span_start:span_stop]
+    for alt_ind, alt_allele in enumerate(alt_alleles):
+        if span_seq == alt_allele:
+            return ALT_SYMS[alt_ind]
+    if span_seq == ref_allele:
+        return REF_SYM
+    return "N"
+
+
 def ffpe_finder(cons_dict, var_nuc, ref_nuc, ffpe_n):
     """ The ffpe\_finder function is made to classify the variant type for paired UMI-reads. All-together the UMI and
     its variant-record position can be classified as: No mutation, Mutation, FFPE-artefact, Unknown (N) or Deletion (-).
@@ -71,75 +283,124 @@ def ffpe_finder(cons_dict, var_nuc, ref_nuc, ffpe_n):
         :raises KeyError: Raises a key-error if there are not two nucleotides to compare
     """
     var_dict = {}
-    ffpe_dict = {}
-    ffpe_ind = 0
-    true_var_dict = {}
-    true_var_ind = 0
-    ref_dict = {}
-    ref_ind = 0
-    n_ind = 0
-    n_dict = {}
-    del_ind = 0
-    del_dict = {}
-    n_sym = "N"
-    del_sym = "-"
     try:
         # Retrieves the positive and negative strand nucleotide hits for the key value
         pos_str_nuc = cons_dict["Pos_Str_Hits"]
         neg_str_nuc = cons_dict["Neg_Str_Hits"]
-
-        if pos_str_nuc == ref_nuc and neg_str_nuc == pos_str_nuc:
-            ref_dict = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
-            ref_ind += 1
-        # If both positions contains the variant, it is added to the true_var_dict
-        elif pos_str_nuc == var_nuc and neg_str_nuc == pos_str_nuc:
-            true_var_dict = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
-            true_var_ind += 1
-        # If either of the positions are equal to an N or a deletion, they are deemed as a N or Del respectively
-        elif pos_str_nuc == n_sym or neg_str_nuc == n_sym:
-            n_dict = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
-            n_ind += 1
-        elif pos_str_nuc == del_sym or neg_str_nuc == del_sym:
-            del_dict = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
-            del_ind += 1
-        elif pos_str_nuc != neg_str_nuc:
-            if ffpe_n == 'standard':
-                # Checks the b_trans parameter, if standard only "FFPE" instances are classified as FFPE
-                # Hydrolytic deamination causes C:G>T:A changes due to hydrolytic deamination of cytosine
-                # PySAM's get_forward_sequence returns the reverse complement for any reverse reads
-
-                # Deamination of C to U [U-G] > [U-A], [C-G] > [T-A], [C,G],
-                # returned as [T-T],[C,C] as A is returned as T by PySAM, ie: T vs. C
-
-                # Deamination of C to U [G-U] > [G-C], [A-U] > [G-C], [A-T],
-                # returned as [G,G], [A-A] as T is returned as A by PySAM, ie G vs. A
-
-                # Deamination of methylated C to T [C-G] > [T-G] > [T-A],[C-G],
-                # returned as [T-T],[C-C], as A is returned as T by PySAM, ie: T vs.C
-
-                # Deamination of methylated C to T [G-C] > [G-T] > [A-T],[G-C],
-                # returned as [A-A],[G-G] as T is returned as A by PySAM, ie: G vs. A
-
-                if pos_str_nuc == 'T' and neg_str_nuc == 'C' or \
-                        pos_str_nuc == 'G' and neg_str_nuc == 'A':
-                    # Checks to see if any of the nucleotides are equal to the variant call
-                    if pos_str_nuc == var_nuc or neg_str_nuc == var_nuc:
-                        ffpe_dict = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
-                        ffpe_ind += 1
-                    else:
-                        true_var_dict = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
-                        true_var_ind += 1
-                else:
-                    true_var_dict = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
-                    true_var_ind += 1
-            elif ffpe_n == 'all':
-                    ffpe_dict = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
-                    ffpe_ind += 1
-        var_dict = {"Reference_Hits": ref_dict, "True_Variant_Hits": true_var_dict, "FFPE_Hits": ffpe_dict,
-                    "N_Hits": n_dict, "Del_Hits": del_dict, "Reference_Support": ref_ind,
-                    "True_Variant_Support": true_var_ind, "FFPE_Support": ffpe_ind, "N_Support": n_ind,
-                    "Del_Support": del_ind}
+        var_dict = cat_dict(ffpe_code(pos_str_nuc, neg_str_nuc, var_nuc, ref_nuc, ffpe_n), pos_str_nuc, neg_str_nuc)
     except KeyError as e:
         print("No match for: " + str(e) + " found, comparison not possible")
     # Returns all dictionaries in a list along with their total counts
     return var_dict
+
+
+def ffpe_code(pos_str_nuc, neg_str_nuc, var_nuc, ref_nuc, ffpe_n):
+    """ The ffpe_code function classifies the variant type of a paired UMI from the consensus nucleotides of its
+    positive and negative strand, as described for ffpe_finder. Returns the classification as a category code, without
+    generating any dicts.
+
+    Args:
+        :param pos_str_nuc: The consensus nucleotide of the positive strand
+        :param neg_str_nuc: The consensus nucleotide of the negative strand
+        :param var_nuc: The nucleotide called in the variant-record
+        :param ref_nuc: The nucleotide found in the reference genome at the variant-call position
+        :param ffpe_n: Parameter determining if all nucleotides should be included for FFPE-classification, or just
+        C>T:G>A
+
+    Returns:
+        :return: Returns the category code of the variant type, or CAT_NONE if the UMI could not be classified
+    """
+    n_sym = "N"
+    del_sym = "-"
+    if pos_str_nuc == ref_nuc and neg_str_nuc == pos_str_nuc:
+        return CAT_REF
+    # If both positions contains the variant, it is classified as a true variant
+    elif pos_str_nuc == var_nuc and neg_str_nuc == pos_str_nuc:
+        return CAT_VAR
+    # If either of the positions are equal to an N or a deletion, they are deemed as a N or Del respectively
+    elif pos_str_nuc == n_sym or neg_str_nuc == n_sym:
+        return CAT_N
+    elif pos_str_nuc == del_sym or neg_str_nuc == del_sym:
+        return CAT_DEL
+    elif pos_str_nuc != neg_str_nuc:
+        if ffpe_n == 'standard':
+            # Checks the b_trans parameter, if standard only "FFPE" instances are classified as FFPE
+            # Hydrolytic deamination causes C:G>T:A changes due to hydrolytic deamination of cytosine
+            # PySAM's get_forward_sequence returns the reverse complement for any reverse reads
+
+            # Deamination of C to U [U-G] > [U-A], [C-G] > [T-A], [C,G],
+            # returned as [T-T],[C,C] as A is returned as T by PySAM, ie: T vs. C
+
+            # Deamination of C to U [G-U] > [G-C], [A-U] > [G-C], [A-T],
+            # returned as [G,G], [A-A] as T is returned as A by PySAM, ie G vs. A
+
+            # Deamination of methylated C to T [C-G] > [T-G] > [T-A],[C-G],
+            # returned as [T-T],[C-C], as A is returned as T by PySAM, ie: T vs.C
+
+            # Deamination of methylated C to T [G-C] > [G-T] > [A-T],[G-C],
+            # returned as [A-A],[G-G] as T is returned as A by PySAM, ie: G vs. A
+
+            if pos_str_nuc == 'T' and neg_str_nuc == 'C' or \
+                    pos_str_nuc == 'G' and neg_str_nuc == 'A':
+                # Checks to see if any of the nucleotides are equal to the variant call
+                if pos_str_nuc == var_nuc or neg_str_nuc == var_nuc:
+                    return CAT_FFPE
+            return CAT_VAR
+        elif ffpe_n == 'all':
+            return CAT_FFPE
+    return CAT_NONE
+
+
+def cat_dict(cat_code, pos_str_nuc, neg_str_nuc):
+    """ The cat_dict function generates the ffpe_finder output for a classified UMI, from its category code and the
+    consensus nucleotides of its positive and negative strand.
+
+    Args:
+        :param cat_code: The category code of the UMI generated by ffpe_code
+        :param pos_str_nuc: The consensus nucleotide of the positive strand
+        :param neg_str_nuc: The consensus nucleotide of the negative strand
+
+    Returns:
+        :return: Returns a dict with separate dicts for every possible variant type, as well as their support
+        Example dict for a FFPE-artefact:
+        var_dict = "Reference_Hits": {}, True_Variant_Hits": {}, "FFPE_Hits": {"Pos_Str": C, "Neg_Str": T},
+        "N_Hits": {}, "Del_Hits": {}, "Reference_Support": 0, "True_Variant_Support": 0, "FFPE_Support": 1,
+        "N_Support": 0, "Del_Support": 0}
+    """
+    var_dict = {}
+    for cat_ind, cat_nm in enumerate(CAT_LST):
+        if cat_ind == cat_code:
+            var_dict[cat_nm + "_Hits"] = {"Pos_Str": pos_str_nuc, "Neg_Str": neg_str_nuc}
+        else:
+            var_dict[cat_nm + "_Hits"] = {}
+    for cat_ind, cat_nm in enumerate(CAT_LST):
+        var_dict[cat_nm + "_Support"] = int(cat_ind == cat_code)
+    return var_dict
+
+
+def nuc_code(nuc):
+    """ The nuc_code function converts a consensus nucleotide into its integer code in the UMI-family table. Bases
+    outside NUC_LST, such as the IUPAC codes and "=" a BAM-sequence may hold, are coded as N.
+
+    Args:
+        :param nuc: The consensus nucleotide, or None if the strand lacks a consensus nucleotide
+
+    Returns:
+        :return: Returns the integer code of the nucleotide, NUC_NONE for None
+    """
+    if nuc is None:
+        return NUC_NONE
+    return NUC_CODES.get(nuc, NUC_N)
+
+
+def nuc_decode(code):
+    """ The nuc_decode function converts an integer code from the UMI-family table back into its nucleotide.
+
+    Args:
+        :param code: Integer code of the nucleotide
+
+    Returns:
+        :return: Returns the nucleotide, or None for NUC_NONE and NUC_EMPTY
+    """
+    if code < len(NUC_LST):
+        return NUC_LST[code]
@@ -0,0 +1,73 @@
+import pysam
+
+# Extensions of the output formats and their pysam write modes, bgzipped VCF and BCF are compressed and can be indexed
+OUT_MODES = ((".vcf.gz", "wz"), (".vcf.bgz", "wz"), (".bcf", "wb"))
+# Index types of the compressed output, "auto" creates a TBI index for bgzipped VCF and a CSI index for BCF
+IDX_TYPES = ("auto", "tbi", "csi", "no")
+
+
+def out_mode(out_path, comp_lvl=-1):
+    """ The out_mode function returns the pysam write mode of the output VCF-file from the extension of its path:
+    bgzipped VCF for .vcf.gz and .vcf.bgz, BCF for .bcf and uncompressed VCF for any other extension, matched
+    regardless of case. The compression level is appended to the mode of the compressed formats, as in the htslib mode
+    strings.
+
+    >>> out_mode("fusac_output.bcf", 1)
+    'wb1'
+
+    Args:
+        :param out_path: Path of the output VCF-file
+        :param comp_lvl: Compression level from 0 to 9, or -1 for the htslib default
+
+    Returns:
+        :return: Returns the pysam write mode
+    """
+    for out_ext, wrt_mode in OUT_MODES:
+        if out_path.lower().endswith(out_ext):
+            if 0 <= comp_lvl <= 9:
+                return wrt_mode + str(comp_lvl)
+            return wrt_mode
+    return "w"
+
+
+def out_open(out_path, vcf_head, comp_lvl=-1, n_threads=1):
+    """ The out_open function opens the output VCF-file in the format of its extension, see out_mode. The htslib
+    threads compress the BGZF-blocks of the compressed formats alongside the annotation, rather than in the thread
+    writing the records.
+
+    Args:
+        :param out_path: Path of the output VCF-file
+        :param vcf_head: Header of the output VCF-file
+        :param comp_lvl: Compression level from 0 to 9, or -1 for the htslib default
+        :param n_threads: No. htslib threads compressing the output, 1 to compress in the writing thread
+
+    Returns:
+        :return: Returns the output VCF filehandle
+    """
+    return pysam.VariantFile(out_path, mode=out_mode(out_path, comp_lvl), header=vcf_head, threads=n_threads)
+
+
+def out_index(out_path, idx_type="auto"):
+    """ The out_index function indexes the closed output VCF-file, with a TBI index for bgzipped VCF and a CSI index
+    for BCF by default. Uncompressed output is not indexed. The index requires the records to be sorted, as they are
+    when the input VCF-file is sorted, an output that could not be indexed is reported and kept without an index.
+
+    Args:
+        :param out_path: Path of the output VCF-file
+        :param idx_type: Index type, one of IDX_TYPES
+
+    Returns:
+        :return: Returns the path of the index, or None if no index was created
+    """
+    if idx_type == "no" or out_mode(out_path) == "w":
+        return
+    use_csi = idx_type == "csi" or out_path.lower().endswith(".bcf")
+    if use_csi and idx_type == "tbi":
+        print("WARNING: BCF output can solely be given a CSI index")
+    try:
+        pysam.tabix_index(out_path, preset="vcf", force=True, csi=use_csi)
+    except (OSError, ValueError) as idx_err:
+        print("WARNING: The output " + out_path + " could not be indexed, is the input VCF file sorted? " +
+              str(idx_err))
+        return
+    return out_path + (".csi" if use_csi else ".tbi")
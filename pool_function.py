@@ -0,0 +1,343 @@
+import pysam
+import math
+import multiprocessing
+from collections import deque
+import build_function
+import sweep_function
+
+# Per-process state, populated by pool_init once for every worker process
+_bam_paths = None
+_bam_files = None
+_vcf_file = None
+_fus_opts = None
+
+
+def pool_init(bam_paths, fus_opts, vcf_path=None):
+    """ The pool_init function is the initializer of every worker process in the process pool. It opens the VCF-file
+    when running shards once for the lifetime of the worker, and stores it together with the paths of the BAM-files
+    and the run options for use by chunk_annotate and shard_annotate. Every BAM-file is opened by pool_bam on the
+    first task of the worker using it, and kept open for the lifetime of the worker.
+
+    Args:
+        :param bam_paths: List of paths to the BAM-files of interest, one for every sample
+        :param fus_opts: Dict containing the options used for annotating the variant-records
+        Example dict:
+        fus_opts = {"ffpe_n": "standard", "ext_fun": qrn_ext, "spl_fun": cha_splt, "q_spl_cha": "_", "u_spl_cha": "+",
+                    "backend": "fetch", "clu_fun": None, "fam_out": False, "fmt_mode": "packed",
+                    "read_flt": None, "prof_hook": None, "reg_idx": None, "pass_idx": None}
+        :param vcf_path: Path to the indexed VCF-file of interest, only required by shard_annotate
+    """
+    global _bam_paths, _bam_files, _vcf_file, _fus_opts
+    _bam_paths = bam_paths
+    _bam_files = {}
+    if vcf_path is not None:
+        _vcf_file = pysam.VariantFile(vcf_path, "r")
+    _fus_opts = fus_opts
+
+
+def pool_bam(bam_ind):
+    """ The pool_bam function returns the BAM-file of a sample in a worker process, opening it on first use.
+
+    Args:
+        :param bam_ind: Index of the BAM-file in the bam_paths given to pool_init
+
+    Returns:
+        :return: Returns the BAM filehandle
+    """
+    bam_file = _bam_files.get(bam_ind)
+    if bam_file is None:
+        bam_file = pysam.AlignmentFile(_bam_paths[bam_ind], "r", check_sq=False)
+        _bam_files[bam_ind] = bam_file
+    return bam_file
+
+
+def chunk_annotate(rec_chunk, bam_ind=0):
+    """ The chunk_annotate function generates the rec_annotate output for every variant-record tuple in a chunk, using
+    the BAM-file of a sample and a single sweep of the BAM-file per contig. Returns the annotations in the same order as
+    the chunk.
+
+    Args:
+        :param rec_chunk: List of variant-record tuples generated by rec_tuple
+        :param bam_ind: Index of the BAM-file in the bam_paths given to pool_init
+
+    Returns:
+        :return: Returns a list containing the rec_annotate output for every variant-record tuple in the chunk
+    """
+    prof_start()
+    try:
+        return sweep_function.sweep_annotate(rec_chunk, pool_bam(bam_ind), _fus_opts["ffpe_n"], _fus_opts["ext_fun"],
+                                             _fus_opts["spl_fun"], _fus_opts["q_spl_cha"], _fus_opts["u_spl_cha"],
+                                             _fus_opts["backend"], _fus_opts["clu_fun"],
+                                             fam_out=_fus_opts["fam_out"], read_flt=_fus_opts["read_flt"])
+    finally:
+        prof_stop()
+
+
+def shard_annotate(shard, bam_ind=0):
+    """ The shard_annotate function generates the rec_annotate output for every variant-record starting within a
+    shard, using the VCF-file opened by pool_init and the BAM-file of a sample. The records are walked in coordinate
+    order by a single sweep of the BAM-file, so that every read of the shard is decoded and parsed once. Solely the
+    records within the regions of fus_opts["reg_idx"] are fetched, and the records outside the regions of
+    fus_opts["pass_idx"] are left to pass through unannotated, see chunk_write.
+
+    Args:
+        :param shard: Tuple of the contig, start and end of the shard generated by shard_maker
+        :param bam_ind: Index of the BAM-file in the bam_paths given to pool_init
+
+    Returns:
+        :return: Returns a list containing the rec_annotate output for every variant-record in the shard
+    """
+    prof_start()
+    try:
+        pass_idx = _fus_opts["pass_idx"]
+        rec_tpls = [build_function.rec_tuple(record) for record in shard_records(_vcf_file, shard, _fus_opts["reg_idx"])
+                    if pass_idx is None or pass_idx.rec_in(record.chrom, record.start)]
+        return sweep_function.sweep_annotate(rec_tpls, pool_bam(bam_ind), _fus_opts["ffpe_n"], _fus_opts["ext_fun"],
+                                             _fus_opts["spl_fun"], _fus_opts["q_spl_cha"], _fus_opts["u_spl_cha"],
+                                             _fus_opts["backend"], _fus_opts["clu_fun"],
+                                             fam_out=_fus_opts["fam_out"], read_flt=_fus_opts["read_flt"])
+    finally:
+        prof_stop()
+
+
+def prof_start():
+    """ The prof_start function starts the profiling hook of the run before a task of the worker, if the run is
+    profiled (see prof_function.PoolProf).
+    """
+    if _fus_opts["prof_hook"] is not None:
+        _fus_opts["prof_hook"].start()
+
+
+def prof_stop():
+    """ The prof_stop function stops the profiling hook of the run after a task of the worker, if the run is
+    profiled, which reports the stats of the worker to the main process.
+    """
+    if _fus_opts["prof_hook"] is not None:
+        _fus_opts["prof_hook"].stop()
+
+
+def shard_records(vcf_file, shard, reg_idx=None):
+    """ The shard_records function fetches the variant-records of a shard from the indexed VCF-file. Only records
+    starting within the shard are returned, so that a record overlapping two shards is only annotated once. With a
+    RegionIndex, solely the regions within the shard are fetched, and only records starting within a region returned.
+
+    Args:
+        :param vcf_file: Indexed VCF filehandle
+        :param shard: Tuple of the contig, start and end of the shard generated by shard_maker
+        :param reg_idx: Optional RegionIndex of the target regions
+
+    Returns:
+        :return: Yields the variant-records starting within the shard
+    """
+    contig, start, end = shard
+    reg_lst = [(start, end)] if reg_idx is None else reg_idx.overlaps(contig, start, end)
+    for reg_start, reg_end in reg_lst:
+        for record in vcf_file.fetch(contig, reg_start, reg_end):
+            if record.start >= reg_start and (reg_end is None or record.start < reg_end):
+                yield record
+
+
+def contig_order(vcf_file):
+    """ The contig_order function lists the contigs with variant-records in the VCF-index, in the order their records
+    are found in the VCF-file. Neither the VCF-header nor the VCF-index gives this order, as the CSI-index of a
+    BCF-file lists its contigs in the order of the VCF-header, so the contigs are ordered by the file position after
+    their first record, which is fetched through the index.
+
+    Args:
+        :param vcf_file: Indexed VCF filehandle
+
+    Returns:
+        :return: Returns a list of the contigs in VCF-file order
+    """
+    con_pos = []
+    for contig in vcf_file.index:
+        for _ in vcf_file.fetch(contig):
+            con_pos.append((vcf_file.tell(), contig))
+            break
+    return [contig for _, contig in sorted(con_pos)]
+
+
+def shard_maker(vcf_file, bam_file, shard_size, n_shards, reg_idx=None):
+    """ The shard_maker function splits the contigs with variant-records into fixed-size windows, in the order the
+    contigs are found in the VCF-file (see contig_order), so that the sharded output keeps the record order of the
+    input. To keep the workers busy when contigs differ greatly in size or depth, contigs are split into windows of at
+    most shard_size bases, and additionally into enough windows to give no shard more than 1/n_shards of the mapped
+    reads according to the BAM-index. Contigs of unknown length are run as a single shard. With a RegionIndex, the
+    windows without any region are left out.
+
+    Args:
+        :param vcf_file: Indexed VCF filehandle
+        :param bam_file: BAM filehandle
+        :param shard_size: Maximum no. bases in a shard
+        :param n_shards: Minimum no. shards to split the mapped reads into
+        :param reg_idx: Optional RegionIndex of the target regions
+
+    Returns:
+        :return: Returns a list of shard tuples in VCF-file order
+        Example list:
+        [("chr1", 0, 1000000), ("chr1", 1000000, 2000000), ... ("chrM", 0, 16569)]
+    """
+    bam_lengths = dict(zip(bam_file.references, bam_file.lengths))
+    try:
+        map_reads = {stat.contig: stat.mapped for stat in bam_file.get_index_statistics()}
+    except ValueError:
+        map_reads = {}
+    read_cap = max(1, sum(map_reads.values()) // n_shards)
+
+    shard_lst = []
+    for contig in contig_order(vcf_file):
+        if reg_idx is not None and contig not in reg_idx:
+            continue
+        con_len = vcf_file.header.contigs[contig].length if contig in vcf_file.header.contigs else None
+        if con_len is None:
+            con_len = bam_lengths.get(contig)
+        if con_len is None:
+            shard_lst.append((contig, 0, None))
+            continue
+        n_win = max(math.ceil(con_len / shard_size), math.ceil(map_reads.get(contig, 0) / read_cap), 1)
+        win_len = math.ceil(con_len / n_win)
+        for start in range(0, con_len, win_len):
+            if reg_idx is None or reg_idx.overlaps(contig, start, min(start + win_len, con_len)):
+                shard_lst.append((contig, start, min(start + win_len, con_len)))
+    return shard_lst
+
+
+def chunk_maker(vcf_file, chunk_size):
+    """ The chunk_maker function groups the variant-records of the VCF-file into lists of chunk_size records, in the
+    order they are found in the VCF-file.
+
+    Args:
+        :param vcf_file: VCF filehandle
+        :param chunk_size: Maximum number of variant-records in a chunk
+
+    Returns:
+        :return: Yields lists of variant-records
+    """
+    rec_chunk = []
+    for record in vcf_file:
+        rec_chunk.append(record)
+        if len(rec_chunk) >= chunk_size:
+            yield rec_chunk
+            rec_chunk = []
+    if rec_chunk:
+        yield rec_chunk
+
+
+def pool_run(vcf_file, n_vcf, bam_paths, n_proc, chunk_size, fus_opts, samp_lst=None, ann_wrt=None, ckpt_wrt=None):
+    """ The pool_run function annotates every variant-record in the VCF-file using a pool of worker processes, which
+    avoids the GIL limiting the pure-python parts of the classification to one core. Chunks of variant-records are
+    sent to the workers as picklable tuples, as one task for every BAM-file, and the returned annotations are applied
+    to the records which are then written to the output VCF-file in input order. At most two tasks per worker are in
+    flight at any time. The records outside the regions of fus_opts["pass_idx"] are not sent to the workers, and pass
+    through unannotated.
+
+    Args:
+        :param vcf_file: VCF filehandle
+        :param n_vcf: Output VCF filehandle
+        :param bam_paths: List of paths to the BAM-files of interest, one for every sample
+        :param n_proc: No. worker processes
+        :param chunk_size: Maximum number of variant-records sent to a worker at a time
+        :param fus_opts: Dict containing the options used for annotating the variant-records
+        :param samp_lst: List of the VCF-samples of the BAM-files, or None to annotate every sample from a single
+        BAM-file
+        :param ann_wrt: Optional writer of the annotations, such as an ArrowWriter, given every written record
+        :param ckpt_wrt: Optional CkptWriter, given the no. variant-records of every written chunk
+    """
+    pass_idx = fus_opts["pass_idx"]
+    in_flight = deque()
+    with multiprocessing.Pool(n_proc, initializer=pool_init, initargs=(bam_paths, fus_opts)) as pool:
+        for rec_chunk in chunk_maker(vcf_file, chunk_size):
+            rec_tpls = [build_function.rec_tuple(record) for record in rec_chunk
+                        if pass_idx is None or pass_idx.rec_in(record.chrom, record.start)]
+            ann_res = []
+            if rec_tpls:
+                ann_res = [pool.apply_async(chunk_annotate, (rec_tpls, bam_ind)) for bam_ind in range(len(bam_paths))]
+            in_flight.append((rec_chunk, ann_res))
+            if len(in_flight) * len(bam_paths) >= 2 * n_proc:
+                chunk_write(n_vcf, *in_flight.popleft(), samp_lst, ann_wrt, fus_opts["fmt_mode"], ckpt_wrt, 0,
+                            pass_idx)
+        while in_flight:
+            chunk_write(n_vcf, *in_flight.popleft(), samp_lst, ann_wrt, fus_opts["fmt_mode"], ckpt_wrt, 0, pass_idx)
+
+
+def shard_run(vcf_file, n_vcf, vcf_path, bam_paths, n_proc, shard_size, fus_opts, samp_lst=None, ann_wrt=None,
+              shard_lst=None, ckpt_wrt=None):
+    """ The shard_run function annotates every variant-record in the indexed VCF-file using a pool of worker processes,
+    with the genome split into shards by shard_maker. Every shard of every BAM-file is a task annotated by one worker,
+    which walks its records in coordinate order, and the shard outputs of all BAM-files are written to the output
+    VCF-file in shard order. Tasks are handed out one at a time to whichever worker is free, with at most four tasks
+    per worker in flight. The shards are made from the index of the first BAM-file, unless given by shard_lst, such as
+    the remaining shards of a resumed run. Solely the shards and records within the regions of fus_opts["reg_idx"] are
+    annotated, whereas the records outside the regions of fus_opts["pass_idx"] pass through unannotated.
+
+    Args:
+        :param vcf_file: Indexed VCF filehandle
+        :param n_vcf: Output VCF filehandle
+        :param vcf_path: Path to the indexed VCF-file of interest
+        :param bam_paths: List of paths to the BAM-files of interest, one for every sample
+        :param n_proc: No. worker processes
+        :param shard_size: Maximum no. bases in a shard
+        :param fus_opts: Dict containing the options used for annotating the variant-records
+        :param samp_lst: List of the VCF-samples of the BAM-files, or None to annotate every sample from a single
+        BAM-file
+        :param ann_wrt: Optional writer of the annotations, such as an ArrowWriter, given every written record
+        :param shard_lst: Optional list of the shards to annotate, generated by shard_maker by default
+        :param ckpt_wrt: Optional CkptWriter, given the no. variant-records of every written shard
+    """
+    if shard_lst is None:
+        with pysam.AlignmentFile(bam_paths[0], "r", check_sq=False) as bam_file:
+            shard_lst = shard_maker(vcf_file, bam_file, shard_size, 4 * n_proc, fus_opts["reg_idx"])
+    reg_idx = fus_opts["reg_idx"]
+    pass_idx = fus_opts["pass_idx"]
+    in_flight = deque()
+    with multiprocessing.Pool(n_proc, initializer=pool_init, initargs=(bam_paths, fus_opts, vcf_path)) as pool:
+        for shard in shard_lst:
+            ann_res = [pool.apply_async(shard_annotate, (shard, bam_ind)) for bam_ind in range(len(bam_paths))]
+            in_flight.append((shard, ann_res))
+            if len(in_flight) * len(bam_paths) >= 4 * n_proc:
+                shard, ann_res = in_flight.popleft()
+                chunk_write(n_vcf, shard_records(vcf_file, shard, reg_idx), ann_res, samp_lst, ann_wrt,
+                            fus_opts["fmt_mode"], ckpt_wrt, 1, pass_idx)
+        while in_flight:
+            shard, ann_res = in_flight.popleft()
+            chunk_write(n_vcf, shard_records(vcf_file, shard, reg_idx), ann_res, samp_lst, ann_wrt,
+                        fus_opts["fmt_mode"], ckpt_wrt, 1, pass_idx)
+
+
+def chunk_write(n_vcf, rec_chunk, ann_res, samp_lst=None, ann_wrt=None, fmt_mode="packed", ckpt_wrt=None, n_shards=0,
+                pass_idx=None):
+    """ The chunk_write function waits for the annotations of a chunk from every BAM-file, and writes the annotated
+    variant-records to the output VCF-file. Variant-records without annotation (see rec_allele) are skipped, whereas
+    the records outside the regions of pass_idx, which have not been annotated, are written unchanged. Once the chunk
+    has been written, it is reported to the optional CkptWriter.
+
+    Args:
+        :param n_vcf: Output VCF filehandle
+        :param rec_chunk: List of variant-records
+        :param ann_res: List of the AsyncResult of the chunk_annotate call for the chunk, for every BAM-file
+        :param samp_lst: List of the VCF-samples of the BAM-files, or None to annotate every sample from a single
+        BAM-file
+        :param ann_wrt: Optional writer of the annotations, such as an ArrowWriter, given every written record
+        :param fmt_mode: Output mode of the FORMAT fields, see build_function.FMT_MODES
+        :param ckpt_wrt: Optional CkptWriter, given the no. variant-records of the chunk
+        :param n_shards: No. shards held by the chunk, 1 for the chunks of shard_run
+        :param pass_idx: Optional RegionIndex of the regions, outside of which the records pass through unannotated
+    """
+    n_recs = 0
+    ann_itr = zip(*[samp_res.get() for samp_res in ann_res])
+    for record in rec_chunk:
+        n_recs += 1
+        if pass_idx is not None and not pass_idx.rec_in(record.chrom, record.start):
+            n_vcf.write(record)
+            continue
+        samp_anns = next(ann_itr)
+        if samp_lst is None:
+            n_cop = None if samp_anns[0] is None else build_function.rec_apply(record, samp_anns[0], fmt_mode)
+        else:
+            n_cop = build_function.samp_apply(record, samp_lst, samp_anns, fmt_mode)
+        if n_cop is not None:
+            n_vcf.write(n_cop)
+            if ann_wrt is not None:
+                ann_wrt.add(n_cop, samp_anns)
+    if ckpt_wrt is not None:
+        ckpt_wrt.done(n_recs, n_shards)
@@ -2,6 +2,9 @@ import nuc_function
 import warnings
 from collections import Counter
 
+# Nucleotides and allele symbols counted by pos_hits, in the order in which ties between them are broken
+CONS_LST = ("A", "T", "G", "C", "N", "-", nuc_function.REF_SYM) + nuc_function.ALT_SYMS
+
 
 def umi_maker(read, splt_umi):
     """ The umi_maker function rearranges the UMI-tag belonging to a read, based on if the read is read 1 or read 2
@@ -49,6 +52,30 @@ def umi_maker(read, splt_umi):
     return [qr_nm, strand, umi_id]
 
 
+def umi_parse(read, ext_fun, spl_fun, q_spl_cha, u_spl_cha):
+    """ The umi_parse function extracts the UMI-tag from a read using ext_fun, splits it using spl_fun, and joins the
+    umi-key of the strand of the read as umi_maker does, without a call to umi_maker. The umi-keys are kept as strings,
+    and solely packed into integers when the UMI-families are clustered, see clust_function.umi_code.
+
+    Args:
+        :param read: Read of interest
+        :param ext_fun: Function for extracting the UMI-tag from a read
+        :param spl_fun: Function used for splitting the UMI-tag in a read
+        :param q_spl_cha: Character used for splitting the UMI-tag from the query-name
+        :param u_spl_cha: Character used for splitting the UMI-tag
+
+    Returns:
+        :return: Returns a list with the query-name, the strand, and the umi-key belonging to the read
+        Example list:
+        ["PairedCleanRead_AAATTT+CCCGGG", "Pos_Str", "AAATTT_CCCGGG"]
+    """
+    splt_umi = spl_fun(ext_fun(read, q_spl_cha), u_spl_cha)
+    # Forward read 1 and reverse read 2 belong to the positive strand, see umi_maker
+    if read.is_read1 != read.is_reverse:
+        return [read.query_name, "Pos_Str", splt_umi[0] + "_" + splt_umi[1]]
+    return [read.query_name, "Neg_Str", splt_umi[1] + "_" + splt_umi[0]]
+
+
 def qrn_ext(read, q_spl_cha):
     """ The qrn_ext function extracts a umi-tag from a read, based on the key being present as the last item in the
     query-name. Returns the umi-tag.
@@ -60,7 +87,7 @@ def qrn_ext(read, q_spl_cha):
     Returns:
         :return: A dict containing the umi-tag
     """
-    return read.query_name.split(q_spl_cha)[-1]
+    return read.query_name.rsplit(q_spl_cha, 1)[-1]
 
 
 def rx_ext(read, q_spl_cha):
@@ -114,7 +141,27 @@ def hlf_splt(umi_str, u_spl_cha):
     return list(tgg)
 
 
-def pos_hits(inp_dict, rec_pos):
+def fam_hits(umi_fam, rec_pos, nuc_fun=nuc_function.nuc_check):
+    """ The fam_hits function calls pos_hits once for each strand of a UMI-family that has any reads, returning
+    both the mate and the singleton consensus nucleotide of each strand from the same pass over its reads.
+
+    Args:
+        :param umi_fam: Dict of the reads of a UMI-family, divided by strand and categorized by their query-name
+        Example dict:
+        umi_fam = {"Pos_Str": {example_name_UMI_ACTGCA+ACTGCA: [read1, read2]}, "Neg_Str": {}}
+        :param rec_pos: The position of the called variant in the reference genome
+        :param nuc_fun: Function returning the nucleotide of a read at the position
+
+    Returns:
+        :return: Returns a dict with the pos_hits output for each strand, or None for a strand without reads
+        Example dict:
+        fam_cons = {"Pos_Str": [C, None], "Neg_Str": None}
+    """
+    return {strand: pos_hits(str_dict, rec_pos, nuc_fun) if str_dict else None
+            for strand, str_dict in umi_fam.items()}
+
+
+def pos_hits(inp_dict, rec_pos, nuc_fun=nuc_function.nuc_check):
     """ The pos\_hits function selects the most prominent nuc for a UMI of interest. The function works through
     iterating through all query-names in the input list and determines if the query-name has a mate or not.
     The function then calls the nuc\_check function to retrieve the nuc matching the variant-record position for each
@@ -128,6 +175,7 @@ def pos_hits(inp_dict, rec_pos):
         Example dict:
         input_dict = {example_name_UMI_ACTGCA+ACTGCA: {read1, read2}, example_2_name_UMI_TGACGT+TGACGT: {read2}}
         :param rec_pos: The position of the called variant in the reference genome
+        :param nuc_fun: Function returning the nucleotide of a read at the position, nuc_check by default
 
     Returns:
         :return: Returns a dict with mapped and unmapped reads with the most prominent nuc for the
@@ -144,8 +192,9 @@ def pos_hits(inp_dict, rec_pos):
     read_nuc = None
     cons_nuc = None
     singleton_nuc = None
-    mate_dict = Counter({"A": 0, "T": 0, "G": 0, "C": 0, "N": 0, "-": 0})
-    singleton_dict = Counter({"A": 0, "T": 0, "G": 0, "C": 0, "N": 0, "-": 0})
+    # The allele symbols of multi-base variant-records follow the nucleotides, leaving the ties of SNVs unchanged
+    mate_dict = Counter(dict.fromkeys(CONS_LST, 0))
+    singleton_dict = Counter(dict.fromkeys(CONS_LST, 0))
 
     # Iterates through every query_name entry within the given UMI-key for the direction
     for query_name, read in inp_dict.items():
@@ -153,8 +202,8 @@ def pos_hits(inp_dict, rec_pos):
         # For both reads, then checks if these are identical or if they are different. If they are different, skips the
         # Query-name pair as this  indicates some form of error, as the same molecule should have a identical nuc
         if len(read) == 2:
-            read_nuc = nuc_function.nuc_check(read[0], rec_pos)
-            r2b = nuc_function.nuc_check(read[1], rec_pos)
+            read_nuc = nuc_fun(read[0], rec_pos)
+            r2b = nuc_fun(read[1], rec_pos)
             # If the read mates do not agree on which nuc the position represents, the data cannot be used
             if read_nuc != r2b:
                 continue
@@ -162,22 +211,20 @@ def pos_hits(inp_dict, rec_pos):
             # Checks if the read simply is alone as its mate did not align,
             # If it lacks a mate it is categorized as unmapped.
             if read[0].mate_is_unmapped:
-                singleton_nuc = nuc_function.nuc_check(read[0], rec_pos)
+                singleton_nuc = nuc_fun(read[0], rec_pos)
             else:
-                read_nuc = nuc_function.nuc_check(read[0], rec_pos)
+                read_nuc = nuc_fun(read[0], rec_pos)
         else:
             warnings.warn("Warning! No. reads belonging to: " + str(query_name) + " exceeds 2, skipping these")
 
         # Adds to the count of nucleotides belonging to the query-name to the mpd/unmpd dict for the
         # inp_lst belonging to the umi_key
         if read_nuc:
-            for nuc in mate_dict.keys():
-                if nuc == read_nuc:
-                    mate_dict[nuc] += 1
+            if read_nuc in mate_dict:
+                mate_dict[read_nuc] += 1
         elif singleton_nuc:
-            for nuc in singleton_dict.keys():
-                if nuc == singleton_nuc:
-                    singleton_dict[nuc] += 1
+            if singleton_nuc in singleton_dict:
+                singleton_dict[singleton_nuc] += 1
     # Selects the most prominent nuc (the consensus nucleotide) in the unmapped/mapped dict if the dict have any values
     if max(mate_dict.values()) > 0:
         cons_nuc = max(mate_dict, key=mate_dict.get)
@@ -0,0 +1,319 @@
+import cProfile
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import build_function
+import count_function
+import fam_function
+import pool_function
+import pos_function
+import stat_function
+import sweep_function
+import arrow_function
+
+# Functions timed as every stage, as the stage, the module or class holding the function, and the function name.
+# Generator functions are timed on every item they yield, rather than on the call creating the generator
+PROF_STAGES = (("vcf_read", pool_function, "chunk_maker"), ("vcf_read", pool_function, "shard_records"),
+               ("bam_fetch", sweep_function, "pos_sweep"), ("bam_fetch", sweep_function, "pileup_sweep"),
+               ("umi_parse", pos_function, "umi_parse"), ("grouping", build_function, "var_extract"),
+               ("consensus", pos_function, "fam_hits"), ("classify", fam_function.FamTable, "add"),
+               ("classify", fam_function.FamTable, "reclass"), ("count", count_function, "fam_count"),
+               ("count", build_function, "sup_count"), ("annotate", sweep_function, "sweep_annotate"),
+               ("annotate", build_function, "read_annotate"), ("format", build_function, "rec_apply"),
+               ("format", build_function, "samp_apply"), ("csv", stat_function.StatWriter, "add"),
+               ("parquet", arrow_function.ArrowWriter, "add"))
+GEN_FUNS = ("chunk_maker", "shard_records", "pos_sweep", "pileup_sweep")
+
+# The StageProf of every thread of the process, and the functions replaced by prof_install
+_prof_local = threading.local()
+_prof_lock = threading.Lock()
+_prof_lst = []
+_prof_orig = []
+
+
+class StageProf:
+    """ The StageProf class accumulates the time spent in, and the no. calls of, every stage of a worker thread or
+    process. Stages are timed exclusively: the time of a stage called from within another stage, such as umi_parse
+    within bam_fetch, is solely added to the inner stage. Every thread has a StageProf of its own, see prof_get.
+
+    Example stats of a consumer thread:
+        stage_prof.times = {"bam_fetch": 0.84, "umi_parse": 0.31, ...}, stage_prof.calls = {"bam_fetch": 300, ...}
+    """
+    __slots__ = ("name", "pid", "times", "calls", "stack")
+
+    def __init__(self, name):
+        self.name = name
+        self.pid = os.getpid()
+        self.times = {}
+        self.calls = {}
+        self.stack = []
+
+    def enter(self, stage):
+        """ The enter method starts the timer of a stage.
+
+        Args:
+            :param stage: Name of the stage
+        """
+        self.stack.append([stage, time.perf_counter(), 0.0])
+
+    def leave(self):
+        """ The leave method stops the timer of the innermost stage, and adds its time minus the time of the stages
+        called within it to the stage.
+        """
+        stage, t_start, t_inner = self.stack.pop()
+        t_stage = time.perf_counter() - t_start
+        self.times[stage] = self.times.get(stage, 0.0) + t_stage - t_inner
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        if self.stack:
+            self.stack[-1][2] += t_stage
+
+    def stats(self):
+        """ The stats method returns the time and no. calls of every stage, sorted by time.
+
+        Returns:
+            :return: Returns a dict of the stats of every stage
+            Example dict:
+            {"bam_fetch": {"time": 0.84, "calls": 300}, "umi_parse": {"time": 0.31, "calls": 72000}}
+        """
+        return {stage: {"time": round(t_stage, 6), "calls": self.calls[stage]}
+                for stage, t_stage in sorted(self.times.items(), key=lambda stage_itm: -stage_itm[1])}
+
+
+def prof_get():
+    """ The prof_get function returns the StageProf of the calling thread, creating it on first use. The StageProf
+    is named after the thread, or after the worker process for the threads of a pool worker. A StageProf inherited by
+    a forked pool worker from the main process is replaced, as its stats are those of the main process.
+
+    Returns:
+        :return: Returns the StageProf of the calling thread
+    """
+    stage_prof = getattr(_prof_local, "prof", None)
+    if stage_prof is None or stage_prof.pid != os.getpid():
+        prof_nm = threading.current_thread().name
+        if multiprocessing.current_process().name != "MainProcess":
+            prof_nm = multiprocessing.current_process().name
+        stage_prof = StageProf(prof_nm)
+        _prof_local.prof = stage_prof
+        with _prof_lock:
+            _prof_lst.append(stage_prof)
+    return stage_prof
+
+
+def stage_wrap(stage, stage_fun):
+    """ The stage_wrap function wraps a function into a function timing every call as the stage.
+
+    Args:
+        :param stage: Name of the stage
+        :param stage_fun: Function of the stage
+
+    Returns:
+        :return: Returns the wrapped function
+    """
+    @functools.wraps(stage_fun)
+    def stage_call(*args, **kwargs):
+        stage_prof = prof_get()
+        stage_prof.enter(stage)
+        try:
+            return stage_fun(*args, **kwargs)
+        finally:
+            stage_prof.leave()
+    return stage_call
+
+
+def gen_wrap(stage, gen_fun):
+    """ The gen_wrap function wraps a generator function into a generator function timing the production of every
+    item as the stage, but not the time the caller spends on the item.
+
+    Args:
+        :param stage: Name of the stage
+        :param gen_fun: Generator function of the stage
+
+    Returns:
+        :return: Returns the wrapped generator function
+    """
+    @functools.wraps(gen_fun)
+    def stage_gen(*args, **kwargs):
+        gen_itr = gen_fun(*args, **kwargs)
+        stage_prof = prof_get()
+        while True:
+            stage_prof.enter(stage)
+            try:
+                gen_itm = next(gen_itr)
+            except StopIteration:
+                return
+            finally:
+                stage_prof.leave()
+            yield gen_itm
+    return stage_gen
+
+
+def prof_iter(stage, stage_itr):
+    """ The prof_iter function times the iteration of an iterable as the stage, such as the variant-records read from
+    the VCF-file by the producer thread.
+
+    Args:
+        :param stage: Name of the stage
+        :param stage_itr: Iterable of interest
+
+    Returns:
+        :return: Yields the items of the iterable
+    """
+    return gen_wrap(stage, iter)(stage_itr)
+
+
+def prof_install():
+    """ The prof_install function replaces every function of PROF_STAGES by a wrapper timing its stage. The functions
+    are only replaced when profiling, so that the stages carry no overhead otherwise. Calling it again has no effect.
+    """
+    with _prof_lock:
+        if _prof_orig:
+            return
+        for stage, stage_own, fun_nm in PROF_STAGES:
+            stage_fun = getattr(stage_own, fun_nm)
+            _prof_orig.append((stage_own, fun_nm, stage_fun))
+            wrap_fun = gen_wrap if fun_nm in GEN_FUNS else stage_wrap
+            setattr(stage_own, fun_nm, wrap_fun(stage, stage_fun))
+
+
+def prof_remove():
+    """ The prof_remove function restores the functions replaced by prof_install, and drops the collected stats.
+    """
+    with _prof_lock:
+        for stage_own, fun_nm, stage_fun in _prof_orig:
+            setattr(stage_own, fun_nm, stage_fun)
+        _prof_orig.clear()
+        _prof_lst.clear()
+    _prof_local.__dict__.clear()
+
+
+def prof_snap():
+    """ The prof_snap function returns the stats collected so far by the calling thread, as reported by the pool
+    workers to the main process.
+
+    Returns:
+        :return: Returns a tuple of the name of the StageProf and copies of its times and calls dicts
+    """
+    stage_prof = prof_get()
+    return stage_prof.name, dict(stage_prof.times), dict(stage_prof.calls)
+
+
+class ProfWriter:
+    """ The ProfWriter class times the records written to the output VCF-file as the write stage, in place of the
+    output VCF filehandle.
+    """
+    __slots__ = ("n_vcf",)
+
+    def __init__(self, n_vcf):
+        self.n_vcf = n_vcf
+
+    def write(self, record):
+        """ The write method writes a variant-record to the output VCF-file, timed as the write stage.
+
+        Args:
+            :param record: Annotated variant-record
+        """
+        stage_prof = prof_get()
+        stage_prof.enter("write")
+        try:
+            self.n_vcf.write(record)
+        finally:
+            stage_prof.leave()
+
+
+class CallProf:
+    """ The CallProf class runs cProfile for a single worker, and dumps its pstats to a file. The worker is the first
+    thread or process to claim the lock, every other worker is left unprofiled.
+    """
+    __slots__ = ("prof_path", "claim_lock", "c_prof")
+
+    def __init__(self, prof_path, claim_lock):
+        self.prof_path = prof_path
+        self.claim_lock = claim_lock
+        self.c_prof = None
+
+    def start(self):
+        """ The start method starts cProfile in the calling thread, if no other worker has claimed the lock.
+        """
+        if self.c_prof is None and self.claim_lock.acquire(False):
+            self.c_prof = cProfile.Profile()
+        if self.c_prof is not None:
+            self.c_prof.enable()
+
+    def dump(self):
+        """ The dump method stops cProfile and writes the stats collected so far to prof_path. Pool workers call
+        start and dump around every task, as the processes are terminated once the pool has finished.
+        """
+        if self.c_prof is not None:
+            self.c_prof.disable()
+            self.c_prof.dump_stats(self.prof_path)
+
+
+class PoolProf:
+    """ The PoolProf class is the profiling hook of the pool workers, passed to them as fus_opts["prof_hook"] and
+    called by pool_function around every task. The first task of a worker installs the stage timers, and after every
+    task the stats of the worker are stored in a dict shared with the main process, keyed by the worker. The dict is
+    a Manager dict, as the worker processes are terminated once the pool has finished, without a chance to report.
+    Without a dict, solely the cProfile stats of a worker are collected.
+    """
+    __slots__ = ("prof_dict", "call_prof")
+
+    def __init__(self, prof_dict=None, call_prof=None):
+        self.prof_dict = prof_dict
+        self.call_prof = call_prof
+
+    def start(self):
+        """ The start method installs the stage timers, and starts cProfile if the worker is the profiled worker.
+        """
+        if self.prof_dict is not None:
+            prof_install()
+        if self.call_prof is not None:
+            self.call_prof.start()
+
+    def stop(self):
+        """ The stop method dumps the cProfile stats of the profiled worker, and stores the stats of the worker.
+        """
+        if self.call_prof is not None:
+            self.call_prof.dump()
+        if self.prof_dict is not None:
+            prof_itm = prof_snap()
+            self.prof_dict[prof_itm[0]] = prof_itm
+
+
+def prof_dump(out_path, wall_time, run_info, prof_items=()):
+    """ The prof_dump function writes the stats of every worker, and their totals per stage, to a JSON metrics file.
+
+    Args:
+        :param out_path: Path of the JSON metrics file
+        :param wall_time: Runtime of the run in seconds
+        :param run_info: Dict of the run options included in the file, such as the mode and no. threads
+        :param prof_items: Tuples of the prof_snap output reported by the pool workers
+
+    Returns:
+        :return: Returns the dict written to the file
+    """
+    wrk_profs = {}
+    with _prof_lock:
+        prof_lst = list(_prof_lst)
+    for stage_prof in prof_lst:
+        wrk_profs[stage_prof.name] = stage_prof
+    for prof_nm, prof_times, prof_calls in prof_items:
+        stage_prof = wrk_profs.setdefault(prof_nm, StageProf(prof_nm))
+        for stage, t_stage in prof_times.items():
+            stage_prof.times[stage] = stage_prof.times.get(stage, 0.0) + t_stage
+            stage_prof.calls[stage] = stage_prof.calls.get(stage, 0) + prof_calls[stage]
+    tot_prof = StageProf("total")
+    for stage_prof in wrk_profs.values():
+        for stage, t_stage in stage_prof.times.items():
+            tot_prof.times[stage] = tot_prof.times.get(stage, 0.0) + t_stage
+            tot_prof.calls[stage] = tot_prof.calls.get(stage, 0) + stage_prof.calls[stage]
+    prof_res = {"wall_time": round(wall_time, 6), "run": run_info, "stages": tot_prof.stats(),
+                "workers": {prof_nm: wrk_profs[prof_nm].stats() for prof_nm in sorted(wrk_profs)}}
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(out_path, "w") as out_file:
+        json.dump(prof_res, out_file, indent=2)
+    return prof_res
@@ -0,0 +1,144 @@
+import bisect
+import gzip
+import pool_function
+
+
+class RegionIndex:
+    """ The RegionIndex class holds the target regions of a BED-file as an interval index, with the regions of every
+    contig merged into sorted, non-overlapping intervals. Overlapping and adjacent regions are merged, so that a
+    variant-record falls within at most one interval, found by a binary search of the interval starts. A record is
+    within the regions if its 0-based start is, as for the shards of shard_records.
+
+    Example index of the BED-regions chr1:100-200, chr1:150-300 and chr2:0-50:
+        reg_idx.starts = {"chr1": [100], "chr2": [0]}, reg_idx.ends = {"chr1": [300], "chr2": [50]}
+    """
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, reg_lst):
+        self.starts = {}
+        self.ends = {}
+        for contig, start, end in sorted(reg_lst):
+            con_starts = self.starts.setdefault(contig, [])
+            con_ends = self.ends.setdefault(contig, [])
+            if con_ends and start <= con_ends[-1]:
+                con_ends[-1] = max(con_ends[-1], end)
+            else:
+                con_starts.append(start)
+                con_ends.append(end)
+
+    def __len__(self):
+        return sum(len(con_starts) for con_starts in self.starts.values())
+
+    def __contains__(self, contig):
+        return contig in self.starts
+
+    def bases(self):
+        """ The bases method returns the no. bases covered by the merged regions.
+
+        Returns:
+            :return: Returns the no. bases of every region of every contig
+        """
+        return sum(end - start for contig in self.starts for start, end in zip(self.starts[contig], self.ends[contig]))
+
+    def rec_in(self, contig, rec_start):
+        """ The rec_in method checks whether a variant-record starts within the regions.
+
+        Args:
+            :param contig: Contig of the variant-record
+            :param rec_start: 0-based start of the variant-record
+
+        Returns:
+            :return: Returns True if the record starts within a region
+        """
+        con_starts = self.starts.get(contig)
+        if con_starts is None:
+            return False
+        reg_ind = bisect.bisect_right(con_starts, rec_start) - 1
+        return reg_ind >= 0 and rec_start < self.ends[contig][reg_ind]
+
+    def overlaps(self, contig, start=0, end=None):
+        """ The overlaps method returns the parts of the regions of a contig within a window, such as a shard.
+
+        Args:
+            :param contig: Contig of the window
+            :param start: 0-based start of the window
+            :param end: 0-based end of the window, None for the end of the contig
+
+        Returns:
+            :return: Returns a list of the start and end of every region overlapping the window, clipped to the window
+            Example list for the window chr1:0-250 of the example index:
+            [(100, 250)]
+        """
+        con_starts = self.starts.get(contig, [])
+        con_ends = self.ends.get(contig, [])
+        reg_lst = []
+        # The first region ending after the window start is the first region overlapping the window
+        for reg_ind in range(bisect.bisect_right(con_ends, start), len(con_starts)):
+            if end is not None and con_starts[reg_ind] >= end:
+                break
+            reg_lst.append((max(start, con_starts[reg_ind]), con_ends[reg_ind] if end is None else
+                            min(end, con_ends[reg_ind])))
+        return reg_lst
+
+
+def bed_read(bed_path):
+    """ The bed_read function reads the regions of a plain or gzipped BED-file into a RegionIndex. Header, track and
+    browser lines are skipped, and solely the first three columns are used.
+
+    Args:
+        :param bed_path: Path of the BED-file
+
+    Returns:
+        :return: Returns the RegionIndex of the regions
+
+    Raises:
+        :raises ValueError: If a line of the BED-file has no valid contig, start and end
+    """
+    open_fun = gzip.open if bed_path.endswith(".gz") else open
+    reg_lst = []
+    with open_fun(bed_path, "rt") as bed_file:
+        for line_n, bed_line in enumerate(bed_file, 1):
+            bed_cols = bed_line.split()
+            if not bed_cols or bed_cols[0].startswith(("#", "track", "browser")):
+                continue
+            try:
+                contig, start, end = bed_cols[0], int(bed_cols[1]), int(bed_cols[2])
+            except (IndexError, ValueError):
+                raise ValueError("line " + str(line_n) + " of the BED file " + bed_path + " is not a valid region")
+            if start < 0 or end < start:
+                raise ValueError("line " + str(line_n) + " of the BED file " + bed_path + " is not a valid region")
+            reg_lst.append((contig, start, end))
+    return RegionIndex(reg_lst)
+
+
+def region_records(vcf_file, reg_idx):
+    """ The region_records function fetches the variant-records within the regions from the indexed VCF-file, contig
+    by contig in the order the contigs are found in the VCF-file (see pool_function.contig_order), so that records
+    outside the regions are never read. Contigs without records in the VCF-index are skipped.
+
+    Args:
+        :param vcf_file: Indexed VCF filehandle
+        :param reg_idx: RegionIndex of the regions
+
+    Returns:
+        :return: Yields the variant-records within the regions
+    """
+    for contig in pool_function.contig_order(vcf_file):
+        if contig in reg_idx:
+            yield from pool_function.shard_records(vcf_file, (contig, 0, None), reg_idx)
+
+
+def region_filter(vcf_file, reg_idx):
+    """ The region_filter function reads every variant-record of a VCF-file without an index, and solely returns the
+    records within the regions.
+
+    Args:
+        :param vcf_file: VCF filehandle
+        :param reg_idx: RegionIndex of the regions
+
+    Returns:
+        :return: Yields the variant-records within the regions
+    """
+    for record in vcf_file:
+        if reg_idx.rec_in(record.chrom, record.start):
+            yield record
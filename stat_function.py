@@ -0,0 +1,162 @@
+import csv
+import os
+import shutil
+
+# Columns of the statistics CSV-files, preceded by the row index
+STAT_COLS = ("Ref", "Var", "FFPE", "Perc", "NucChange")
+# Mismatches of the variant-records included in the statistics of the standard mode (C:G>T:A)
+STD_CHANGES = ("G>A", "C>T")
+# Typed integer FORMAT fields of the variant-type support, see build_function.UMI_FMTS
+TYPED_SUP = ("UMI_REF", "UMI_ALT", "UMI_FFPE", "UMI_N", "UMI_DEL")
+
+
+class StatWriter:
+    """ The StatWriter class writes the statistics CSV-files of the FUSAC output while the output VCF-file is written,
+    instead of reading the output VCF-file back once it has been closed. Every annotated variant-record passed to write
+    is written to the output VCF-file, after which its statistics rows are appended to the CSV-files, so that no table
+    of the statistics is held in memory. In the "all" mode every record is written to fusac_all_stats.csv and every
+    FFPE-record to fusac_stats.csv, whereas in the standard mode solely the C:G>T:A FFPE-records are written to
+    fusac_stats.csv.
+
+    Example row of fusac_stats.csv, the first record with molecular support for a C>T FFPE-artefact:
+        0,126,56,18,9.0,C>T
+    """
+    __slots__ = ("n_vcf", "ffpe_n", "per_exl", "csv_files", "csv_wrts", "row_cnts")
+
+    def __init__(self, n_vcf, ffpe_n, per_exl, stat_dir="FUSAC_Stats"):
+        self.n_vcf = n_vcf
+        self.ffpe_n = ffpe_n
+        self.per_exl = per_exl
+        # If the directory already exists, it is replaced by an empty directory
+        if os.path.isdir(stat_dir):
+            shutil.rmtree(stat_dir)
+        os.makedirs(stat_dir)
+        csv_nms = ["fusac_stats.csv"]
+        if ffpe_n == "all":
+            csv_nms.append("fusac_all_stats.csv")
+        self.csv_files = [open(os.path.join(stat_dir, csv_nm), "w", newline="") for csv_nm in csv_nms]
+        self.csv_wrts = [csv.writer(csv_file, lineterminator="\n") for csv_file in self.csv_files]
+        self.row_cnts = [0] * len(self.csv_files)
+        for csv_wrt in self.csv_wrts:
+            csv_wrt.writerow(("",) + STAT_COLS)
+
+    def write(self, record):
+        """ The write method writes an annotated variant-record to the output VCF-file, and adds its statistics rows
+        to the CSV-files. Used in place of the output VCF filehandle by the writers of the thread and process modes.
+
+        Args:
+            :param record: Annotated variant-record
+        """
+        if self.n_vcf is not None:
+            self.n_vcf.write(record)
+        self.add(record)
+
+    def add(self, record):
+        """ The add method appends the statistics rows of an annotated variant-record to the CSV-files it belongs to.
+
+        Args:
+            :param record: Annotated variant-record
+        """
+        rec_ffpe = "FFPE" in record.filter
+        # The rows of a record are generated once, also when written to both CSV-files
+        if self.ffpe_n == "all":
+            row_lst = stat_rows(record, self.per_exl)
+            self.csv_add(1, row_lst)
+            if rec_ffpe:
+                self.csv_add(0, row_lst)
+        elif rec_ffpe and rec_change(record) in STD_CHANGES:
+            self.csv_add(0, stat_rows(record, self.per_exl))
+
+    def csv_add(self, csv_ind, row_lst):
+        """ The csv_add method writes the stat_rows output of a variant-record to a CSV-file, numbering the rows.
+
+        Args:
+            :param csv_ind: Index of the CSV-file, 0 for fusac_stats.csv and 1 for fusac_all_stats.csv
+            :param row_lst: The stat_rows output of the variant-record
+        """
+        csv_wrt = self.csv_wrts[csv_ind]
+        for stat_row in row_lst:
+            csv_wrt.writerow((self.row_cnts[csv_ind],) + stat_row)
+            self.row_cnts[csv_ind] += 1
+
+    def close(self):
+        """ The close method closes the CSV-files, the output VCF-file is closed by its owner.
+        """
+        for csv_file in self.csv_files:
+            csv_file.close()
+
+
+def rec_change(record):
+    """ The rec_change function returns the mismatch of a variant-record, from its reference allele to its first
+    alternative allele.
+
+    Args:
+        :param record: Variant-record of interest
+
+    Returns:
+        :return: Returns the mismatch as a string
+        Example string:
+        "C>T"
+    """
+    return str(record.ref) + ">" + str(record.alts[0])
+
+
+def stat_rows(record, per_exl):
+    """ The stat_rows function generates the statistics of every annotated sample of a variant-record, from the
+    molecular support for each variant-type in its UMI field. Solely the variant-type support at the start of the UMI
+    string of the first alternative allele is split off, rather than the full string, or read from the typed integer
+    fields if the output has them (see samp_sup).
+
+    Args:
+        :param record: Annotated variant-record
+        :param per_exl: Optional input argument controlling the percentage threshold from which to remove records with
+        values beneath it, 0 to keep every record
+
+    Returns:
+        :return: Returns a list with a tuple of the molecular support for the reference nucleotide, the variant
+        nucleotide and FFPE-artefacts, the percentage of FFPE-artefacts and the mismatch, for every sample
+        Example list for a single sample:
+        [(126, 56, 18, 9.0, "C>T")]
+    """
+    row_lst = []
+    nuc_change = None
+    for samp_rec in record.samples.values():
+        # Samples without a BAM-file in the multi-sample mode are not annotated
+        samp_lst = samp_sup(samp_rec)
+        if samp_lst is None:
+            continue
+        rec_ref, rec_var, rec_ffpe, rec_n, rec_del = samp_lst
+        perc_rec = rec_ref + rec_var + rec_ffpe + rec_n + rec_del
+        ffpe_perc = 0.0
+        if perc_rec != 0:
+            ffpe_perc = (rec_ffpe / perc_rec) * 100
+        if per_exl != 0 and not int(per_exl[0]) <= ffpe_perc <= int(per_exl[1]):
+            continue
+        if nuc_change is None:
+            nuc_change = rec_change(record)
+        row_lst.append((rec_ref, rec_var, rec_ffpe, ffpe_perc, nuc_change))
+    return row_lst
+
+
+def samp_sup(samp_rec):
+    """ The samp_sup function returns the molecular support for each variant-type of the first alternative allele of
+    an annotated sample. The support is taken from the typed integer fields (UMI_REF to UMI_DEL) when the output has
+    them, without parsing any string, and otherwise from the start of the UMI string.
+
+    Args:
+        :param samp_rec: Sample of the annotated variant-record, from VariantRecord.samples
+
+    Returns:
+        :return: Returns a list of the support for each variant-type, or None if the sample is not annotated
+        Example list:
+        [126, 56, 18, 0, 0]
+    """
+    typ_sup = samp_rec.get(TYPED_SUP[0])
+    if typ_sup is not None:
+        if typ_sup[0] is None:
+            return
+        return [samp_rec[fmt_nm][0] for fmt_nm in TYPED_SUP]
+    samp_umi = samp_rec.get("UMI", (None,))[0]
+    if samp_umi in (None, "."):
+        return
+    return [int(sup) for sup in samp_umi.split(";", 5)[:5]]
@@ -0,0 +1,196 @@
+import functools
+import build_function
+import pos_function
+import nuc_function
+
+
+def pos_sweep(bam_file, rec_chr, pos_lst, umi_fun, max_gap=300):
+    """ The pos_sweep function walks the BAM-file once for a sorted set of positions on a contig, instead of fetching
+    the reads for every position separately. Positions at most max_gap bases apart are swept within a single fetch,
+    during which a sliding window of active reads is kept. A read enters the window once the sweep reaches its
+    leftmost position, and leaves it once the sweep has passed its rightmost position. Every read is parsed by umi_fun
+    once when it enters the window, and the parsed result is reused for every position the read covers. Reads are
+    handed out in the same order as a fetch of the position would return them.
+
+    Args:
+        :param bam_file: BAM-file filehandle
+        :param rec_chr: The contig of the positions
+        :param pos_lst: List of 0-based positions on the contig
+        :param umi_fun: Function parsing a read, called once for every read in the sweep
+        :param max_gap: Max. no. bases between two positions swept within the same fetch
+
+    Returns:
+        :return: Yields a tuple for every unique position in ascending order, containing the position, the list of
+        reads overlapping the position, and the list of umi_fun output for these reads
+    """
+    for pos_run in pos_runs(pos_lst, max_gap):
+        read_itr = bam_file.fetch(rec_chr, pos_run[0], pos_run[-1] + 1)
+        act_lst = []
+        nxt_read = next(read_itr, None)
+        for pos in pos_run:
+            # Adds every read starting at or before the position to the window, then drops the reads ending before it
+            while nxt_read is not None and nxt_read.reference_start <= pos:
+                act_lst.append((read_end(nxt_read), nxt_read, umi_fun(nxt_read)))
+                nxt_read = next(read_itr, None)
+            act_lst = [act for act in act_lst if act[0] > pos]
+            yield pos, [act[1] for act in act_lst], [act[2] for act in act_lst]
+
+
+def pileup_sweep(bam_file, rec_chr, pos_lst, max_gap=300):
+    """ The pileup_sweep function is an alternative to pos_sweep, which lets htslib compute the alignment of every
+    read to each position through the pileup engine, instead of nuc_check resolving the nucleotide of every read.
+    The pileup is run without any read filters, quality thresholds, overlap detection or depth limit, so that every
+    position is handed the same reads, in the same order, as a fetch of the position would return. Reads with a
+    deletion or a skipped region at the position are given the nucleotide None, as nuc_check would.
+
+    Args:
+        :param bam_file: BAM-file filehandle
+        :param rec_chr: The contig of the positions
+        :param pos_lst: List of 0-based positions on the contig
+        :param max_gap: Max. no. bases between two positions swept within the same pileup
+
+    Returns:
+        :return: Yields a tuple for every unique position in ascending order, containing the position, the list of
+        reads overlapping the position, and the list of nucleotides of these reads at the position
+    """
+    for pos_run in pos_runs(pos_lst, max_gap):
+        pos_set = set(pos_run)
+        col_dict = {}
+        for col in bam_file.pileup(rec_chr, pos_run[0], pos_run[-1] + 1, truncate=True, stepper="nofilter",
+                                   ignore_overlaps=False, ignore_orphans=False, min_base_quality=0,
+                                   max_depth=2147483647):
+            if col.reference_pos not in pos_set:
+                continue
+            # The pileup reads must be extracted before the pileup iterator moves on to the next column
+            col_seq = col.get_query_sequences()
+            bam_lst = []
+            nuc_lst = []
+            for plp_read, plp_nuc in zip(col.pileups, col_seq):
+                bam_lst.append(plp_read.alignment)
+                if plp_read.is_del or plp_read.is_refskip:
+                    nuc_lst.append(None)
+                else:
+                    nuc_lst.append(plp_nuc.upper())
+            col_dict[col.reference_pos] = (bam_lst, nuc_lst)
+        for pos in pos_run:
+            bam_lst, nuc_lst = col_dict.get(pos, ([], []))
+            yield pos, bam_lst, nuc_lst
+
+
+def pos_runs(pos_lst, max_gap):
+    """ The pos_runs function sorts a list of positions and splits it into runs, where every position is at most
+    max_gap bases from the previous position in the run.
+
+    Args:
+        :param pos_lst: List of positions
+        :param max_gap: Max. no. bases between two consecutive positions of a run
+
+    Returns:
+        :return: Returns a list of runs, each a sorted list of unique positions
+        Example list for the positions [900, 3, 8, 3] and a max_gap of 300:
+        [[3, 8], [900]]
+    """
+    run_lst = []
+    for pos in sorted(set(pos_lst)):
+        if run_lst and pos - run_lst[-1][-1] <= max_gap:
+            run_lst[-1].append(pos)
+        else:
+            run_lst.append([pos])
+    return run_lst
+
+
+def read_end(read):
+    """ The read_end function returns the position after the rightmost reference base of a read, using the same
+    convention as the BAM-index: reads without any aligned bases cover their leftmost position.
+
+    Args:
+        :param read: Read of interest
+
+    Returns:
+        :return: Returns the 0-based exclusive end position of the read
+    """
+    ref_end = read.reference_end
+    if ref_end is None:
+        return read.reference_start + 1
+    return ref_end
+
+
+def sweep_annotate(rec_tpls, bam_file, ffpe_n, ext_fun, spl_fun, q_spl_cha, u_spl_cha, backend="fetch",
+                   clu_fun=None, read_cache=None, fam_out=False, read_flt=None):
+    """ The sweep_annotate function generates the rec_annotate output for a list of variant-record tuples, using one
+    pos_sweep (or pileup_sweep) per contig rather than one BAM fetch per variant-record. Records sharing a position
+    share the reads of that position. With a ReadCache, every read is looked up in the cache rather than parsed, and
+    the fetch backend resolves the nucleotide of the read from its cached coordinate map, so that a read overlapping
+    the variant-records of several sweep_annotate calls is solely parsed by the first call. Reads dropped by the flag
+    or MAPQ filter of a ReadFilter are not parsed at all.
+
+    Args:
+        :param rec_tpls: List of variant-record tuples generated by rec_tuple
+        :param bam_file: BAM-file filehandle
+        :param ffpe_n: Parameter to determine if all mismatches should be classified as ffpe, or solely C:G>T:A
+        :param ext_fun: Function for extracting the UMI-tag from a read
+        :param spl_fun: Function used for splitting the UMI-tag in a read
+        :param q_spl_cha: Character used for splitting the UMI-tag from the query-name
+        :param u_spl_cha: Character used for splitting the UMI-tag
+        :param backend: Backend used for extracting the read nucleotides, either "fetch" for pos_sweep and nuc_check,
+        or "pileup" for pileup_sweep
+        :param clu_fun: Optional function merging the UMI-families of a position, see clust_function.umi_clust
+        :param read_cache: Optional ReadCache shared by the sweep_annotate calls of a consumer, in which the reads
+        ending before the first variant-record of every contig are evicted
+        :param fam_out: Whether to add the FamTable of every alternative allele to the rec_annotate output
+        :param read_flt: Optional ReadFilter dropping reads before they are grouped into UMI-families
+
+    Returns:
+        :return: Returns a list containing the rec_annotate output for every variant-record tuple, in input order
+    """
+    def umi_fun(read):
+        # A KeyError is stored rather than raised, and raised by var_extract for every record covered by the read.
+        # Reads dropped by the read filter are left unparsed, and are dropped by read_annotate
+        if read_flt is not None and read_flt.read_drop(read) is not None:
+            return
+        try:
+            return pos_function.umi_parse(read, ext_fun, spl_fun, q_spl_cha, u_spl_cha)
+        except KeyError as e:
+            return e
+
+    chr_dict = {}
+    for rec_ind, rec_tpl in enumerate(rec_tpls):
+        if build_function.rec_allele(rec_tpl):
+            chr_dict.setdefault(rec_tpl[0], []).append(rec_ind)
+
+    ann_lst = [None] * len(rec_tpls)
+    for rec_chr, ind_lst in chr_dict.items():
+        pos_dict = {}
+        for rec_ind in ind_lst:
+            pos_dict.setdefault(rec_tpls[rec_ind][1] - 1, []).append(rec_ind)
+        if read_cache is not None:
+            read_cache.evict(bam_file.get_tid(rec_chr), min(pos_dict))
+        if read_cache is not None and backend == "pileup":
+            for pos, bam_lst, nuc_lst in pileup_sweep(bam_file, rec_chr, list(pos_dict)):
+                umi_lst = [read_cache.get(read, umi_fun)[3] for read in bam_lst]
+                for rec_ind in pos_dict[pos]:
+                    ann_lst[rec_ind] = build_function.read_annotate(rec_tpls[rec_ind], bam_lst, umi_lst, ffpe_n,
+                                                                    ext_fun, spl_fun, q_spl_cha, u_spl_cha, nuc_lst,
+                                                                    clu_fun, fam_out, read_flt)
+        elif read_cache is not None:
+            for pos, bam_lst, ent_lst in pos_sweep(bam_file, rec_chr, list(pos_dict),
+                                                   functools.partial(read_cache.get, umi_fun=umi_fun)):
+                umi_lst = [read_ent[3] for read_ent in ent_lst]
+                nuc_lst = [nuc_function.map_nuc(read, read_ent[4], pos) for read, read_ent in zip(bam_lst, ent_lst)]
+                for rec_ind in pos_dict[pos]:
+                    ann_lst[rec_ind] = build_function.read_annotate(rec_tpls[rec_ind], bam_lst, umi_lst, ffpe_n,
+                                                                    ext_fun, spl_fun, q_spl_cha, u_spl_cha, nuc_lst,
+                                                                    clu_fun, fam_out, read_flt)
+        elif backend == "pileup":
+            for pos, bam_lst, nuc_lst in pileup_sweep(bam_file, rec_chr, list(pos_dict)):
+                for rec_ind in pos_dict[pos]:
+                    ann_lst[rec_ind] = build_function.read_annotate(rec_tpls[rec_ind], bam_lst, None, ffpe_n,
+                                                                    ext_fun, spl_fun, q_spl_cha, u_spl_cha, nuc_lst,
+                                                                    clu_fun, fam_out, read_flt)
+        else:
+            for pos, bam_lst, umi_lst in pos_sweep(bam_file, rec_chr, list(pos_dict), umi_fun):
+                for rec_ind in pos_dict[pos]:
+                    ann_lst[rec_ind] = build_function.read_annotate(rec_tpls[rec_ind], bam_lst, umi_lst, ffpe_n,
+                                                                    ext_fun, spl_fun, q_spl_cha, u_spl_cha, None,
+                                                                    clu_fun, fam_out, read_flt)
+    return ann_lst
@@ -0,0 +1,220 @@
+import random
+import pysam
+
+# Profiles of the synthetic data: the no. contigs and variant loci per contig, the no. read-pairs covering every locus,
+# the read length and the range of insert sizes. The amplicon profile sequences every locus as a fixed amplicon,
+# with every read-pair of the locus starting at the same position
+SYN_PROFILES = {"panel": {"n_chr": 2, "n_loci": 60, "depth": 1000, "read_len": 100, "ins_min": 150, "ins_max": 300,
+                          "fam_mean": 3.0, "amplicon": False},
+                "exome": {"n_chr": 4, "n_loci": 250, "depth": 150, "read_len": 100, "ins_min": 150, "ins_max": 300,
+                          "fam_mean": 2.0, "amplicon": False},
+                "amplicon": {"n_chr": 1, "n_loci": 10, "depth": 20000, "read_len": 150, "ins_min": 150,
+                             "ins_max": 150, "fam_mean": 8.0, "amplicon": True}}
+# Default molecule-level rates of the synthetic data, shared by every profile
+SYN_RATES = {"duplex_frac": 0.8, "var_frac": 0.05, "ffpe_rate": 0.05, "seq_err": 0.001, "umi_err": 0.0}
+# Alternative allele of a deaminated reference nucleotide, the C:G>T:A transitions classified as FFPE-artefacts
+FFPE_ALTS = {"C": "T", "G": "A"}
+# Distance between the variant loci of a contig, and from the loci to the contig ends
+LOCUS_GAP = 1000
+
+
+def fam_size(rnd, fam_mean):
+    """ The fam_size function draws the no. read-pairs of a strand of a molecule, from a geometric distribution with
+    the mean fam_mean, so that UMI-families of a single read-pair are the most common as in real libraries.
+
+    Args:
+        :param rnd: Random number generator
+        :param fam_mean: Mean no. read-pairs of a strand, at least 1
+
+    Returns:
+        :return: Returns the no. read-pairs of the strand
+    """
+    fam_n = 1
+    while rnd.random() > 1 / fam_mean:
+        fam_n += 1
+    return fam_n
+
+
+def seq_errs(rnd, seq, seq_err):
+    """ The seq_errs function adds sequencing errors to a read sequence, substituting every nucleotide with the chance
+    seq_err. The no. errors is drawn first, so that the sequence is solely copied for reads with an error.
+
+    Args:
+        :param rnd: Random number generator
+        :param seq: Read sequence
+        :param seq_err: Chance of a substitution at every nucleotide
+
+    Returns:
+        :return: Returns the read sequence with its errors
+    """
+    if seq_err <= 0:
+        return seq
+    err_inds = [nuc_ind for nuc_ind in range(len(seq)) if rnd.random() < seq_err]
+    if not err_inds:
+        return seq
+    seq = list(seq)
+    for nuc_ind in err_inds:
+        seq[nuc_ind] = rnd.choice("ACGT".replace(seq[nuc_ind], ""))
+    return "".join(seq)
+
+
+def pair_maker(qr_nm, chr_ind, start, ins_size, frag_seq, read_len, neg_str):
+    """ The pair_maker function creates the two reads of a read-pair sequencing a fragment. Read 1 of the positive
+    strand is forward and read 2 reverse, and vice versa for the negative strand, as expected by umi_parse.
+
+    Args:
+        :param qr_nm: Query-name of the read-pair, holding the UMI-tag of its strand
+        :param chr_ind: Index of the contig in the BAM header
+        :param start: 0-based start of the fragment
+        :param ins_size: Insert size of the fragment, at least read_len
+        :param frag_seq: Sequence of the fragment, on the plus strand
+        :param read_len: Length of the reads
+        :param neg_str: True for a read-pair of the negative strand
+
+    Returns:
+        :return: Returns a list of the two reads
+    """
+    mate_start = start + ins_size - read_len
+    read_lst = []
+    for read_flag, read_start, read_seq in ((99, start, frag_seq[:read_len]),
+                                            (147, mate_start, frag_seq[ins_size - read_len:])):
+        if neg_str:
+            read_flag = 83 if read_flag == 99 else 163
+        read = pysam.AlignedSegment()
+        read.query_name = qr_nm
+        read.flag = read_flag
+        read.reference_id = chr_ind
+        read.reference_start = read_start
+        read.next_reference_id = chr_ind
+        read.next_reference_start = start if read_start == mate_start else mate_start
+        read.template_length = ins_size if read_start == start else -ins_size
+        read.mapping_quality = 60
+        read.cigarstring = str(read_len) + "M"
+        read.query_sequence = read_seq
+        read.query_qualities = pysam.qualitystring_to_array("I" * read_len)
+        read_lst.append(read)
+    return read_lst
+
+
+def locus_reads(rnd, chr_ind, ref_seq, rec_pos, alt_nuc, syn_prof, syn_rates, mol_cnt):
+    """ The locus_reads function creates the read-pairs covering a variant locus. Every molecule carries a random
+    UMI-tag and is sequenced on the positive strand, and on the negative strand as well for a duplex_frac of the
+    molecules, with fam_size read-pairs per strand. A var_frac of the molecules carry the variant on both strands, and
+    for a C:G reference a ffpe_rate of the others carry a deamination artefact on a single strand, the positive strand
+    for a C and the negative strand for a G reference, as classified by ffpe_code. Every read-pair has a umi_err chance
+    of a substitution in its UMI-tag and a seq_err chance of a substitution at every nucleotide.
+
+    Args:
+        :param rnd: Random number generator
+        :param chr_ind: Index of the contig in the BAM header
+        :param ref_seq: Sequence of the contig
+        :param rec_pos: 0-based position of the locus
+        :param alt_nuc: The variant nucleotide of the locus
+        :param syn_prof: Profile of the synthetic data, see SYN_PROFILES
+        :param syn_rates: Molecule-level rates of the synthetic data, see SYN_RATES
+        :param mol_cnt: Dict counting the no. molecules of every type, updated by the function
+
+    Returns:
+        :return: Returns a list of the reads covering the locus
+    """
+    read_len = syn_prof["read_len"]
+    read_lst = []
+    n_pairs = 0
+    while n_pairs < syn_prof["depth"]:
+        ins_size = rnd.randint(syn_prof["ins_min"], syn_prof["ins_max"])
+        if syn_prof["amplicon"]:
+            start = rec_pos - ins_size // 2
+        else:
+            start = rec_pos - rnd.randint(0, ins_size - 1)
+        frag_seq = ref_seq[start:start + ins_size]
+        umi_l = "".join(rnd.choice("ACGT") for _ in range(8))
+        umi_r = "".join(rnd.choice("ACGT") for _ in range(8))
+        mol_type = "reference"
+        mol_rnd = rnd.random()
+        if mol_rnd < syn_rates["var_frac"]:
+            mol_type = "variant"
+        elif ref_seq[rec_pos] in FFPE_ALTS and mol_rnd < syn_rates["var_frac"] + syn_rates["ffpe_rate"]:
+            mol_type = "ffpe"
+        mol_cnt[mol_type] = mol_cnt.get(mol_type, 0) + 1
+        for neg_str in (False, True):
+            if neg_str and rnd.random() >= syn_rates["duplex_frac"]:
+                break
+            str_seq = frag_seq
+            if mol_type == "variant" or (mol_type == "ffpe" and neg_str == (ref_seq[rec_pos] == "G")):
+                str_seq = frag_seq[:rec_pos - start] + alt_nuc + frag_seq[rec_pos - start + 1:]
+            for _ in range(fam_size(rnd, syn_prof["fam_mean"])):
+                umi_tag = umi_l + umi_r
+                if rnd.random() < syn_rates["umi_err"]:
+                    err_ind = rnd.randrange(len(umi_tag))
+                    umi_tag = (umi_tag[:err_ind] + rnd.choice("ACGT".replace(umi_tag[err_ind], "")) +
+                               umi_tag[err_ind + 1:])
+                # The UMI-halves are swapped in the query-names of the negative strand, see umi_maker. Query-names are
+                # unique within the BAM-file, as expected by the ReadCache
+                if neg_str:
+                    qr_nm = "syn{}:{}:{}:n_{}+{}".format(chr_ind, rec_pos, n_pairs, umi_tag[8:], umi_tag[:8])
+                else:
+                    qr_nm = "syn{}:{}:{}:p_{}+{}".format(chr_ind, rec_pos, n_pairs, umi_tag[:8], umi_tag[8:])
+                read_seq = seq_errs(rnd, str_seq, syn_rates["seq_err"])
+                read_lst += pair_maker(qr_nm, chr_ind, start, ins_size, read_seq, read_len, neg_str)
+                n_pairs += 1
+    return read_lst
+
+
+def syn_maker(out_prefix, prof_nm="panel", seed=1, scale=1.0, **rate_args):
+    """ The syn_maker function writes an indexed synthetic BAM-file and the matching bgzipped and indexed VCF-file of
+    a profile, for reproducible benchmarks of FUSAC. The variant loci are evenly spaced on every contig, and the
+    alternative allele of a C:G locus is its C:G>T:A transition, so that its FFPE-artefacts are classified as such.
+    The same seed, profile and rates always generate the same files.
+
+    Args:
+        :param out_prefix: Prefix of the files, written as <prefix>.bam and <prefix>.vcf.gz
+        :param prof_nm: Name of the profile, one of SYN_PROFILES
+        :param seed: Seed for the random number generator
+        :param scale: Factor scaling the no. variant loci and the depth of the profile, for smaller or larger runs
+        :param rate_args: Molecule-level rates overriding those of SYN_RATES, such as ffpe_rate=0.1
+
+    Returns:
+        :return: Returns a dict with the paths of the files and the no. reads, variant-records and molecules
+        Example dict:
+        {"bam": "syn.bam", "vcf": "syn.vcf.gz", "n_reads": 240000, "n_recs": 120,
+         "molecules": {"reference": 37000, "variant": 2000, "ffpe": 900}}
+    """
+    syn_prof = dict(SYN_PROFILES[prof_nm])
+    syn_prof["n_loci"] = max(1, int(syn_prof["n_loci"] * scale))
+    syn_prof["depth"] = max(1, int(syn_prof["depth"] * scale))
+    syn_rates = dict(SYN_RATES, **rate_args)
+    rnd = random.Random(seed)
+    chr_len = (syn_prof["n_loci"] + 1) * LOCUS_GAP
+    chr_lst = ["chr" + str(chr_ind + 1) for chr_ind in range(syn_prof["n_chr"])]
+    bam_head = {"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": chr_nm, "LN": chr_len} for chr_nm in chr_lst]}
+    vcf_head = pysam.VariantHeader()
+    for chr_nm in chr_lst:
+        vcf_head.contigs.add(chr_nm, length=chr_len)
+    vcf_head.add_sample("Tumour")
+    vcf_head.formats.add("GT", 1, "String", "Genotype")
+    mol_cnt = {}
+    n_reads = 0
+    bam_path = out_prefix + ".bam"
+    vcf_path = out_prefix + ".vcf.gz"
+    with pysam.AlignmentFile(bam_path, "wb", header=bam_head) as bam_file, \
+            pysam.VariantFile(vcf_path, "wz", header=vcf_head) as vcf_file:
+        for chr_ind, chr_nm in enumerate(chr_lst):
+            ref_seq = "".join(rnd.choice("ACGT") for _ in range(chr_len))
+            # The reads of a contig are sorted once every locus of the contig has been sequenced
+            read_lst = []
+            for loc_ind in range(syn_prof["n_loci"]):
+                rec_pos = (loc_ind + 1) * LOCUS_GAP
+                ref_nuc = ref_seq[rec_pos]
+                alt_nuc = FFPE_ALTS.get(ref_nuc) or rnd.choice("ACGT".replace(ref_nuc, ""))
+                read_lst += locus_reads(rnd, chr_ind, ref_seq, rec_pos, alt_nuc, syn_prof, syn_rates, mol_cnt)
+                record = vcf_file.new_record(contig=chr_nm, start=rec_pos, alleles=(ref_nuc, alt_nuc))
+                record.samples["Tumour"]["GT"] = (0, 1)
+                vcf_file.write(record)
+            read_lst.sort(key=lambda read: read.reference_start)
+            for read in read_lst:
+                bam_file.write(read)
+            n_reads += len(read_lst)
+    pysam.index(bam_path)
+    pysam.tabix_index(vcf_path, preset="vcf", force=True)
+    return {"bam": bam_path, "vcf": vcf_path, "n_reads": n_reads, "n_recs": syn_prof["n_chr"] * syn_prof["n_loci"],
+            "molecules": mol_cnt}
@@ -3,10 +3,31 @@
 
 # Import modules
 import unittest
+import pysam
+import os
+import tempfile
+import json
+from types import SimpleNamespace
 import nuc_function as nf
 import build_function as buf
 import count_function as cf
 import pos_function as pf
+import pool_function as plf
+import sweep_function as swf
+import clust_function as clf
+import cache_function as caf
+import stat_function as stf
+import arrow_function as arf
+import out_function as otf
+import flt_function as flf
+import prof_function as prf
+import ckpt_function as ckf
+import region_function as rgf
+import synth_function as sf
+import bench_fusac as bf
+import fusac as fus
+import threading
+import functools
 
 
 class ReadCheck:
@@ -17,6 +38,8 @@ class ReadCheck:
         self.is_reverse = is_reverse
         self.query_sequence = query_sequence
         self.query_name = query_name
+        self.reference_start = 0
+        self.cigartuples = [(0, len(query_sequence))]
 
     def get_reference_positions(self, full_length):
         if full_length:
@@ -25,6 +48,50 @@ class ReadCheck:
             return list(range(0, len(self.query_sequence)+1))
 
 
+class ShardCheck:
+
+    def __init__(self, con_len, index, map_reads=None, file_order=None):
+        self.index = index
+        self.header = SimpleNamespace(contigs={c: SimpleNamespace(length=l) for c, l in con_len.items()})
+        self.references = list(con_len)
+        self.lengths = list(con_len.values())
+        self.map_reads = map_reads
+        self.file_order = index if file_order is None else file_order
+        self.file_pos = 0
+
+    def get_index_statistics(self):
+        return [SimpleNamespace(contig=c, mapped=m) for c, m in self.map_reads.items()]
+
+    def fetch(self, contig):
+        if contig in self.file_order:
+            self.file_pos = self.file_order.index(contig)
+            yield contig
+
+    def tell(self):
+        return self.file_pos
+
+
+class WriteCheck:
+
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+
+
+class SweepCheck:
+
+    def __init__(self, read_lst):
+        self.read_lst = read_lst
+        self.fetches = 0
+
+    def fetch(self, contig, start, end):
+        self.fetches += 1
+        return iter([read for read in self.read_lst if read.reference_start < end and
+                     swf.read_end(read) > start])
+
+
 class TestCase(unittest.TestCase):
     def setUp(self):
         self.rec_pos = 1
@@ -209,6 +276,50 @@ class TestCase(unittest.TestCase):
                               {self.umi_key: {'Single_Hits': {'Pos_Str_Single': None, 'Neg_Str_Single': {}},
                                               'Mate_Hits': {}}}]
 
+    def test_nuc_check_cigar(self):
+        # Tests that nuc_check returns the same nucleotide as the index in get_reference_positions(full_length=True)
+        # for every position around reads with soft clips, hard clips, insertions, deletions and skipped regions
+        for cig_str, seq in (("10M", "ACGTNACGTA"), ("3S7M", "TTTACGTNAC"), ("2H4M2I4M3S", "ACGTCCNNGTAAA"),
+                             ("3M2D4M1N3M", "ACGTACGTAC"), ("2S3=1X2M2D2M2I1M", "ACGTACGTACGTA"),
+                             ("4M5N2M4S", "ACGTNNACGT")):
+            read = pysam.AlignedSegment()
+            read.query_name = "CigarRead_AAATTT+CCCGGG"
+            read.query_sequence = seq
+            read.reference_start = 100
+            read.cigarstring = cig_str
+            read_pos = read.get_reference_positions(full_length=True)
+            for rec_pos in range(95, 125):
+                exp_nuc = seq[read_pos.index(rec_pos)] if rec_pos in read_pos else None
+                self.assertEqual(nf.nuc_check(read, rec_pos), exp_nuc, cig_str + " " + str(rec_pos))
+                self.assertEqual(nf.map_nuc(read, nf.ref_map(read), rec_pos), exp_nuc, cig_str + " " + str(rec_pos))
+
+    def test_allele_check(self):
+        # Tests that allele_check calls the reference allele, the alternative allele or neither for reads carrying
+        # deletions, insertions and MNVs, and makes no call for reads not spanning the reference allele
+        for cig_str, seq, ref_allele, alt_allele, exp_all in (
+                ("10M", "ACGTAACGTA", "CGTA", "C", nf.REF_SYM), ("2M3D5M", "ACACGTAXXX", "CGTA", "C", nf.ALT_SYM),
+                ("2M2D6M", "ACACGTAXXX", "CGTA", "C", "N"), ("2M2I6M", "ACTTGTAACG", "C", "CTT", nf.ALT_SYM),
+                ("4M", "ACGT", "C", "CTT", nf.REF_SYM), ("1S2M2I5M", "AACTTGTAAC", "C", "CTT", nf.ALT_SYM),
+                ("4M6S", "ACGTAACGTA", "CGTA", "C", None), ("3M", "ACG", "CGTA", "C", None),
+                ("2M1N7M", "ACGTAACGTA", "CGTA", "C", None), ("10M", "ATAAAACGTA", "CG", "TA", nf.ALT_SYM),
+                ("10M", "ACTGAACGTA", "CG", "TA", "N"), ("2M1D1I6M", "ACAGTAACGT", "CG", "CA", nf.ALT_SYM)):
+            read = pysam.AlignedSegment()
+            read.query_name = "IndelRead_AAATTT+CCCGGG"
+            read.query_sequence = seq
+            read.reference_start = 100
+            read.cigarstring = cig_str
+            self.assertEqual(nf.allele_check(read, 101, ref_allele, alt_allele), exp_all, cig_str + " " + seq)
+            # The alternative allele is called by its ALT_SYMS symbol as the second allele of a multi-allelic record
+            exp_sym = {nf.ALT_SYM: nf.ALT_SYMS[1]}.get(exp_all, exp_all)
+            self.assertEqual(nf.allele_call(read, 101, ref_allele, (ref_allele + "GG", alt_allele)), exp_sym)
+
+    def test_nuc_check_mock(self):
+        # Tests nuc_check on clean, unknown and deletion-marked mock reads as well as positions outside the read
+        self.assertEqual(nf.nuc_check(self.f1c, self.rec_pos), self.ref_nuc)
+        self.assertEqual(nf.nuc_check(self.ref_lst[0], 40), None)
+        self.assertEqual(nf.nuc_check(self.n_lst[0], self.rec_pos), self.unk_sym)
+        self.assertEqual(nf.nuc_check(self.del_lst[0], self.rec_pos), self.del_sym)
+
     def test_qrn_ext(self):
         # Test method for the qrn_ext function with slight variations to the read query-name structure
         self.assertEqual(pf.qrn_ext(self.f1c, self.qrn_spl_cha), "AAATTT+CCCGGG")
@@ -249,6 +360,12 @@ class TestCase(unittest.TestCase):
         self.assertEqual(pf.umi_maker(self.r2c, pf.cha_splt(pf.qrn_ext(self.r2c, self.qrn_spl_cha), "+")),
                          ["PairedCleanRead_AAATTT+CCCGGG", "Pos_Str", "AAATTT_CCCGGG"])
 
+    def test_umi_parse(self):
+        # Tests that the umi_parse function agrees with umi_maker on the strand and umi-key of every read
+        for read in (self.f1c, self.r2c, self.f2c, self.r1c):
+            umi_res = pf.umi_parse(read, self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha)
+            self.assertEqual(umi_res, pf.umi_maker(read, pf.cha_splt(pf.qrn_ext(read, self.qrn_spl_cha), "+")))
+
     def test_pos_hits_c(self):
         # Test method for the pos-hits function for "clean" data
         self.assertEqual(pf.pos_hits(self.str1_ref_lst, self.rec_pos), [self.ref_nuc, None])
@@ -279,6 +396,13 @@ class TestCase(unittest.TestCase):
         self.assertEqual(pf.pos_hits(self.str1_nm_lst, self.rec_pos), [None, None])
         self.assertEqual(pf.pos_hits(self.str2_nm_lst, self.rec_pos), ["C", None])
 
+    def test_fam_hits(self):
+        # Test method for the fam_hits function, returning both the mate and singleton consensus for each strand
+        self.assertEqual(pf.fam_hits({"Pos_Str": self.str1_ref_lst, "Neg_Str": {}}, self.rec_pos),
+                         {"Pos_Str": [self.ref_nuc, None], "Neg_Str": None})
+        self.assertEqual(pf.fam_hits({"Pos_Str": self.str1_ffpe_lst, "Neg_Str": self.str2_ffpe_lst}, self.rec_pos),
+                         {"Pos_Str": [self.var_nuc, None], "Neg_Str": [self.ref_nuc, None]})
+
     def test_ffpe_finder_c(self):
         # Test method for the ffpe_finder function
         # First checks the clean list
@@ -318,56 +442,671 @@ class TestCase(unittest.TestCase):
     def test_var_extract_c(self):
         self.assertDictEqual(buf.var_extract(self.ref_lst, self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
                                              self.ext_fun_1, self.spl_fun_1,
-                                             self.qrn_spl_cha, self.umi_spl_cha)[0], self.r_ffpe_d[0])
+                                             self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0), self.r_ffpe_d[0])
 
     def test_var_extract_m(self):
         self.assertDictEqual(buf.var_extract(self.var_lst, self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
                                              self.ext_fun_1, self.spl_fun_1,
-                                             self.qrn_spl_cha, self.umi_spl_cha)[0], self.v_ffpe_d[0])
+                                             self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0), self.v_ffpe_d[0])
 
     def test_var_extract_f(self):
         self.assertDictEqual(buf.var_extract(self.ffpe_lst, self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
                                              self.ext_fun_1, self.spl_fun_1,
-                                             self.qrn_spl_cha, self.umi_spl_cha)[0], self.f_ffpe_d[0])
+                                             self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0), self.f_ffpe_d[0])
 
     def test_var_extract_n(self):
         self.assertDictEqual(buf.var_extract(self.n_lst, self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
                                              self.ext_fun_1, self.spl_fun_1,
-                                             self.qrn_spl_cha, self.umi_spl_cha)[0], self.n_ffpe_d[0])
+                                             self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0), self.n_ffpe_d[0])
 
     def test_var_extract_d(self):
         self.assertDictEqual(buf.var_extract(self.del_lst, self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
                                              self.ext_fun_1, self.spl_fun_1,
-                                             self.qrn_spl_cha, self.umi_spl_cha)[0], self.d_ffpe_d[0])
+                                             self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0), self.d_ffpe_d[0])
 
     def test_var_extract_sing_c(self):
         self.assertDictEqual(buf.var_extract(self.sing_ref_lst, self.rec_pos, self.var_nuc, self.ref_nuc,
                                              self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
-                                             self.qrn_spl_cha, self.umi_spl_cha)[0],
+                                             self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0),
                              self.str1_ffpe_r_d[0])
 
     def test_var_extract_sing_m(self):
         self.assertDictEqual(buf.var_extract(self.sing_var_lst, self.rec_pos, self.var_nuc, self.ref_nuc,
                                              self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
-                                             self.qrn_spl_cha, self.umi_spl_cha)[0],
+                                             self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0),
                              self.str1_ffpe_v_d[0])
 
     def test_var_extract_sing_f(self):
         self.assertDictEqual(buf.var_extract(self.sing_ffpe_lst, self.rec_pos, self.var_nuc, self.ref_nuc,
                                              self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
-                                             self.qrn_spl_cha, self.umi_spl_cha)[0],
+                                             self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0),
                              self.str1_ffpe_f_d[0])
 
     def test_var_extract_sing_n(self):
         self.assertDictEqual(
             buf.var_extract(self.sing_n_lst, self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
                             self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha,
-                            self.umi_spl_cha)[0],  self.str1_ffpe_n_d[0])
+                            self.umi_spl_cha).fam_dict(0),  self.str1_ffpe_n_d[0])
 
     def test_var_extract_sing_d(self):
         self.assertDictEqual(
             buf.var_extract(self.sing_del_lst, self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
-                            self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha)[0], self.str1_ffpe_d_d[0])
+                            self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0),
+            self.str1_ffpe_d_d[0])
+
+    def test_chunk_maker(self):
+        # Tests that the chunk_maker function keeps the record order and yields a final partial chunk
+        self.assertEqual(list(plf.chunk_maker(iter(range(7)), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(plf.chunk_maker(iter(range(6)), 3)), [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(list(plf.chunk_maker(iter([]), 3)), [])
+
+    def test_samp_apply(self):
+        # Tests that chunk_write gives every sample the annotation of its own BAM-file, leaves the samples without a
+        # BAM-file missing, and skips the records not annotated for any sample
+        vcf_head = pysam.VariantHeader()
+        vcf_head.contigs.add("chr1")
+        for sample in ("Tumour", "Normal", "Other"):
+            vcf_head.add_sample(sample)
+        vcf_head.filters.add("FFPE", None, None, "FFPE Artefact")
+        vcf_head.formats.add("UMI", "A", "String", "UMI")
+        vcf_head.formats.add("SUMI", "A", "String", "SUMI")
+        rec_chunk = [vcf_head.new_record(contig="chr1", start=rec_pos, stop=rec_pos + 1, alleles=("C", "T"))
+                     for rec_pos in (10, 20)]
+        tum_ann = {"UMI": "0;1", "SUMI": "0;0", "FFPE": True}
+        nor_ann = {"UMI": "2;0", "SUMI": "0;0", "FFPE": False}
+        ann_res = [SimpleNamespace(get=lambda: [tum_ann, None]), SimpleNamespace(get=lambda: [nor_ann, None])]
+        rec_out = []
+        plf.chunk_write(SimpleNamespace(write=rec_out.append), rec_chunk, ann_res, ["Tumour", "Normal"])
+        self.assertEqual(len(rec_out), 1)
+        self.assertEqual(rec_out[0].samples["Tumour"]["UMI"], ("0;1",))
+        self.assertEqual(rec_out[0].samples["Normal"]["UMI"], ("2;0",))
+        self.assertEqual(rec_out[0].samples["Other"]["UMI"], (".",))
+        self.assertEqual(list(rec_out[0].filter), ["FFPE"])
+        self.assertEqual(list(rec_chunk[0].filter), [])
+
+    def test_fmt_apply(self):
+        # Tests that the typed mode gives every sample an integer field for every value of the UMI and SUMI strings,
+        # for every alternative allele, and that samp_sup reads the same support from either format
+        umi_sups = ((0, 0, 1, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0), (0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0))
+        rec_ann = {"UMI": tuple(";".join(map(str, umi_sup)) for umi_sup in umi_sups), "SUMI": ("0", "0"),
+                   "UMI_Sup": umi_sups, "SUMI_Sup": ((0,) * 13, (0,) * 13), "FFPE": True}
+        rec_outs = {}
+        for fmt_mode in buf.FMT_MODES:
+            vcf_head = pysam.VariantHeader()
+            vcf_head.contigs.add("chr1")
+            vcf_head.add_sample("Tumour")
+            vcf_head.filters.add("FFPE", None, None, "FFPE Artefact")
+            buf.fmt_header(vcf_head, fmt_mode)
+            record = vcf_head.new_record(contig="chr1", start=10, stop=11, alleles=("C", "T", "A"))
+            rec_outs[fmt_mode] = buf.rec_apply(record, rec_ann, fmt_mode).samples["Tumour"]
+        self.assertNotIn("UMI_FFPE", rec_outs["packed"])
+        self.assertNotIn("UMI", rec_outs["typed"])
+        self.assertEqual(rec_outs["typed"]["UMI_FFPE"], (1, 0))
+        self.assertEqual(rec_outs["typed"]["UMI_ALT_PP"], (1, 1))
+        self.assertEqual(rec_outs["both"]["UMI"], rec_ann["UMI"])
+        for samp_rec in rec_outs.values():
+            self.assertEqual(stf.samp_sup(samp_rec), [0, 0, 1, 0, 0])
+
+    def test_stat_writer(self):
+        # Tests that the StatWriter writes every record to the output and its statistics rows to the CSV-files of the
+        # mode, leaving out the unannotated samples, the standard mode non-C:G>T:A records and the excluded records
+        vcf_head = pysam.VariantHeader()
+        vcf_head.contigs.add("chr1")
+        vcf_head.add_sample("Tumour")
+        vcf_head.add_sample("Normal")
+        vcf_head.filters.add("FFPE", None, None, "FFPE Artefact")
+        vcf_head.formats.add("UMI", "A", "String", "UMI")
+        rec_lst = []
+        for rec_pos, rec_alleles, rec_umi in ((10, ("C", "T"), "6;3;1;0;0;0;0"), (20, ("A", "G"), "5;4;1;0;0;0;0"),
+                                              (30, ("G", "A"), "2;0;0;0;0;0;0")):
+            record = vcf_head.new_record(contig="chr1", start=rec_pos, stop=rec_pos + 1, alleles=rec_alleles)
+            record.samples["Tumour"]["UMI"] = rec_umi
+            record.samples["Normal"]["UMI"] = "."
+            if rec_umi[4] != "0":
+                record.filter.add("FFPE")
+            rec_lst.append(record)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stat_dir = os.path.join(tmp_dir, "FUSAC_Stats")
+            rec_out = []
+            for ffpe_n, per_exl in (("standard", ["0", "100"]), ("all", ["0", "5"])):
+                stat_wrt = stf.StatWriter(SimpleNamespace(write=rec_out.append), ffpe_n, per_exl, stat_dir)
+                for record in rec_lst:
+                    stat_wrt.write(record)
+                stat_wrt.close()
+                with open(os.path.join(stat_dir, "fusac_stats.csv")) as csv_file:
+                    stat_csv = csv_file.read().splitlines()
+                if ffpe_n == "standard":
+                    self.assertEqual(stat_csv, [",Ref,Var,FFPE,Perc,NucChange", "0,6,3,1,10.0,C>T"])
+                else:
+                    self.assertEqual(stat_csv, [",Ref,Var,FFPE,Perc,NucChange"])
+                    with open(os.path.join(stat_dir, "fusac_all_stats.csv")) as csv_file:
+                        self.assertEqual(csv_file.read().splitlines()[1:], ["0,2,0,0,0.0,G>A"])
+            self.assertEqual(rec_out, rec_lst + rec_lst)
+
+    @unittest.skipIf(arf.pa is None, "pyarrow is not installed")
+    def test_arrow_writer(self):
+        # Tests that the ArrowWriter writes the support of every sample as integer columns and every UMI-family as a
+        # row, across row groups, leaving out the unannotated samples
+        f1s = ReadCheck(True, False, False, "ACCGATCGAATCGATCGATCGATCGATCGATCG", "PairedSingRead_GGGAAA+TTTCCC")
+        r2s = ReadCheck(False, True, True, "ACCGATCGAATCGATCGATCGATCGATCGATCG", "PairedSingRead_GGGAAA+TTTCCC")
+        fam_tbl = buf.var_extract(self.ffpe_lst + [f1s, r2s], self.rec_pos, self.var_nuc, self.ref_nuc,
+                                  self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha)
+        fam_cnt = cf.fam_count(fam_tbl)
+        rec_ann = {"UMI_Sup": (buf.sup_count(fam_cnt, self.var_nuc, self.ref_nuc, 0),),
+                   "SUMI_Sup": (buf.sup_count(fam_cnt, self.var_nuc, self.ref_nuc, 1),), "Fam": (fam_tbl,)}
+        vcf_head = pysam.VariantHeader()
+        vcf_head.contigs.add("chr1")
+        record = vcf_head.new_record(contig="chr1", start=0, stop=1, alleles=("C", "T"))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_prefix = os.path.join(tmp_dir, "fusac")
+            ann_wrt = arf.ArrowWriter(out_prefix, ["Tumour", "Normal"], fam_out=True, row_group=2)
+            for _ in range(3):
+                ann_wrt.add(record, [rec_ann, None])
+            ann_wrt.close()
+            var_tbl = arf.pq.read_table(out_prefix + "_variants.parquet")
+            fam_file = arf.pq.ParquetFile(out_prefix + "_families.parquet")
+            fam_rows = fam_file.read().to_pylist()
+            self.assertEqual(fam_file.metadata.num_row_groups, 3)
+        self.assertEqual(var_tbl.num_rows, 3)
+        var_row = var_tbl.to_pylist()[0]
+        self.assertEqual((var_row["contig"], var_row["pos"], var_row["mut_type"], var_row["sample"], var_row["ffpe"]),
+                         ("chr1", 1, "C>T", "Tumour", True))
+        self.assertEqual([var_row["umi_" + col_nm] for col_nm in arf.SUP_COLS], list(rec_ann["UMI_Sup"][0]))
+        self.assertEqual(len(fam_rows), 6)
+        self.assertEqual({(fam_row["mate_pos_nuc"], fam_row["mate_neg_nuc"], fam_row["mate_cat"])
+                          for fam_row in fam_rows}, {("T", "C", "FFPE"), ("C", None, None)})
+
+    def test_out_index(self):
+        # Tests that the output format follows the extension of the output path, and that the compressed formats are
+        # indexed and can be fetched from
+        self.assertEqual(otf.out_mode("fusac_output.vcf", 9), "w")
+        self.assertEqual(otf.out_mode("fusac_output.vcf.gz"), "wz")
+        self.assertEqual(otf.out_mode("fusac_output.bcf", 1), "wb1")
+        self.assertEqual(otf.out_mode("fusac_output.VCF.GZ"), "wz")
+        vcf_head = pysam.VariantHeader()
+        vcf_head.contigs.add("chr1", length=1000)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for out_nm, idx_ext in (("fusac.vcf", None), ("fusac.vcf.gz", ".tbi"), ("fusac.bcf", ".csi")):
+                out_path = os.path.join(tmp_dir, out_nm)
+                n_vcf = otf.out_open(out_path, vcf_head, 1, 2)
+                for rec_pos in (10, 20, 30):
+                    n_vcf.write(vcf_head.new_record(contig="chr1", start=rec_pos, stop=rec_pos + 1,
+                                                    alleles=("C", "T")))
+                n_vcf.close()
+                idx_path = otf.out_index(out_path)
+                if idx_ext is None:
+                    self.assertIsNone(idx_path)
+                    continue
+                self.assertEqual(idx_path, out_path + idx_ext)
+                with pysam.VariantFile(out_path) as o_vcf:
+                    self.assertEqual([record.pos for record in o_vcf.fetch("chr1", 15, 40)], [21, 31])
+
+    def test_ckpt_writer(self):
+        # Tests that the CkptWriter adds a mark of the written records to the checkpoint once they are done, and that
+        # a resumed run continues from the latest mark whose records can be read from the partial output
+        vcf_head = pysam.VariantHeader()
+        vcf_head.contigs.add("chr1", length=1000)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out_path = os.path.join(tmp_dir, "fusac.vcf")
+            ckpt_path = out_path + ckf.CKPT_EXT
+            self.assertIsNone(ckf.ckpt_load(ckpt_path))
+            n_vcf = otf.out_open(out_path, vcf_head)
+            ckpt_wrt = ckf.CkptWriter(n_vcf, n_vcf, ckpt_path, {"input": "a.vcf"}, 0)
+            for rec_pos in (10, 20, 30, 40):
+                ckpt_wrt.write(vcf_head.new_record(contig="chr1", start=rec_pos, stop=rec_pos + 1, alleles=("C", "T")))
+                ckpt_wrt.done(2)
+            n_vcf.close()
+            self.assertEqual(ckf.ckpt_load(ckpt_path), {"input": "a.vcf", "marks": [[0, 0, 0], [2, 0, 1], [4, 0, 2],
+                                                                                   [6, 0, 3], [8, 0, 4]]})
+            part_path = ckf.out_part(out_path)
+            self.assertFalse(os.path.exists(out_path))
+            ckpt_marks = ckf.part_mark(part_path, [[0, 0, 0], [3, 1, 2], [9, 2, 5]])
+            self.assertEqual(ckpt_marks, [[0, 0, 0], [3, 1, 2]])
+            rec_out = WriteCheck()
+            ckf.out_copy(part_path, rec_out, ckpt_marks[-1][2])
+            self.assertEqual([record.pos for record in rec_out.records], [11, 21])
+            ckpt_wrt.close()
+            self.assertFalse(os.path.exists(ckpt_path))
+            # A compressed output killed before its first BGZF block, or within its header, is resumed from the start
+            gz_path = os.path.join(tmp_dir, "fusac.vcf.gz")
+            n_vcf = otf.out_open(gz_path, vcf_head)
+            n_vcf.write(vcf_head.new_record(contig="chr1", start=10, stop=11, alleles=("C", "T")))
+            n_vcf.close()
+            with open(gz_path, "rb") as gz_file:
+                gz_data = gz_file.read()
+            for part_len in (0, 20):
+                with open(gz_path + ckf.PART_EXT, "wb") as part_file:
+                    part_file.write(gz_data[:part_len])
+                self.assertEqual(ckf.part_mark(gz_path + ckf.PART_EXT, [[0, 0, 0], [2, 0, 1]]), [[0, 0, 0]])
+                rec_out = WriteCheck()
+                ckf.out_copy(gz_path + ckf.PART_EXT, rec_out, 0)
+                self.assertEqual(rec_out.records, [])
+
+    def test_shard_maker(self):
+        # Tests that the shard_maker function splits contigs by size as well as by mapped reads
+        vcf_file = ShardCheck({"chr1": 1000, "chr2": 100, "chrX": None}, ["chr1", "chr2", "chrX"])
+        bam_file = ShardCheck({"chr1": 1000, "chr2": 100}, [], {"chr1": 900, "chr2": 100})
+        self.assertEqual(plf.shard_maker(vcf_file, bam_file, 400, 1),
+                         [("chr1", 0, 334), ("chr1", 334, 668), ("chr1", 668, 1000), ("chr2", 0, 100),
+                          ("chrX", 0, None)])
+        self.assertEqual(plf.shard_maker(vcf_file, bam_file, 1000, 10),
+                         [("chr1", 0, 112), ("chr1", 112, 224), ("chr1", 224, 336), ("chr1", 336, 448),
+                          ("chr1", 448, 560), ("chr1", 560, 672), ("chr1", 672, 784), ("chr1", 784, 896),
+                          ("chr1", 896, 1000), ("chr2", 0, 100), ("chrX", 0, None)])
+        self.assertEqual(plf.shard_maker(vcf_file, bam_file, 400, 1, rgf.RegionIndex([("chr1", 700, 710)])),
+                         [("chr1", 668, 1000)])
+        # The shards follow the contig order of the VCF-file, rather than that of the VCF-header or VCF-index
+        vcf_file.file_order = ["chrX", "chr1"]
+        self.assertEqual(plf.contig_order(vcf_file), ["chrX", "chr1"])
+        self.assertEqual(plf.shard_maker(vcf_file, bam_file, 1000, 1), [("chrX", 0, None), ("chr1", 0, 1000)])
+
+    def test_region_index(self):
+        # Tests that the BED regions are merged into the RegionIndex, and that solely the records starting within the
+        # regions are fetched from the indexed VCF-file, in the order of the VCF-file rather than the VCF-header
+        vcf_head = pysam.VariantHeader()
+        for contig in ("chr1", "chr2"):
+            vcf_head.contigs.add(contig, length=1000)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bed_path = os.path.join(tmp_dir, "regions.bed")
+            with open(bed_path, "w") as bed_file:
+                bed_file.write("track name=panel\nchr2\t0\t50\nchr1\t100\t200\nchr1\t150\t300\nchr1\t300\t310\n"
+                               "chr1\t500\t600\n")
+            reg_idx = rgf.bed_read(bed_path)
+            self.assertEqual((reg_idx.starts, reg_idx.ends), ({"chr1": [100, 500], "chr2": [0]},
+                                                              {"chr1": [310, 600], "chr2": [50]}))
+            self.assertEqual((len(reg_idx), reg_idx.bases()), (3, 360))
+            self.assertEqual([reg_idx.rec_in("chr1", rec_start) for rec_start in (99, 100, 309, 310, 599)],
+                             [False, True, True, False, True])
+            self.assertFalse(reg_idx.rec_in("chrX", 10))
+            self.assertEqual(reg_idx.overlaps("chr1", 200, 550), [(200, 310), (500, 550)])
+            self.assertEqual(reg_idx.overlaps("chr1", 600, None), [])
+            # The CSI-index of a BCF-file lists the contigs in the order of the VCF-header
+            for vcf_nm, vcf_mode in (("test.vcf.gz", "wz"), ("test.bcf", "wb")):
+                vcf_path = os.path.join(tmp_dir, vcf_nm)
+                with pysam.VariantFile(vcf_path, vcf_mode, header=vcf_head) as vcf_file:
+                    for contig, rec_start in (("chr2", 10), ("chr2", 60), ("chr1", 50), ("chr1", 99), ("chr1", 120),
+                                              ("chr1", 305), ("chr1", 550)):
+                        vcf_file.write(vcf_head.new_record(contig=contig, start=rec_start, stop=rec_start + 2,
+                                                           alleles=("CA", "C")))
+                pysam.tabix_index(vcf_path, preset="vcf", force=True, csi=vcf_nm.endswith(".bcf"))
+                with pysam.VariantFile(vcf_path) as vcf_file:
+                    self.assertEqual([(record.chrom, record.start)
+                                      for record in rgf.region_records(vcf_file, reg_idx)],
+                                     [("chr2", 10), ("chr1", 120), ("chr1", 305), ("chr1", 550)])
+                with pysam.VariantFile(vcf_path) as vcf_file:
+                    self.assertEqual(len(list(rgf.region_filter(vcf_file, reg_idx))), 4)
+
+    def test_pos_sweep(self):
+        # Tests that the pos_sweep function hands every position the reads a fetch would, parsing each read once
+        read_lst = [SimpleNamespace(reference_start=0, reference_end=10, query_name="a"),
+                    SimpleNamespace(reference_start=2, reference_end=5, query_name="b"),
+                    SimpleNamespace(reference_start=6, reference_end=None, query_name="c"),
+                    SimpleNamespace(reference_start=8, reference_end=20, query_name="d"),
+                    SimpleNamespace(reference_start=900, reference_end=950, query_name="e")]
+        bam_file = SweepCheck(read_lst)
+        parsed = []
+
+        def umi_fun(read):
+            parsed.append(read.query_name)
+            return read.query_name.upper()
+        sweep_res = [(pos, [read.query_name for read in reads], umi_lst) for pos, reads, umi_lst in
+                     swf.pos_sweep(bam_file, "chr1", [8, 3, 4, 6, 3, 910], umi_fun)]
+        self.assertEqual(sweep_res, [(3, ["a", "b"], ["A", "B"]), (4, ["a", "b"], ["A", "B"]),
+                                     (6, ["a", "c"], ["A", "C"]), (8, ["a", "d"], ["A", "D"]), (910, ["e"], ["E"])])
+        self.assertEqual(parsed, ["a", "b", "c", "d", "e"])
+        self.assertEqual(bam_file.fetches, 2)
+
+    def test_var_extract_fam_reset(self):
+        # Tests that a single-strand UMI does not inherit the results of a previously classified UMI, and vice versa
+        f1s = ReadCheck(True, False, False, "ACCGATCGAATCGATCGATCGATCGATCGATCG", "PairedSingRead_GGGAAA+TTTCCC")
+        r2s = ReadCheck(False, True, True, "ACCGATCGAATCGATCGATCGATCGATCGATCG", "PairedSingRead_GGGAAA+TTTCCC")
+        for bam_lst in (self.ffpe_lst + [f1s, r2s], [f1s, r2s] + self.ffpe_lst):
+            mate_res = buf.var_extract(bam_lst, self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
+                                       self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha).fam_dict(0)
+            self.assertDictEqual(mate_res[self.umi_key], self.f_ffpe_d[0][self.umi_key])
+            self.assertDictEqual(mate_res["GGGAAA_TTTCCC"], self.str1_ffpe_r_d[0][self.umi_key])
+
+    def test_fam_table_count(self):
+        # Tests that mol_count and sup_count count the classified and the single-strand UMIs of the family table
+        f1s = ReadCheck(True, False, False, "ACCGATCGAATCGATCGATCGATCGATCGATCG", "PairedSingRead_GGGAAA+TTTCCC")
+        r2s = ReadCheck(False, True, True, "ACCGATCGAATCGATCGATCGATCGATCGATCG", "PairedSingRead_GGGAAA+TTTCCC")
+        fam_tbl = buf.var_extract(self.ffpe_lst + [f1s, r2s], self.rec_pos, self.var_nuc, self.ref_nuc,
+                                  self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha)
+        fam_cnt = cf.fam_count(fam_tbl)
+        self.assertEqual(len(fam_tbl), 2)
+        self.assertEqual(cf.mol_count(fam_cnt, 0), [0, 0, 1, 0, 0])
+        self.assertEqual(cf.mol_count(fam_cnt, 1), [0, 0, 0, 0, 0])
+        self.assertEqual(buf.sup_count(fam_cnt, self.var_nuc, self.ref_nuc, 0),
+                         (0, 0, 1, 0, 0, 1, 0, 0, 1, 0, 0, 1, 0))
+        self.assertEqual(buf.sup_count(fam_cnt, self.var_nuc, self.ref_nuc, 1), (0,) * 13)
+        # Nucleotides without a code are never found in the table
+        self.assertEqual(buf.sup_count(fam_cnt, "X", self.ref_nuc, 0), (0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 1, 0))
+        self.assertEqual(cf.mol_count(cf.fam_count(buf.var_extract([], self.rec_pos, self.var_nuc, self.ref_nuc,
+                                                                   self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                                                   self.qrn_spl_cha, self.umi_spl_cha)), 0),
+                         [0, 0, 0, 0, 0])
+
+    def test_fam_table_iupac(self):
+        # Tests that a consensus base outside the nucleotide codes, such as an IUPAC code of a singleton read, is coded
+        # as N rather than leaving the columns of the family table shorter than its UMIs
+        f1s = ReadCheck(True, False, False, "ACCGATCGAATCGATCGATCGATCGATCGATCG", "PairedSingRead_GGGAAA+TTTCCC")
+        f1s.mate_is_unmapped = True
+        nuc_lst = [nf.nuc_check(read, self.rec_pos) for read in self.ffpe_lst] + ["R"]
+        fam_tbl = buf.var_extract(self.ffpe_lst + [f1s], self.rec_pos, self.var_nuc, self.ref_nuc, self.ffpe_n_1,
+                                  self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha,
+                                  nuc_lst=nuc_lst)
+        self.assertEqual(len(fam_tbl), 2)
+        self.assertEqual([len(col) for cols in (fam_tbl.pos_nuc, fam_tbl.neg_nuc, fam_tbl.cat) for col in cols],
+                         [2] * 6)
+        self.assertEqual(fam_tbl.pos_nuc[1][1], nf.NUC_N)
+        self.assertEqual(cf.mol_count(cf.fam_count(fam_tbl), 0), [0, 0, 1, 0, 0])
+
+    def test_umi_clust(self):
+        # Tests that a UMI-family split off by a UMI sequencing error is merged back by either clustering method, while
+        # a more abundant family at distance 1 is solely merged by the hamming method
+        f1e = ReadCheck(True, False, False, self.ffpe_lst[0].query_sequence, "PairedErrRead_AAATTA+CCCGGG")
+        r2e = ReadCheck(False, True, True, self.ffpe_lst[3].query_sequence, "PairedErrRead_AAATTA+CCCGGG")
+        for method in clf.CLUST_LST:
+            clu_fun = functools.partial(clf.umi_clust, max_dist=1, method=method)
+            fam_tbl = buf.var_extract(self.ffpe_lst + [f1e, r2e], self.rec_pos, self.var_nuc, self.ref_nuc,
+                                      self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha,
+                                      self.umi_spl_cha, clu_fun=clu_fun)
+            self.assertEqual(list(fam_tbl.fam_dict(0)), [self.umi_key])
+            self.assertEqual(cf.mol_count(cf.fam_count(fam_tbl), 0), [0, 0, 1, 0, 0])
+        self.assertEqual(len(buf.var_extract(self.ffpe_lst + [f1e, r2e], self.rec_pos, self.var_nuc, self.ref_nuc,
+                                             self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha,
+                                             self.umi_spl_cha)), 2)
+        self.assertEqual(clf.umi_code("AAAA_CC"), 0o1111 << clf.UMI_BITS | 0o22)
+        self.assertNotEqual(clf.umi_code("A_C"), clf.umi_code("AA_C"))
+        for umi_id in ("AAAX_CC", "AAAA_", "AAAA_CC_GG", "A" * (clf.UMI_MAX_LEN + 1) + "_CC"):
+            self.assertIsNone(clf.umi_code(umi_id))
+        umi_a = "AAAA_CC"
+        umi_b = "AAAT_CC"
+        umi_c = "AATT_CC"
+        umi_dict = {umi_a: {"Pos_Str": {"a1": [], "a2": []}, "Neg_Str": {"a3": []}},
+                    umi_b: {"Pos_Str": {"b1": [], "b2": []}, "Neg_Str": {"b3": []}},
+                    umi_c: {"Pos_Str": {"c1": []}, "Neg_Str": {}},
+                    "AAAX_CC": {"Pos_Str": {"x1": []}, "Neg_Str": {}}}
+        self.assertEqual(clf.umi_dist(clf.umi_code(umi_a), clf.umi_code(umi_c)), 2)
+        self.assertEqual(clf.umi_dist(clf.umi_code(umi_a), clf.umi_code("TAAA_CG")), 2)
+        dir_res = clf.umi_clust({umi_id: {strand: dict(str_dict) for strand, str_dict in umi_fam.items()}
+                                 for umi_id, umi_fam in umi_dict.items()}, 1, "directional")
+        self.assertEqual(list(dir_res), [umi_a, umi_b, "AAAX_CC"])
+        self.assertEqual(sorted(dir_res[umi_b]["Pos_Str"]), ["b1", "b2", "c1"])
+        ham_res = clf.umi_clust(umi_dict, 1, "hamming")
+        self.assertEqual(list(ham_res), [umi_a, "AAAX_CC"])
+        self.assertEqual(sorted(ham_res[umi_a]["Pos_Str"]), ["a1", "a2", "b1", "b2", "c1"])
+
+    def test_sweep_backend(self):
+        # Tests that the fetch and pileup backends generate identical UMI and SUMI fields on a synthetic BAM-file
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bam_path = os.path.join(tmp_dir, "test.bam")
+            bf.bam_maker(bam_path, 300, 2, 150, "C", "T", read_len=60)
+            rec_tpls = [("chr1", rec_pos, "C", ("T",)) for rec_pos in (100, 151, 152, 180)]
+            rec_tpls.append(("chr1", 151, "CA", ("T",)))
+            rec_tpls.append(("chr1", 151, "C", ("<DEL>",)))
+            with pysam.AlignmentFile(bam_path, "r") as bam_file:
+                fetch_ann = swf.sweep_annotate(rec_tpls, bam_file, self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                               self.qrn_spl_cha, self.umi_spl_cha, "fetch")
+                plp_ann = swf.sweep_annotate(rec_tpls, bam_file, self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                             self.qrn_spl_cha, self.umi_spl_cha, "pileup")
+                rec_ann = [buf.rec_annotate(rec_tpl, bam_file, self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                            self.qrn_spl_cha, self.umi_spl_cha) for rec_tpl in rec_tpls]
+        self.assertEqual(fetch_ann, rec_ann)
+        self.assertEqual(plp_ann, rec_ann)
+        self.assertTrue(rec_ann[1]["FFPE"])
+        self.assertEqual(rec_ann[4]["UMI"].split(";")[:3], ["0", "0", "0"])
+        self.assertIsNone(rec_ann[5])
+
+    def test_indel_annotate(self):
+        # Tests that a deletion is classified from the molecules carrying it on both strands or the positive strand
+        # only, identically by both backends, and that the discordant molecules are solely FFPE-artefacts in all-mode
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bam_path = os.path.join(tmp_dir, "test.bam")
+            ref_allele = bf.bam_maker(bam_path, 400, 2, 150, "C", "T", read_len=60, del_len=25)
+            rec_tpls = [("chr1", 151, ref_allele, (ref_allele[0],))]
+            with pysam.AlignmentFile(bam_path, "r") as bam_file:
+                rec_ann = buf.rec_annotate(rec_tpls[0], bam_file, self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                           self.qrn_spl_cha, self.umi_spl_cha)
+                plp_ann = swf.sweep_annotate(rec_tpls, bam_file, self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                             self.qrn_spl_cha, self.umi_spl_cha, "pileup")
+                all_ann = buf.rec_annotate(rec_tpls[0], bam_file, "all", self.ext_fun_1, self.spl_fun_1,
+                                           self.qrn_spl_cha, self.umi_spl_cha)
+        self.assertEqual(plp_ann, [rec_ann])
+        umi_sup = [int(sup) for sup in rec_ann["UMI"].split(";")]
+        all_sup = [int(sup) for sup in all_ann["UMI"].split(";")]
+        self.assertGreater(umi_sup[0], 0)
+        self.assertGreater(umi_sup[1], 0)
+        self.assertEqual(umi_sup[2], 0)
+        self.assertGreater(all_sup[2], 0)
+        self.assertEqual(all_sup[1] + all_sup[2], umi_sup[1])
+        self.assertTrue(all_ann["FFPE"])
+
+    def test_multi_allelic(self):
+        # Tests that every alternative allele of a multi-allelic record is given the annotation of the biallelic
+        # record, for SNVs as well as indels, and that multi-base records with symbolic alleles are not classified
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bam_path = os.path.join(tmp_dir, "test.bam")
+            ref_allele = bf.bam_maker(bam_path, 400, 2, 150, "C", "T", read_len=60, del_len=25)
+            rec_tpls = [("chr1", 140, "A", ("T", "G", "C")), ("chr1", 151, ref_allele, (ref_allele[0],
+                                                                                        ref_allele + "A"))]
+            with pysam.AlignmentFile(bam_path, "r") as bam_file:
+                for rec_tpl in rec_tpls:
+                    rec_ann = buf.rec_annotate(rec_tpl, bam_file, "all", self.ext_fun_1, self.spl_fun_1,
+                                               self.qrn_spl_cha, self.umi_spl_cha)
+                    swp_ann = swf.sweep_annotate([rec_tpl], bam_file, "all", self.ext_fun_1, self.spl_fun_1,
+                                                 self.qrn_spl_cha, self.umi_spl_cha, "pileup")
+                    self.assertEqual(swp_ann, [rec_ann])
+                    self.assertEqual(len(rec_ann["UMI"]), len(rec_tpl[3]))
+                    alt_rng = range(len(rec_tpl[3])) if buf.rec_snv(rec_tpl) else range(1)
+                    for alt_ind in alt_rng:
+                        alt_ann = buf.rec_annotate(rec_tpl[:3] + ((rec_tpl[3][alt_ind],),), bam_file, "all",
+                                                   self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha,
+                                                   self.umi_spl_cha)
+                        self.assertEqual(rec_ann["UMI"][alt_ind], alt_ann["UMI"])
+                        self.assertEqual(rec_ann["SUMI"][alt_ind], alt_ann["SUMI"])
+                self.assertIsNone(buf.rec_annotate(("chr1", 151, "CA", ("C", "<INS>")), bam_file, "all",
+                                                   self.ext_fun_1, self.spl_fun_1, self.qrn_spl_cha,
+                                                   self.umi_spl_cha))
+        self.assertFalse(buf.rec_allele(("chr1", 151, "C", None)))
+        self.assertTrue(buf.rec_allele(("chr1", 151, "C", ("T", "G"))))
+
+    def test_read_filter(self):
+        # Tests that the ReadFilter drops reads through their flags, mapping quality and base quality at the position,
+        # counting the drops of every filter, and keeps the reads with a deletion at the position
+        read_lst = []
+        for read_flag, read_mapq, cig_str, read_qual in ((99, 60, "10M", 30), (355, 60, "10M", 30),
+                                                         (2147, 60, "10M", 30), (147, 10, "10M", 30),
+                                                         (83, 60, "10M", 5), (163, 60, "3M2D7M", 5)):
+            read = pysam.AlignedSegment()
+            read.query_name = "FilterRead_AAATTT+CCCGGG"
+            read.query_sequence = "ACGTACGTAC"
+            read.flag = read_flag
+            read.reference_start = 100
+            read.mapping_quality = read_mapq
+            read.cigarstring = cig_str
+            read.query_qualities = pysam.qualitystring_to_array(chr(read_qual + 33) * 10)
+            read_lst.append(read)
+        self.assertIsNone(flf.flt_maker())
+        read_flt = flf.flt_maker(min_mapq=20, exl_flags=0x900, min_bq=20)
+        bam_lst, umi_lst, nuc_lst, drop_cnt = read_flt.apply(104, read_lst, list(range(6)))
+        self.assertEqual(bam_lst, [read_lst[0], read_lst[5]])
+        self.assertEqual(umi_lst, [0, 5])
+        self.assertIsNone(nuc_lst)
+        self.assertEqual(drop_cnt, (2, 1, 1))
+        self.assertEqual(flf.flt_maker(req_flags=0x40).apply(104, read_lst)[3], (2, 0, 0))
+
+    def test_stage_prof(self):
+        # Tests that the stage timers leave the annotation unchanged, time every stage of the sweep in the StageProf of
+        # the thread, merge the stats reported by a pool worker into the JSON metrics file, and are removed again
+        sweep_fun = swf.sweep_annotate
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bam_path = os.path.join(tmp_dir, "test.bam")
+            bf.bam_maker(bam_path, 300, 2, 150, "C", "T", read_len=60)
+            rec_tpls = [("chr1", rec_pos, "C", ("T",)) for rec_pos in (100, 151, 152, 180)]
+            with pysam.AlignmentFile(bam_path, "r") as bam_file:
+                rec_ann = swf.sweep_annotate(rec_tpls, bam_file, self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                             self.qrn_spl_cha, self.umi_spl_cha)
+                prf.prof_install()
+                try:
+                    self.assertIsNot(swf.sweep_annotate, sweep_fun)
+                    prof_ann = swf.sweep_annotate(rec_tpls, bam_file, self.ffpe_n_1, self.ext_fun_1,
+                                                  self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha)
+                    pool_prof = prf.PoolProf({})
+                    pool_prof.stop()
+                    prof_res = prf.prof_dump(os.path.join(tmp_dir, "prof", "fusac_prof.json"), 1.0,
+                                             {"mode": "thread"}, [("ForkPoolWorker-1", {"csv": 0.5}, {"csv": 2})])
+                    with open(os.path.join(tmp_dir, "prof", "fusac_prof.json")) as prof_file:
+                        self.assertEqual(json.load(prof_file), prof_res)
+                finally:
+                    prf.prof_remove()
+        self.assertIs(swf.sweep_annotate, sweep_fun)
+        self.assertEqual(prof_ann, rec_ann)
+        thr_stats = prof_res["workers"][threading.current_thread().name]
+        for stage in ("bam_fetch", "umi_parse", "grouping", "consensus", "classify", "count", "annotate"):
+            self.assertGreater(thr_stats[stage]["calls"], 0)
+        self.assertEqual(thr_stats["annotate"]["calls"], 1 + len(rec_tpls))
+        self.assertEqual(pool_prof.prof_dict[threading.current_thread().name][2]["annotate"], 1 + len(rec_tpls))
+        self.assertEqual(prof_res["workers"]["ForkPoolWorker-1"], {"csv": {"time": 0.5, "calls": 2}})
+        self.assertEqual(prof_res["stages"]["csv"], {"time": 0.5, "calls": 2})
+
+    def test_syn_maker(self):
+        # Tests that syn_maker writes the same indexed BAM- and VCF-file for the same seed, and that the FFPE-artefacts
+        # of its C:G loci are classified as such, without any true variant when no molecule carries the variant
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            syn_res = sf.syn_maker(os.path.join(tmp_dir, "syn"), "panel", scale=0.05, var_frac=0.0, ffpe_rate=0.5,
+                                   seq_err=0.0)
+            self.assertEqual(sf.syn_maker(os.path.join(tmp_dir, "syn_2"), "panel", scale=0.05, var_frac=0.0,
+                                          ffpe_rate=0.5, seq_err=0.0)["molecules"], syn_res["molecules"])
+            self.assertTrue(os.path.exists(syn_res["bam"] + ".bai"))
+            self.assertTrue(os.path.exists(syn_res["vcf"] + ".tbi"))
+            with pysam.VariantFile(syn_res["vcf"], "r") as vcf_file:
+                rec_tpls = [buf.rec_tuple(record) for record in vcf_file]
+            self.assertEqual(len(rec_tpls), syn_res["n_recs"])
+            with pysam.AlignmentFile(syn_res["bam"], "r") as bam_file:
+                self.assertEqual(bam_file.mapped, syn_res["n_reads"])
+                rec_ann = swf.sweep_annotate(rec_tpls, bam_file, self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                             self.qrn_spl_cha, self.umi_spl_cha)
+        for rec_tpl, ann in zip(rec_tpls, rec_ann):
+            umi_sup = ann["UMI_Sup"][0]
+            self.assertEqual(umi_sup[nf.CAT_VAR], 0)
+            self.assertEqual(umi_sup[nf.CAT_FFPE] > 0, rec_tpl[2] in sf.FFPE_ALTS)
+            self.assertEqual(ann["FFPE"], rec_tpl[2] in sf.FFPE_ALTS)
+
+    def test_bench_compare(self):
+        # Tests that bench_compare reports the benchmarks slower than max_slow as regressions, skipping benchmarks
+        # that were not run on the same synthetic data
+        old_res = {"scale": 1.0, "seed": 1, "profiles": {"panel": {"benches": {
+            "nuc_check": {"time": 0.2, "calls": 100}, "pos_hits": {"time": 0.5, "calls": 40},
+            "var_extract": {"time": 1.0, "calls": 10}}}}}
+        new_res = {"scale": 1.0, "seed": 1, "profiles": {"panel": {"benches": {
+            "nuc_check": {"time": 0.3, "calls": 100}, "pos_hits": {"time": 0.5, "calls": 40},
+            "var_extract": {"time": 1.0, "calls": 12}}}, "exome": {"benches": {}}}}
+        self.assertEqual(bf.bench_compare(new_res, old_res),
+                         [("panel", "nuc_check", 0.2, 0.3, 1.5, True), ("panel", "pos_hits", 0.5, 0.5, 1.0, False)])
+        self.assertEqual(bf.bench_compare(dict(new_res, scale=0.5), old_res), [])
+
+    def test_read_cache(self):
+        # Tests that annotating records one at a time through a shared ReadCache gives the uncached annotation with
+        # either backend, reusing the reads of earlier records, and that evict drops the reads ending before a position
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bam_path = os.path.join(tmp_dir, "test.bam")
+            bf.bam_maker(bam_path, 300, 2, 150, "C", "T", read_len=60)
+            rec_tpls = [("chr1", rec_pos, "C", ("T",)) for rec_pos in (100, 151, 152, 180)]
+            with pysam.AlignmentFile(bam_path, "r") as bam_file:
+                rec_ann = [buf.rec_annotate(rec_tpl, bam_file, self.ffpe_n_1, self.ext_fun_1, self.spl_fun_1,
+                                            self.qrn_spl_cha, self.umi_spl_cha) for rec_tpl in rec_tpls]
+                for backend in ("fetch", "pileup"):
+                    read_cache = caf.ReadCache(1000)
+                    cache_ann = [swf.sweep_annotate([rec_tpl], bam_file, self.ffpe_n_1, self.ext_fun_1,
+                                                    self.spl_fun_1, self.qrn_spl_cha, self.umi_spl_cha, backend,
+                                                    read_cache=read_cache)[0] for rec_tpl in rec_tpls]
+                    self.assertEqual(cache_ann, rec_ann)
+                    self.assertGreater(read_cache.hits, 0)
+                    self.assertEqual(read_cache.misses, len({(read.query_name, read.flag) for rec_tpl in rec_tpls
+                                                             for read in bam_file.fetch("chr1", rec_tpl[1] - 1,
+                                                                                        rec_tpl[1])}))
+                read_cache.evict(0, 179)
+                self.assertEqual(len(read_cache), len(list(bam_file.fetch("chr1", 179, 180))))
+                read_cache.evict(1, 0)
+                self.assertEqual(len(read_cache), 0)
+                small_cache = caf.ReadCache(10)
+                for read in bam_file.fetch("chr1", 150, 151):
+                    small_cache.get(read, lambda read: None)
+                self.assertEqual(len(small_cache), 10)
+
+    def test_ordered_writer(self):
+        # Tests that the OrderedWriter writes in input order, skips None results, and holds back results too far ahead
+        n_vcf = WriteCheck()
+        rec_wrt = fus.OrderedWriter(n_vcf, 2)
+        rec_wrt.put(1, None)
+        self.assertEqual(n_vcf.records, [])
+        put_thr = threading.Thread(target=rec_wrt.put, args=(3, "rec3"))
+        put_thr.start()
+        put_thr.join(0.05)
+        self.assertTrue(put_thr.is_alive())
+        rec_wrt.put(0, "rec0")
+        rec_wrt.put(2, "rec2")
+        put_thr.join(5)
+        self.assertFalse(put_thr.is_alive())
+        self.assertEqual(n_vcf.records, ["rec0", "rec2", "rec3"])
+
+    def test_ordered_writer_unbounded(self):
+        # Tests that an OrderedWriter with a max_pend of 0 holds back any no. results rather than waiting for them
+        n_vcf = WriteCheck()
+        rec_wrt = fus.OrderedWriter(n_vcf, 0)
+        put_thr = threading.Thread(target=lambda: [rec_wrt.put(rec_ord, "rec" + str(rec_ord))
+                                                   for rec_ord in (3, 2, 1, 0)], daemon=True)
+        put_thr.start()
+        put_thr.join(5)
+        self.assertFalse(put_thr.is_alive())
+        self.assertEqual(n_vcf.records, ["rec0", "rec1", "rec2", "rec3"])
+
+    def test_ordered_writer_fail(self):
+        # Tests that a failing record stops the OrderedWriter, releasing waiting and held back results without writing
+        n_vcf = WriteCheck()
+        fly_sem = threading.BoundedSemaphore(4)
+        for _ in range(4):
+            fly_sem.acquire()
+        rec_wrt = fus.OrderedWriter(n_vcf, 2, fly_sem)
+        rec_wrt.put(1, "rec1")
+        put_thr = threading.Thread(target=rec_wrt.put, args=(3, "rec3"), daemon=True)
+        put_thr.start()
+        put_thr.join(0.05)
+        self.assertTrue(put_thr.is_alive())
+        rec_wrt.fail(0, ValueError("rec0"))
+        put_thr.join(5)
+        self.assertFalse(put_thr.is_alive())
+        rec_wrt.put(2, "rec2")
+        self.assertTrue(rec_wrt.stop_evt.is_set())
+        self.assertEqual(rec_wrt.error[0], 0)
+        self.assertEqual(n_vcf.records, [])
+        self.assertTrue(all(fly_sem.acquire(blocking=False) for _ in range(4)))
+
+    def test_producer_thread(self):
+        # Tests that the ProducerThread numbers the records, respects the in-flight limit and ends with sentinels
+        thr_que = fus.queue.Queue(1)
+        fly_sem = threading.BoundedSemaphore(2)
+        p_que = fus.ProducerThread(["rec0", "rec1", "rec2"], thr_que, 2, fly_sem)
+        p_que.start()
+        self.assertEqual([thr_que.get(timeout=5), thr_que.get(timeout=5)], [(0, "rec0"), (1, "rec1")])
+        p_que.join(0.05)
+        self.assertTrue(p_que.is_alive())
+        self.assertTrue(thr_que.empty())
+        fly_sem.release()
+        self.assertEqual([thr_que.get(timeout=5) for _ in range(3)], [(2, "rec2"), None, None])
+        p_que.join(5)
+        self.assertFalse(p_que.is_alive())
+
+    def test_producer_thread_stop(self):
+        # Tests that the ProducerThread stops reading once stop_evt is set, still ending with sentinels
+        thr_que = fus.queue.Queue()
+        stop_evt = threading.Event()
+        stop_evt.set()
+        p_que = fus.ProducerThread(["rec0", "rec1"], thr_que, 2, stop_evt=stop_evt)
+        p_que.run()
+        self.assertEqual([thr_que.get(timeout=5) for _ in range(2)], [None, None])
+        self.assertTrue(thr_que.empty())
 
 
 if __name__ == '__main__':